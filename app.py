@@ -3,8 +3,11 @@
 # pylama:ignore=E501,C901
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
+import gzip
 import json
+import mimetypes
 import os
 import shutil
 import time
@@ -13,12 +16,23 @@ from datetime import datetime
 import google.generativeai as genai
 from anthropic import Anthropic
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import (Flask, Response, jsonify, render_template, request,
+                   send_file, send_from_directory)
 from flask_socketio import SocketIO
 from openai import OpenAI
 
+from artifacts_preview import ArtifactPreviewManager
+from context_packer import ContextPacker, candidates_from_files
+import file_ranges
+from file_reader import get_file_reader
+from folder_sizes import FolderSizeCache
+from markdown_render import MarkdownStream, get_markdown_renderer
 from terminal_manager import TerminalManager
+from token_counter import get_token_counter
+import workspace_archive
+from workspace_fork import TreeCloner
 from workspace_manager import WorkspaceManager
+from workspace_trash import TrashReaper
 
 
 # Model configurations
@@ -33,6 +47,7 @@ AVAILABLE_MODELS = {
             "chat": "deepseek-reasoner"
         },
         "max_tokens": 100000,
+        "tokenizer": "deepseek",
     },
     "deepseek": {
         "name": "DeepSeek V3",
@@ -44,6 +59,7 @@ AVAILABLE_MODELS = {
             "chat": "deepseek-chat"
         },
         "max_tokens": 100000,
+        "tokenizer": "deepseek",
     },
     "deepseek-openrouter": {
         "name": "DeepSeek V3 (OpenRouter)",
@@ -55,6 +71,7 @@ AVAILABLE_MODELS = {
             "chat": "deepseek/deepseek-chat"
         },
         "max_tokens": 100000,
+        "tokenizer": "deepseek",
     },
     "codestral": {
         "name": "Codestral",
@@ -66,6 +83,7 @@ AVAILABLE_MODELS = {
             "chat": "codestral-latest"
         },
         "max_tokens": 100000,
+        "tokenizer": "mistral",
     },
     "gemini": {
         "name": "Gemini 2.0 Flash Experimental",
@@ -76,6 +94,7 @@ AVAILABLE_MODELS = {
             "chat": "gemini-2.0-flash-exp"
         },
         "max_tokens": 30000,
+        "tokenizer": "gemini",
     },
     "grok": {
         "name": "Grok 2",
@@ -87,6 +106,7 @@ AVAILABLE_MODELS = {
             "chat": "grok-2-latest"
         },
         "max_tokens": 100000,
+        "tokenizer": "cl100k",
     },
     "claude": {
         "name": "Claude 3.5 Sonnet",
@@ -97,6 +117,7 @@ AVAILABLE_MODELS = {
             "chat": "claude-3-5-sonnet-20241022",
         },
         "max_tokens": 100000,
+        "tokenizer": "claude",
     },
     "gpt-4-turbo": {
         "name": "GPT-4 Turbo",
@@ -107,6 +128,7 @@ AVAILABLE_MODELS = {
             "chat": "gpt-4-turbo"
         },
         "max_tokens": 100000,
+        "tokenizer": "cl100k",
     },
     "gpt-4o-mini": {
         "name": "GPT-4o-mini",
@@ -117,6 +139,7 @@ AVAILABLE_MODELS = {
             "chat": "gpt-4o-mini"
         },
         "max_tokens": 100000,
+        "tokenizer": "o200k",
     },
     "gpt-4o": {
         "name": "GPT-4o",
@@ -127,6 +150,7 @@ AVAILABLE_MODELS = {
             "chat": "gpt-4o"
         },
         "max_tokens": 100000,
+        "tokenizer": "o200k",
     },
     "o1-mini": {
         "name": "o1-mini",
@@ -137,6 +161,7 @@ AVAILABLE_MODELS = {
             "chat": "o1-mini"
         },
         "max_tokens": 100000,
+        "tokenizer": "o200k",
     },
     "o1": {
         "name": "o1-preview",
@@ -147,6 +172,7 @@ AVAILABLE_MODELS = {
             "chat": "o1-preview"
         },
         "max_tokens": 100000,
+        "tokenizer": "o200k",
     },
 }
 
@@ -217,6 +243,27 @@ IMPORTANT:
 
 Respond with a single, valid JSON object."""
 
+# Instruction appended to every code generation prompt
+JSON_RESPONSE_INSTRUCTION = """IMPORTANT: Your response MUST be a valid JSON object following this exact structure:
+{
+    "explanation": "Brief explanation of what you will do",
+    "operations": [
+        {
+            "type": "edit_file",
+            "path": "relative/path",
+            "changes": [
+                {
+                    "old": "text to replace",
+                    "new": "replacement text"
+                }
+            ]
+        }
+    ]
+}"""
+
+# Tokens kept free in every request for the response and message framing
+CONTEXT_RESERVE_TOKENS = 1000
+
 # Initialize clients for each model
 load_dotenv()
 
@@ -246,10 +293,61 @@ os.makedirs(WORKSPACE_ROOT, exist_ok=True)
 # Initialize workspace manager
 workspace_manager = WorkspaceManager(WORKSPACE_ROOT)
 
+
+def get_model_token_counter(model_id):
+    """Get the token counter for a model's tokenizer family"""
+    return get_token_counter(AVAILABLE_MODELS.get(model_id, {}).get("tokenizer"))
+
+
+def get_context_packer(model_id, query=None):
+    """Build a context packer that counts and truncates for the given model"""
+    counter = get_model_token_counter(model_id)
+    return ContextPacker(
+        counter.count,
+        lambda content, max_tokens: workspace_manager.
+        _truncate_content_for_context(content,
+                                      max_tokens=max_tokens,
+                                      token_counter=counter,
+                                      query=query))
+
 # Store terminal managers for each client
 terminal_managers = {}
 
 
+def report_trash_progress(name, removed, expected, done):
+    """Broadcast deletion progress of a trashed workspace"""
+    socketio.emit(
+        "workspace_delete_progress",
+        {
+            "workspace_id": name.rsplit(".", 1)[0],
+            "removed": removed,
+            "expected": expected,
+            "done": done,
+        },
+    )
+
+
+# Deleted workspaces are renamed into the trash and removed in the background
+trash_reaper = TrashReaper(os.path.join(WORKSPACE_ROOT, ".trash"),
+                           on_progress=report_trash_progress)
+trash_reaper.start()
+
+# Shared with the workspace manager, so both reuse its encoding cache
+file_reader = get_file_reader()
+
+# Thumbnails are hashed and decoded in OS threads, off the event loop
+artifact_previews = ArtifactPreviewManager(WORKSPACE_ROOT,
+                                           run_blocking=tpool.execute)
+
+# Chat responses and Markdown previews share one render cache
+markdown_renderer = get_markdown_renderer()
+
+# Sizes for the import browser, computed in the background and pushed to
+# the requesting client as "folder_size" events
+folder_sizes = FolderSizeCache(skip_names=WorkspaceManager.SKIP_FOLDERS,
+                               pause=lambda: socketio.sleep(0))
+
+
 @app.route("/")
 def index():
     return render_template("base.html")
@@ -289,6 +387,39 @@ def handle_terminal_resize(data):
                                                        data["rows"])
 
 
+def pack_files_content(files_content, model_id, query, *reserved_texts):
+    """Fit files_content into the model's context budget.
+
+    The budget is the model's max_tokens minus the query, whatever else
+    goes into the request (reserved_texts) and a fixed reserve. Files are
+    chosen and condensed by relevance rather than given equal shares, and
+    condensing keeps the regions matching the query.
+    """
+    if not files_content:
+        return files_content
+
+    counter = get_model_token_counter(model_id)
+    max_tokens = AVAILABLE_MODELS[model_id].get("max_tokens", 100000)
+    reserved = sum(
+        counter.count(text) for text in (query, ) + reserved_texts if text)
+    budget = max_tokens - reserved - CONTEXT_RESERVE_TOKENS
+    if budget <= 0:
+        raise Exception("Message too long even after truncation")
+
+    packed = get_context_packer(model_id, query).pack(
+        candidates_from_files(files_content), budget)
+    dropped = len(files_content) - len(packed)
+    condensed = sum(1 for c in packed if c.kept_fraction < 1)
+    if dropped or condensed:
+        print(f"Packed context into {budget} tokens: {len(packed)} files "
+              f"({condensed} condensed, {dropped} dropped)")
+    over_budget = [c.key for c in packed if c.over_budget]
+    if over_budget:
+        print(f"Warning: attachments exceed the context budget of {budget} "
+              f"tokens even condensed: {', '.join(over_budget)}")
+    return {c.key: c.content for c in packed}
+
+
 def create_workspace():
     """Create a new workspace directory"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -302,43 +433,41 @@ def get_workspace_history():
     """Get list of all workspaces with their history"""
     workspaces = []
 
-    # List all directories in WORKSPACE_ROOT
-    for item in os.listdir(WORKSPACE_ROOT):
-        workspace_path = os.path.join(WORKSPACE_ROOT, item)
-        if os.path.isdir(workspace_path):
-            # Get directory creation time
-            created_at = datetime.fromtimestamp(
-                os.path.getctime(workspace_path))
-
-            # Count files in workspace using workspace_manager's logic
-            total_files = 0
-            for root, dirs, files in os.walk(workspace_path):
-                # Skip .git and other ignored directories
-                dirs[:] = [
-                    d for d in dirs if not d.startswith(".")
-                    and d not in workspace_manager.SKIP_FOLDERS
-                ]
-
-                # Filter files based on gitignore and skip patterns
-                for file in files:
-                    if not file.startswith(".") and not file.endswith(
-                            tuple(workspace_manager.SKIP_EXTENSIONS)):
-                        rel_path = os.path.relpath(os.path.join(root, file),
-                                                   workspace_path)
-                        if not workspace_manager._should_ignore(rel_path):
-                            total_files += 1
-
-            # Check if this is an imported workspace
+    # List all directories in WORKSPACE_ROOT; dot directories hold metadata
+    workspace_paths = [
+        os.path.join(WORKSPACE_ROOT, item)
+        for item in os.listdir(WORKSPACE_ROOT)
+        if not item.startswith(".")
+        and os.path.isdir(os.path.join(WORKSPACE_ROOT, item))
+    ]
+
+    # Stats come from per-workspace manifests, read in parallel; missing
+    # ones are computed in the background and reported as pending (None)
+    manifests = workspace_manager.get_workspace_manifests(workspace_paths)
+
+    for workspace_path in workspace_paths:
+        manifest = manifests.get(os.path.abspath(workspace_path))
+
+        # Get directory creation time
+        created_at = datetime.fromtimestamp(os.path.getctime(workspace_path))
+
+        if manifest:
+            is_imported = manifest.is_imported
+        else:
             is_imported = os.path.exists(
                 os.path.join(workspace_path, ".imported"))
 
-            workspaces.append({
-                "id": item,
-                "path": workspace_path,
-                "created_at": created_at.isoformat(),
-                "file_count": total_files,
-                "is_imported": is_imported,
-            })
+        workspaces.append({
+            "id": os.path.basename(workspace_path),
+            "path": workspace_path,
+            "created_at": created_at.isoformat(),
+            "file_count": manifest.file_count if manifest else None,
+            "total_size": manifest.total_size if manifest else None,
+            "last_activity": (datetime.fromtimestamp(
+                manifest.last_activity).isoformat()
+                              if manifest and manifest.last_activity else None),
+            "is_imported": is_imported,
+        })
 
     # Sort alphabetically by ID, case-insensitive
     return sorted(workspaces, key=lambda x: x["id"].lower())
@@ -347,11 +476,18 @@ def get_workspace_history():
 def delete_workspace(workspace_id):
     """Delete a workspace"""
     try:
+        # Dot names are metadata directories (.trash, .manifests, ...) and
+        # "." is the root itself
+        if (not workspace_id or workspace_id.startswith(".")
+                or "/" in workspace_id or os.sep in workspace_id
+                or (os.altsep and os.altsep in workspace_id)):
+            raise Exception("Invalid workspace path")
+
         workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id)
 
-        # Verify the path is within WORKSPACE_ROOT for safety
-        if not os.path.abspath(workspace_path).startswith(
-                os.path.abspath(WORKSPACE_ROOT)):
+        # Verify the path is directly inside WORKSPACE_ROOT for safety
+        if os.path.dirname(os.path.abspath(workspace_path)) != os.path.abspath(
+                WORKSPACE_ROOT):
             raise Exception("Invalid workspace path")
 
         # Check if it's an imported workspace
@@ -373,21 +509,60 @@ def delete_workspace(workspace_id):
                 # Remove symlink on Unix-like systems
                 os.unlink(workspace_path)
         else:
-            # Delete directory for regular workspaces
+            # Move regular workspaces into the trash; the reaper deletes
+            # them in the background
             try:
                 if os.path.exists(workspace_path):
-                    shutil.rmtree(workspace_path, ignore_errors=False)
-                if os.path.exists(workspace_path):
-                    raise Exception("Failed to delete workspace directory")
+                    # No expected total: the manifest counts only the files
+                    # the scanner sees, not skipped folders or directories
+                    trash_reaper.trash(workspace_path)
             except Exception as e:
                 raise Exception(
                     f"Failed to delete workspace directory: {str(e)}")
 
+        workspace_manager.forget_workspace(workspace_path)
+        workspace_manager.manifests.remove(workspace_id)
         return True
     except Exception as e:
         raise Exception(f"Failed to delete workspace: {str(e)}")
 
 
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+FILE_WINDOW_BYTES = 256 * 1024  # Text served per request for large files
+FILE_WINDOW_LINES = 2000
+
+
+def json_response(payload, status=200, headers=None):
+    """JSON response with compact separators, gzipped if the client accepts it"""
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    if (len(body) >= GZIP_MIN_BYTES
+            and "gzip" in request.headers.get("Accept-Encoding", "")):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(body, status=status, headers=headers)
+
+
+def structure_fields(workspace_dir, data):
+    """Workspace structure for a response, in the format the client asked for.
+
+    Clients sending tree_format "compact" get the columnar payload under
+    "tree", as a delta against their tree_version when it is still known.
+    Others get the nested structure under "structure".
+    """
+    if (data or {}).get("tree_format") == "compact":
+        return {
+            "tree":
+            workspace_manager.get_structure_payload(workspace_dir,
+                                                    data.get("tree_version"))
+        }
+    return {
+        "structure": workspace_manager.get_workspace_structure(workspace_dir)
+    }
+
+
 def get_workspace_structure(workspace_dir):
     structure = []
 
@@ -432,7 +607,7 @@ def get_workspace_structure(workspace_dir):
 def get_file_size(file_path):
     """Get the size of a file in bytes"""
     try:
-        return os.path.getsize(file_path)
+        return workspace_manager.stats.stat(file_path).st_size
     except OSError:
         return 0
 
@@ -454,48 +629,14 @@ def is_large_file(file_path, threshold_mb=5):
 
 def get_file_preview(file_path, max_lines=1000):
     """Get a preview of a large file (first max_lines lines)"""
-    preview_lines = []
     try:
-        # First try UTF-8
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for i, line in enumerate(f):
-                    if i >= max_lines:
-                        preview_lines.append(
-                            "... (file truncated, too large to display completely)"
-                        )
-                        break
-                    preview_lines.append(line.rstrip("\n"))
-        except UnicodeDecodeError:
-            # If UTF-8 fails, try to detect if it's a binary file
-            with open(file_path, "rb") as f:
-                is_binary = False
-                try:
-                    chunk = f.read(1024)
-                    if b"\x00" in chunk:
-                        is_binary = True
-                    # Try to decode as latin-1 which can handle all byte values
-                    text = chunk.decode("latin-1")
-                    if any(ord(c) < 32 and c not in "\r\n\t" for c in text):
-                        is_binary = True
-                except BaseException:
-                    is_binary = True
-
-                if is_binary:
-                    return "[Binary file] - Cannot display content"
-
-                # If not binary, try reading with latin-1 encoding
-                f.seek(0)
-                with open(file_path, "r", encoding="latin-1") as f:
-                    for i, line in enumerate(f):
-                        if i >= max_lines:
-                            preview_lines.append(
-                                "... (file truncated, too large to display completely)"
-                            )
-                            break
-                        preview_lines.append(line.rstrip("\n"))
-
-        return "\n".join(preview_lines)
+        text, truncated = file_reader.read_head(file_path, max_lines)
+        if text is None:
+            return "[Binary file] - Cannot display content"
+        preview = text.rstrip("\n")
+        if truncated:
+            preview += "\n... (file truncated, too large to display completely)"
+        return preview
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
@@ -520,8 +661,8 @@ def get_existing_files(workspace_dir):
                 file_path = os.path.join(root, file)
                 rel_path = os.path.relpath(file_path, workspace_dir)
                 try:
-                    # Get file size
-                    file_size = os.path.getsize(file_path)
+                    # Get file size; is_large_file reuses this stat
+                    file_size = workspace_manager.stats.stat(file_path).st_size
                     if file_size > MAX_FILE_SIZE:
                         print(
                             f"Warning: Skipping large file {rel_path} ({file_size} bytes)"
@@ -536,25 +677,9 @@ def get_existing_files(workspace_dir):
                             continue  # Skip binary files
                         files_content[rel_path] = preview
                     else:
-                        # Try UTF-8 first
-                        try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                content = f.read()
-                        except UnicodeDecodeError:
-                            # Check if binary
-                            with open(file_path, "rb") as f:
-                                chunk = f.read(1024)
-                                if b"\x00" in chunk:
-                                    continue  # Skip binary files
-
-                                # Try latin-1 as fallback
-                                try:
-                                    with open(file_path,
-                                              "r",
-                                              encoding="latin-1") as f:
-                                        content = f.read()
-                                except BaseException:
-                                    continue  # Skip if still can't read
+                        content, _ = file_reader.read_text(file_path)
+                        if content is None:
+                            continue  # Skip binary files
 
                         files_content[rel_path] = content
                 except Exception as e:
@@ -603,13 +728,42 @@ def get_workspace_structure_route():
                 "message": "Invalid workspace directory"
             })
 
-        structure = workspace_manager.get_workspace_structure(workspace_dir)
-        return jsonify({"status": "success", "structure": structure})
+        return json_response({
+            "status": "success",
+            **structure_fields(workspace_dir, data)
+        })
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
 
+@app.route("/workspace/window", methods=["POST"])
+def get_workspace_window():
+    try:
+        data = request.get_json()
+        workspace_dir = data.get("workspace_dir")
+
+        if not workspace_dir or not os.path.exists(workspace_dir):
+            return (
+                jsonify({
+                    "status": "error",
+                    "message": "Invalid workspace directory"
+                }),
+                400,
+            )
+
+        window = workspace_manager.get_tree_window(
+            workspace_dir,
+            expanded=data.get("expanded", []),
+            offset=int(data.get("offset", 0)),
+            limit=int(data.get("limit", 100)),
+        )
+        return json_response({"status": "success", **window})
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route("/workspace/expand", methods=["POST"])
 def expand_directory():
     try:
@@ -618,6 +772,7 @@ def expand_directory():
         dir_path = data.get("dir_path")
         page = int(data.get("page", 1))
         page_size = int(data.get("page_size", 100))
+        cursor = data.get("cursor")
 
         print("\nExpanding directory request:")  # Debug log
         print(f"Workspace: {workspace_dir}")
@@ -650,6 +805,7 @@ def expand_directory():
                 workspace_dir=workspace_dir,
                 page_size=page_size,
                 page=page,
+                cursor=cursor,
             )
             # Debug log
             print(f"Expansion successful: {len(result['items'])} items")
@@ -658,6 +814,7 @@ def expand_directory():
                 "items": result["items"],
                 "total_items": result["total_items"],
                 "has_more": result["has_more"],
+                "next_cursor": result["next_cursor"],
             })
         except ValueError as e:
             print(f"Validation error: {str(e)}")  # Debug log
@@ -781,22 +938,19 @@ def process_prompt():
         # Apply changes if no approval needed
         if not suggestions.get("requires_approval", True):
             results = apply_changes(suggestions, workspace_dir)
-            structure = workspace_manager.get_workspace_structure(
-                workspace_dir)
 
-            return jsonify({
+            return json_response({
                 "status": "success",
                 "workspace_dir": workspace_dir,
-                "structure": structure,
+                **structure_fields(workspace_dir, data),
                 "results": results,
             })
 
         # Return suggestions for approval
-        structure = workspace_manager.get_workspace_structure(workspace_dir)
-        return jsonify({
+        return json_response({
             "status": "success",
             "workspace_dir": workspace_dir,
-            "structure": structure,
+            **structure_fields(workspace_dir, data),
             "suggestions": suggestions,
             "requires_approval": True,
         })
@@ -823,8 +977,36 @@ def delete_workspace_endpoint():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def resolve_workspace_file(workspace_dir, file_path):
+    """Full path of a file inside a workspace, or None if it would escape"""
+    # Validate file path to prevent directory traversal
+    if ".." in file_path or file_path.startswith("/"):
+        return None
+    full_path = os.path.normpath(os.path.join(workspace_dir, file_path))
+    if not os.path.abspath(full_path).startswith(
+            os.path.abspath(workspace_dir)):
+        return None
+    return full_path
+
+
+def optional_int(value):
+    """Parse an optional non-negative integer request parameter"""
+    if value is None or value == "":
+        return None
+    number = int(value)
+    if number < 0:
+        raise ValueError("Negative values are not allowed")
+    return number
+
+
 @app.route("/workspace/file", methods=["POST"])
 def get_file_content():
+    """File content for the editor, revalidated with ETags.
+
+    Small files are returned whole. Large files, or requests giving
+    byte_start or line_start/line_count, get one window of whole lines;
+    next_byte tells the client where the following window starts.
+    """
     try:
         data = request.json
         workspace_dir = data.get("workspace_dir")
@@ -839,31 +1021,30 @@ def get_file_content():
                 400,
             )
 
-        # Validate file path to prevent directory traversal
-        if ".." in file_path or file_path.startswith("/"):
+        full_path = resolve_workspace_file(workspace_dir, file_path)
+        print(f"Workspace: {workspace_dir}")  # Debug log
+        print(f"File path: {file_path}")  # Debug log
+        print(f"Full path: {full_path}")  # Debug log
+
+        if full_path is None:
             return jsonify({
                 "status": "error",
                 "message": "Invalid file path"
             }), 400
 
-        # Get the full path by joining workspace_dir and file_path
-        full_path = os.path.normpath(os.path.join(workspace_dir, file_path))
-
-        print(f"Workspace: {workspace_dir}")  # Debug log
-        print(f"File path: {file_path}")  # Debug log
-        print(f"Full path: {full_path}")  # Debug log
-
-        if not os.path.abspath(full_path).startswith(
-                os.path.abspath(workspace_dir)):
-            return (
-                jsonify({
-                    "status": "error",
-                    "message": "File path not within workspace"
-                }),
-                400,
-            )
+        try:
+            byte_start = optional_int(data.get("byte_start"))
+            line_start = optional_int(data.get("line_start"))
+            line_count = optional_int(data.get("line_count"))
+        except (TypeError, ValueError):
+            return jsonify({
+                "status": "error",
+                "message": "Invalid range parameters"
+            }), 400
 
-        if not os.path.exists(full_path):
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
             print(f"File not found: {full_path}")  # Debug log
             return jsonify({
                 "status": "success",
@@ -872,23 +1053,277 @@ def get_file_content():
                 "truncated": False,
             })
 
-        # Use workspace manager to get file content
-        content = workspace_manager._get_file_content(full_path)
-        file_size = os.path.getsize(full_path)
-        is_large = workspace_manager.is_large_file(full_path)
+        etag = file_ranges.file_etag(st)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if file_ranges.etag_matches(request.headers.get("If-None-Match"),
+                                    etag):
+            return Response(status=304, headers=headers)
+
+        payload = {"status": "success", "file_size": st.st_size}
+        if line_start is not None or line_count is not None:
+            content, next_byte, total_lines = (
+                workspace_manager.read_line_window(
+                    full_path, line_start or 0, line_count
+                    or FILE_WINDOW_LINES))
+            payload.update(line_start=line_start or 0,
+                           total_lines=total_lines)
+        elif (byte_start is not None
+              or st.st_size >= workspace_manager.LARGE_FILE_THRESHOLD):
+            byte_start = min(byte_start or 0, st.st_size)
+            content, next_byte = file_ranges.read_text_window(
+                full_path, byte_start, FILE_WINDOW_BYTES)
+            payload.update(byte_start=byte_start)
+        else:
+            content = workspace_manager._get_file_content(full_path)
+            next_byte = st.st_size
 
-        return jsonify({
-            "status": "success",
-            "content": content,
-            "truncated": is_large,
-            "file_size": file_size,
-        })
+        payload.update(
+            content=content,
+            truncated=next_byte < st.st_size,
+            next_byte=next_byte if next_byte < st.st_size else None,
+        )
+        return json_response(payload, headers=headers)
 
     except Exception as e:
         print(f"Error in get_file_content: {str(e)}")  # Debug log
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route("/workspace/file/raw", methods=["GET"])
+def get_raw_file():
+    """Stream a workspace file's bytes, honoring Range and If-None-Match"""
+    workspace_dir = request.args.get("workspace_dir")
+    file_path = request.args.get("file_path")
+    full_path = (resolve_workspace_file(workspace_dir, file_path)
+                 if workspace_dir and file_path else None)
+    if full_path is None:
+        return jsonify({
+            "status": "error",
+            "message": "Invalid file path"
+        }), 400
+    return stream_file(full_path)
+
+
+def stream_file(full_path):
+    """Response streaming a file with ETag, Range and gzip support"""
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return jsonify({
+            "status": "error",
+            "message": "File not found"
+        }), 404
+
+    etag = file_ranges.file_etag(st)
+    mimetype = (mimetypes.guess_type(full_path)[0]
+                or "application/octet-stream")
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Accept-Ranges": "bytes",
+    }
+    if file_ranges.etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+
+    # A Range with a stale If-Range validator gets the whole, current file
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        range_header = None
+    try:
+        byte_range = file_ranges.parse_range_header(range_header, st.st_size)
+    except ValueError:
+        return Response(status=416,
+                        headers={
+                            **headers, "Content-Range":
+                            f"bytes */{st.st_size}"
+                        })
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return Response(file_ranges.iter_file_range(full_path, start, end),
+                        status=206,
+                        mimetype=mimetype,
+                        headers=headers)
+
+    if (st.st_size >= GZIP_MIN_BYTES and is_compressible(mimetype)
+            and "gzip" in request.headers.get("Accept-Encoding", "")):
+        # The gzipped bytes differ from the file's, so the tag must be weak
+        headers["ETag"] = f"W/{etag}"
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        return Response(file_ranges.iter_gzip(
+            file_ranges.iter_file_range(full_path)),
+                        mimetype=mimetype,
+                        headers=headers)
+
+    headers["Content-Length"] = str(st.st_size)
+    return Response(file_ranges.iter_file_range(full_path),
+                    mimetype=mimetype,
+                    headers=headers)
+
+
+def is_compressible(mimetype):
+    """Whether a response of this type is worth gzipping"""
+    return (mimetype.startswith("text/") or mimetype in {
+        "application/json", "application/javascript", "application/xml",
+        "image/svg+xml"
+    })
+
+
+@app.route("/artifacts/preview", methods=["GET"])
+def get_artifact_preview():
+    """Preview of an artifact; images and PDFs come as URLs to fetch"""
+    workspace_id = request.args.get("workspace_id")
+    file_path = request.args.get("path")
+    if not workspace_id or not file_path:
+        return jsonify({
+            "status": "error",
+            "message": "Missing workspace_id or path"
+        }), 400
+    try:
+        preview = artifact_previews.get_artifact_preview(
+            workspace_id, file_path)
+        return json_response({"status": "success", "preview": preview})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/artifacts/preview_cache", methods=["GET"])
+def get_preview_cache_stats():
+    """Size and hit rate of the artifact preview cache"""
+    return jsonify({
+        "status": "success",
+        **artifact_previews.preview_cache.stats()
+    })
+
+
+@app.route("/artifacts/table", methods=["GET"])
+def get_artifact_table():
+    """A page of rows of a CSV/TSV artifact, sorted and filtered server-side"""
+    args = request.args
+    if not args.get("workspace_id") or not args.get("path"):
+        return jsonify({
+            "status": "error",
+            "message": "Missing workspace_id or path"
+        }), 400
+    try:
+        page = artifact_previews.get_table_page(
+            args["workspace_id"],
+            args["path"],
+            offset=int(args.get("offset", 0)),
+            limit=int(args.get("limit", 100)),
+            sort=args.get("sort") or None,
+            descending=args.get("order") == "desc",
+            filter_text=args.get("filter") or None,
+            filter_column=args.get("filter_column") or None,
+        )
+        return json_response({"status": "success", **page})
+    except FileNotFoundError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/artifacts/hex", methods=["GET"])
+def get_artifact_hex():
+    """A hex dump page of any region of an artifact"""
+    args = request.args
+    if not args.get("workspace_id") or not args.get("path"):
+        return jsonify({
+            "status": "error",
+            "message": "Missing workspace_id or path"
+        }), 400
+    try:
+        page = artifact_previews.get_hex_page(
+            args["workspace_id"],
+            args["path"],
+            offset=int(args.get("offset", 0)),
+            length=int(args.get("length", 4096)),
+        )
+        return json_response({"status": "success", **page})
+    except FileNotFoundError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/artifacts/list", methods=["GET"])
+def get_artifacts_list():
+    """One page of a workspace directory's artifacts, by cursor"""
+    args = request.args
+    if not args.get("workspace_id"):
+        return jsonify({
+            "status": "error",
+            "message": "Missing workspace_id"
+        }), 400
+    try:
+        page = artifact_previews.get_artifacts_page(
+            args["workspace_id"],
+            args.get("directory", ""),
+            limit=min(int(args.get("limit", 200)), 1000),
+            cursor=args.get("cursor") or None,
+        )
+        return json_response({"status": "success", **page})
+    except FileNotFoundError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/artifacts/raw", methods=["GET"])
+def get_artifact_raw():
+    """Stream an artifact's bytes, with Range support for large media"""
+    full_path = artifact_previews.resolve_path(
+        request.args.get("workspace_id"),
+        request.args.get("path", ""))
+    if full_path is None:
+        return jsonify({
+            "status": "error",
+            "message": "Invalid file path"
+        }), 400
+    return stream_file(full_path)
+
+
+@app.route("/artifacts/thumbnail", methods=["GET"])
+def get_artifact_thumbnail():
+    """Serve an image artifact's cached thumbnail.
+
+    Until the thumbnail is rendered (in the background), and when none can
+    be made (Pillow missing or an undecodable image), the full image is
+    served instead.
+    """
+    full_path = artifact_previews.resolve_path(
+        request.args.get("workspace_id"),
+        request.args.get("path", ""))
+    if full_path is None:
+        return jsonify({
+            "status": "error",
+            "message": "Invalid file path"
+        }), 400
+    if not os.path.isfile(full_path):
+        return jsonify({
+            "status": "error",
+            "message": "File not found"
+        }), 404
+
+    thumbnail_path = artifact_previews.thumbnails.cached(full_path)
+    if thumbnail_path is None:
+        artifact_previews.thumbnails.render_async(full_path)
+        return stream_file(full_path)
+    response = send_file(thumbnail_path, conditional=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @app.route("/workspace/rename", methods=["POST"])
 def rename_workspace():
     """Rename a workspace"""
@@ -938,6 +1373,146 @@ def rename_workspace():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route("/workspace/fork", methods=["POST"])
+def fork_workspace():
+    """Clone a workspace, sharing file data copy-on-write where possible"""
+    data = request.json
+    workspace_id = data.get("workspace_id")
+    new_name = data.get("new_name") or f"{workspace_id}-fork-{int(time.time())}"
+
+    if not workspace_id:
+        return (
+            jsonify({
+                "status": "error",
+                "message": "Missing workspace_id"
+            }),
+            400,
+        )
+
+    try:
+        source_path = os.path.join(WORKSPACE_ROOT, workspace_id)
+        new_path = os.path.join(WORKSPACE_ROOT, new_name)
+
+        # Verify both paths are within WORKSPACE_ROOT
+        root = os.path.abspath(WORKSPACE_ROOT)
+        if (os.path.dirname(os.path.abspath(source_path)) != root
+                or os.path.dirname(os.path.abspath(new_path)) != root):
+            return jsonify({
+                "status": "error",
+                "message": "Invalid workspace name"
+            }), 400
+
+        if not os.path.isdir(source_path):
+            return jsonify({
+                "status": "error",
+                "message": "Workspace not found"
+            }), 404
+
+        # Dot names are metadata directories and hidden from the list
+        if new_name.startswith("."):
+            return jsonify({
+                "status": "error",
+                "message": "Workspace names cannot start with '.'"
+            }), 400
+
+        if os.path.exists(new_path):
+            return (
+                jsonify({
+                    "status": "error",
+                    "message": "A workspace with this name already exists",
+                }),
+                400,
+            )
+
+        # Imported workspaces are links; the fork gets its own copies of the
+        # linked files. The .imported marker stays with the source.
+        start_time = time.time()
+        cloner = TreeCloner(skip_root_names={".imported"})
+        try:
+            # Without reflinks this is a full byte copy; keep it off the
+            # event loop
+            counts = tpool.execute(cloner.clone_tree,
+                                   os.path.realpath(source_path), new_path)
+        except Exception:
+            # Don't leave a half-built workspace behind
+            shutil.rmtree(new_path, ignore_errors=True)
+            raise
+        workspace_manager.copy_workspace_state(source_path, new_path)
+        print(f"Forked {workspace_id} to {new_name} in "
+              f"{time.time() - start_time:.2f}s: {counts}")
+
+        return jsonify({
+            "status": "success",
+            "message": "Workspace forked successfully",
+            "workspace_id": new_name,
+            "workspace_dir": new_path,
+            "clone_counts": counts,
+        })
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/workspace/export", methods=["GET"])
+def export_workspace():
+    """Stream a workspace as a compressed tar archive"""
+    workspace_id = request.args.get("workspace_id")
+    workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id or "")
+
+    if (not workspace_id or os.path.dirname(os.path.abspath(workspace_path))
+            != os.path.abspath(WORKSPACE_ROOT)
+            or not os.path.isdir(workspace_path)):
+        return jsonify({
+            "status": "error",
+            "message": "Workspace not found"
+        }), 404
+
+    compression = workspace_archive.resolve_compression(
+        request.args.get("compression"))
+    include_index = request.args.get("include_index", "true") != "false"
+    metadata = (workspace_manager.export_metadata(workspace_path)
+                if include_index else {})
+
+    filename = workspace_id + workspace_archive.EXTENSIONS[compression]
+    return Response(
+        workspace_archive.stream_export(workspace_path,
+                                        workspace_manager.walk_workspace,
+                                        compression, metadata),
+        mimetype=workspace_archive.MIME_TYPES[compression],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.route("/workspace/import_archive", methods=["POST"])
+def import_workspace_archive():
+    """Create a workspace from a tar archive streamed in the request body"""
+    workspace_id = request.args.get("workspace_id")
+    workspace_path = os.path.join(WORKSPACE_ROOT, workspace_id or "")
+
+    if (not workspace_id or workspace_id.startswith(".")
+            or os.path.dirname(os.path.abspath(workspace_path))
+            != os.path.abspath(WORKSPACE_ROOT)):
+        return jsonify({
+            "status": "error",
+            "message": "Invalid workspace name"
+        }), 400
+
+    try:
+        metadata = workspace_archive.import_archive(request.stream,
+                                                    workspace_path)
+        workspace_manager.import_metadata(workspace_path, metadata)
+        return jsonify({
+            "status": "success",
+            "message": "Workspace imported successfully",
+            "workspace_id": workspace_id,
+            "workspace_dir": workspace_path,
+        })
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     try:
@@ -968,20 +1543,18 @@ def chat():
                 else:
                     # For a directory, get contents of files within it
                     files_content = {}
-                    for root, _, files in os.walk(full_path):
-                        for file in files:
-                            if not file.startswith(".") and not file.endswith(
-                                    tuple(workspace_manager.SKIP_EXTENSIONS)):
-                                file_path = os.path.join(root, file)
-                                rel_path = os.path.relpath(
-                                    file_path, workspace_dir)
-                                try:
-                                    with open(file_path, "r",
-                                              encoding="utf-8") as f:
-                                        files_content[rel_path] = f.read()
-                                except Exception as e:
-                                    print(
-                                        f"Error reading file {file_path}: {e}")
+                    for _, _, file_entries in workspace_manager.walk_workspace(
+                            workspace_dir, context_path):
+                        for entry in file_entries:
+                            file_path = entry.path
+                            rel_path = os.path.relpath(file_path,
+                                                       workspace_dir)
+                            try:
+                                with open(file_path, "r",
+                                          encoding="utf-8") as f:
+                                    files_content[rel_path] = f.read()
+                            except Exception as e:
+                                print(f"Error reading file {file_path}: {e}")
         else:
             # No context path, get relevant files based on the query
             files_content = workspace_manager.get_workspace_files(
@@ -994,6 +1567,10 @@ def chat():
                     f"[ATTACHMENT] {attachment['name']}"] = attachment[
                         "content"]
 
+        # Fit the files into the model's budget before building the context
+        files_content = pack_files_content(files_content, model_id, prompt,
+                                           context_path)
+
         # Build context from files
         context = "Here are the relevant files in the workspace:\n\n"
         for file_path, content in files_content.items():
@@ -1058,10 +1635,10 @@ def get_chat_response(system_message, user_message, model_id):
                 },
             ]
 
-        # Estimate tokens in messages
-        system_tokens = len(
-            system_message.encode("utf-8")) // 4  # Rough estimate
-        user_tokens = len(user_message.encode("utf-8")) // 4
+        # Count tokens in messages with the model's tokenizer family
+        token_counter = get_model_token_counter(model_id)
+        system_tokens = token_counter.count(system_message)
+        user_tokens = token_counter.count(user_message)
         total_tokens = system_tokens + user_tokens
 
         # If total tokens exceed model's limit, truncate the system message
@@ -1072,7 +1649,9 @@ def get_chat_response(system_message, user_message, model_id):
             if available_tokens > 0:
                 # Use workspace manager's truncation method
                 system_message = workspace_manager._truncate_content_for_context(
-                    system_message, max_tokens=available_tokens)
+                    system_message,
+                    max_tokens=available_tokens,
+                    token_counter=token_counter)
                 # Update truncated message
                 messages[0]["content"] = system_message
                 print(
@@ -1147,6 +1726,8 @@ def get_chat_response(system_message, user_message, model_id):
                                 _truncate_content_for_context(
                                     messages[i]["content"],
                                     max_tokens=10000,  # Even more conservative
+                                    token_counter=get_model_token_counter(
+                                        model_id),
                                 ))
                     # Combine truncated messages
                     full_context = "\n\n".join(msg["content"]
@@ -1179,11 +1760,14 @@ def get_chat_response(system_message, user_message, model_id):
                 "step": 2
             })
 
-            # Process the streamed response
+            # Process the streamed response, sending rendered HTML as it
+            # arrives: finished blocks once, plus the unfinished tail
             text = ""
             chunk_count = 0
             last_update = time.time()
             update_interval = 0.5
+            stream = MarkdownStream(markdown_renderer)
+            unsent = []
 
             for chunk in response:
                 if (chunk and hasattr(chunk.choices[0], "delta")
@@ -1191,6 +1775,7 @@ def get_chat_response(system_message, user_message, model_id):
                     content = chunk.choices[0].delta.content
                     if content is not None:
                         text += content
+                        unsent.append(content)
                         chunk_count += 1
 
                     current_time = time.time()
@@ -1215,6 +1800,12 @@ def get_chat_response(system_message, user_message, model_id):
                                 },
                             },
                         )
+                        finished, tail = stream.feed("".join(unsent))
+                        unsent = []
+                        socketio.emit("chat_stream", {
+                            "append": finished,
+                            "tail": tail
+                        })
                         last_update = current_time
 
             print(f"\nResponse complete in {time.time() - start_time:.1f}s")
@@ -1228,33 +1819,8 @@ def get_chat_response(system_message, user_message, model_id):
             "step": 3
         })
 
-        # Split text into code blocks and regular text
-        parts = text.split("```")
-        formatted_parts = []
-
-        for i, part in enumerate(parts):
-            if i % 2 == 0:  # Regular text
-                # Replace newlines with <br> in regular text
-                formatted_parts.append(part.replace("\n", "<br>"))
-            else:  # Code block
-                # Extract language if specified
-                if "\n" in part:
-                    lang, code = part.split("\n", 1)
-                    # Remove trailing whitespace and newlines, preserve
-                    # indentation
-                    formatted_code = (code.rstrip().replace("\n",
-                                                            "<br>").replace(
-                                                                " ", "&nbsp;"))
-                    formatted_parts.append(
-                        f'<pre><code class="language-{lang.strip()}">{formatted_code}</code></pre>'
-                    )
-                else:
-                    # Single line code block, remove trailing whitespace
-                    formatted_parts.append(
-                        f'<pre><code>{part.strip().replace(" ", "&nbsp;")}</code></pre>'
-                    )
-
-        formatted_text = "".join(formatted_parts)
+        # Blocks already rendered while streaming come from the cache
+        formatted_text = markdown_renderer.render(text)
         print("Response formatting complete")
 
         socketio.emit("status", {"message": "Response ready", "step": 4})
@@ -1317,11 +1883,9 @@ def apply_changes_endpoint():
         results = apply_changes({"operations": operations}, workspace_dir)
 
         # Get updated workspace structure
-        structure = workspace_manager.get_workspace_structure(workspace_dir)
-
-        return jsonify({
+        return json_response({
             "status": "success",
-            "structure": structure,
+            **structure_fields(workspace_dir, data),
             "results": results
         })
 
@@ -1561,6 +2125,11 @@ def apply_changes(suggestions, workspace_dir):
             result["operation"]["path"] for result in results
             if result["status"] == "success"
         ]
+        workspace_manager.notify_paths_changed(
+            workspace_dir, modified_files + [
+                result["operation"].get("new_path") for result in results
+                if result["status"] == "success"
+            ])
         socketio.emit(
             "changes_applied",
             {
@@ -1591,6 +2160,11 @@ def get_code_suggestion(prompt,
         print(f"Model: {model_id}")
         print(f"Prompt length: {len(prompt)} characters")
 
+        # Select the most relevant files that fit the model's budget
+        files_content = pack_files_content(files_content, model_id, prompt,
+                                           system_prompt, workspace_context,
+                                           JSON_RESPONSE_INSTRUCTION)
+
         # Create the messages array for the chat
         if model_id in ["o1", "o1-mini"]:
             messages = []
@@ -1605,7 +2179,7 @@ def get_code_suggestion(prompt,
                     files_content_str += f"\nFile: {path}\nContent:\n{content}\n"
                 system_content.append(files_content_str)
             system_content.append(
-                f'{prompt}\n\nIMPORTANT: Your response MUST be a valid JSON object following this exact structure:\n{{\n    "explanation": "Brief explanation of what you will do",\n    "operations": [\n        {{\n            "type": "edit_file",\n            "path": "relative/path",\n            "changes": [\n                {{\n                    "old": "text to replace",\n                    "new": "replacement text"\n                }}\n            ]\n        }}\n    ]\n}}'
+                f"{prompt}\n\n{JSON_RESPONSE_INSTRUCTION}"
             )
             messages = [{
                 "role": "user",
@@ -1639,36 +2213,15 @@ def get_code_suggestion(prompt,
                 "role":
                 "user",
                 "content":
-                f'{prompt}\n\nIMPORTANT: Your response MUST be a valid JSON object following this exact structure:\n{{\n    "explanation": "Brief explanation of what you will do",\n    "operations": [\n        {{\n            "type": "edit_file",\n            "path": "relative/path",\n            "changes": [\n                {{\n                    "old": "text to replace",\n                    "new": "replacement text"\n                }}\n            ]\n        }}\n    ]\n}}',
+                f"{prompt}\n\n{JSON_RESPONSE_INSTRUCTION}",
             })
 
-        # Estimate total tokens
+        # Files were packed into the budget above; report the final size
+        token_counter = get_model_token_counter(model_id)
         total_tokens = sum(
-            len(msg["content"].encode("utf-8")) // 4 for msg in messages)
-        max_tokens = model_config.get("max_tokens", 100000)
-
-        # If total tokens exceed model's limit, truncate the system messages
-        if total_tokens > max_tokens:
-            # Keep prompt intact, truncate context
-            available_tokens = (max_tokens -
-                                (len(prompt.encode("utf-8")) // 4) - 1000
-                                )  # Leave buffer
-            if available_tokens > 0:
-                # Truncate each system message proportionally
-                for i in range(len(messages) -
-                               1):  # Skip the last message (user prompt)
-                    if messages[i]["role"] == "system":
-                        messages[i]["content"] = (
-                            workspace_manager._truncate_content_for_context(
-                                messages[i]["content"],
-                                max_tokens=available_tokens //
-                                (len(messages) - 1),
-                            ))
-                print(
-                    f"Truncated context to fit within {available_tokens} tokens"
-                )
-            else:
-                raise Exception("Message too long even after truncation")
+            token_counter.count(msg["content"]) for msg in messages)
+        print(f"Estimated request size: {total_tokens} tokens "
+              f"(limit {model_config.get('max_tokens', 100000)})")
 
         print("\n=== Step 2: Sending Request to AI Model ===")
         start_time = time.time()
@@ -1726,6 +2279,8 @@ def get_code_suggestion(prompt,
                                 _truncate_content_for_context(
                                     messages[i]["content"],
                                     max_tokens=10000,  # Even more conservative
+                                    token_counter=get_model_token_counter(
+                                        model_id),
                                 ))
                     # Combine truncated messages
                     full_context = "\n\n".join(msg["content"]
@@ -1969,56 +2524,69 @@ def list_available_folders():
             return jsonify(
                 {"error": "Access denied: Path outside home directory"}), 403
 
+        # Socket id to stream sizes to, and whether to leave out folders
+        # that imports skip anyway (node_modules, venv, ...)
+        sid = request.args.get("sid")
+        skip_ignored = request.args.get("skip_ignored", "true") != "false"
+
         # Get parent path for navigation
         parent_path = os.path.dirname(path) if path != home_dir else None
 
         available_items = []
+        pending_paths = []
         try:
-            for item in os.listdir(path):
-                full_path = os.path.join(path, item)
-                if os.path.isdir(full_path):
+            with os.scandir(path) as it:
+                for entry in it:
                     try:
-                        stats = os.stat(full_path)
+                        if not entry.is_dir():
+                            continue
                         item_info = {
-                            "name": item,
-                            "path": full_path,
+                            "name": entry.name,
+                            "path": entry.path,
                             "type": "directory",
-                            "modified": stats.st_mtime,
+                            "modified": entry.stat().st_mtime,
                             "is_navigable": True,
                         }
-                        # Only calculate size and files count if this is a
-                        # potential import target
-                        if not item.startswith("."):
-                            try:
-                                item_info.update({
-                                    "size":
-                                    sum(
-                                        os.path.getsize(
-                                            os.path.join(dirpath, filename))
-                                            for dirpath, dirnames, filenames in
-                                            os.walk(full_path)
-                                            for filename in filenames),
-                                    "files":
-                                    sum(
-                                        len(files)
-                                        for _, _, files in os.walk(full_path)),
-                                    "is_importable":
-                                    True,
-                                })
-                            except BaseException:
-                                item_info.update({
-                                    "size": 0,
-                                    "files": 0,
-                                    "is_importable": False
-                                })
+                        # Only potential import targets get a size; it is
+                        # sent now if cached, otherwise marked pending
+                        if not entry.name.startswith("."):
+                            item_info["is_importable"] = True
+                            cached = folder_sizes.get(entry.path,
+                                                      skip_ignored)
+                            if cached:
+                                item_info["size"], item_info["files"] = cached
+                                item_info["size_pending"] = False
+                            else:
+                                item_info["size_pending"] = True
+                                pending_paths.append(entry.path)
                         available_items.append(item_info)
                     except Exception as e:
-                        print(f"Error processing folder {item}: {e}")
+                        print(f"Error processing folder {entry.name}: {e}")
                         continue
         except PermissionError:
             return jsonify(
                 {"error": "Permission denied accessing this directory"}), 403
 
+        if pending_paths:
+            # Without a socket the sizes are only cached, and served with
+            # the next listing of this folder
+            send_size = None
+            if sid:
+
+                def send_size(folder_path, size, files, error):
+                    socketio.emit(
+                        "folder_size",
+                        {
+                            "path": folder_path,
+                            "size": size,
+                            "files": files,
+                            "error": error,
+                        },
+                        to=sid,
+                    )
+
+            folder_sizes.request(pending_paths, send_size, skip_ignored)
+
         return jsonify({
             "status":
             "success",
@@ -2091,6 +2659,8 @@ def rename_file():
 
         # Rename the file
         os.rename(old_full_path, new_full_path)
+        workspace_manager.notify_paths_changed(workspace_dir,
+                                               [old_path, new_path])
 
         return jsonify({
             "status": "success",
@@ -2108,9 +2678,8 @@ def get_operation_diff(operation, workspace_dir):
 
         # Get current content
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                current_content = f.read()
-        except BaseException:
+            current_content = file_reader.read_text(file_path)[0] or ""
+        except OSError:
             current_content = ""
 
         # For create operations
@@ -1,12 +1,23 @@
 """Artifacts preview module for handling different file types and previews."""
 
 # pylama:ignore=E501
-import base64
+import bisect
 import os
 import mimetypes
 import json
+import stat
+import time
 from pathlib import Path
-from typing import Dict, Tuple, Optional, Union, List
+from typing import Any, Callable, Dict, Tuple, Optional, Union, List
+from urllib.parse import urlencode
+
+from file_reader import get_file_reader
+from hex_view import HexViewer
+from markdown_render import get_markdown_renderer
+from preview_cache import PreviewCache, preview_key
+from table_preview import TablePreview
+from thumbnails import ThumbnailCache
+from workspace_tree import SortKey, decode_cursor, encode_cursor
 
 # Initialize MIME types
 mimetypes.init()
@@ -93,15 +104,60 @@ class ArtifactPreviewManager:
         ".db", ".sqlite", ".class", ".o", ".pyc", ".pyo", ".pyd", ".so", ".dll", ".exe", ".bin"
     }
 
-    def __init__(self, workspace_root: str):
+    LISTING_TTL = 2.0  # Seconds a directory listing is trusted
+    MAX_LISTINGS = 256  # Directory listings kept in memory
+
+    # Preview types never loaded whole (streamed or paged), so any size works
+    STREAMED_TYPES = {"image", "pdf", "table"}
+
+    # Markdown longer than this is rendered off the event loop, uncached
+    LARGE_MARKDOWN_CHARS = 256 * 1024
+
+    def __init__(self, workspace_root: str, thumbnail_dir: Optional[str] = None,
+                 run_blocking: Optional[Callable[..., Any]] = None):
         """Initialize the ArtifactPreviewManager.
         
         Args:
             workspace_root: Root directory for workspaces
+            thumbnail_dir: Thumbnail cache directory (default: .thumbnails
+                under the workspace root)
+            run_blocking: Runs thumbnail and large Markdown rendering off
+                the event loop, called as run_blocking(func, *args)
         """
         self.workspace_root = workspace_root
+        self.run_blocking = run_blocking
         self.max_text_size = 10 * 1024 * 1024  # 10MB max for text files
-        self.max_binary_size = 20 * 1024 * 1024  # 20MB max for binary files
+        self.reader = get_file_reader()
+        self.thumbnails = ThumbnailCache(
+            thumbnail_dir or os.path.join(workspace_root, ".thumbnails"),
+            run_blocking=run_blocking)
+        self.tables = TablePreview(self.reader, pause=lambda: time.sleep(0))
+        self.hex_viewer = HexViewer()
+        self.markdown = get_markdown_renderer()
+        self.preview_cache = PreviewCache()
+        self._listings: Dict[str, Tuple[int, float, List[SortKey], Dict[SortKey, Dict]]] = {}
+
+    def resolve_path(self, workspace_id: str, file_path: str) -> Optional[str]:
+        """Get the full path of an artifact, or None if it escapes its workspace.
+        
+        Args:
+            workspace_id: ID of the workspace
+            file_path: Path to the file relative to the workspace
+            
+        Returns:
+            Full path to the artifact, or None for invalid paths
+        """
+        if not workspace_id or workspace_id.startswith(".") or os.sep in workspace_id:
+            return None
+        workspace_dir = os.path.abspath(os.path.join(self.workspace_root, workspace_id))
+        full_path = os.path.abspath(os.path.join(workspace_dir, file_path))
+        if full_path != workspace_dir and not full_path.startswith(workspace_dir + os.sep):
+            return None
+        return full_path
+
+    def artifact_url(self, kind: str, workspace_id: str, file_path: str) -> str:
+        """URL of an artifact endpoint ("raw" or "thumbnail") for a file"""
+        return f"/artifacts/{kind}?" + urlencode({"workspace_id": workspace_id, "path": file_path})
         
     def get_artifact_preview(self, workspace_id: str, file_path: str) -> Dict:
         """Get preview information for an artifact.
@@ -117,22 +173,50 @@ class ArtifactPreviewManager:
             - meta: Additional metadata for the preview
         """
         # Construct the full path to the file
-        full_path = os.path.join(self.workspace_root, workspace_id, file_path)
+        full_path = self.resolve_path(workspace_id, file_path)
         
         # Check if the file exists
-        if not os.path.exists(full_path) or not os.path.isfile(full_path):
+        try:
+            st = os.stat(full_path) if full_path is not None else None
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
             return {
                 "preview_type": "error",
                 "error": "File not found",
                 "path": file_path
             }
         
-        # Check file size
-        file_size = os.path.getsize(full_path)
+        # Payloads embed the path, so build them from the normalized one
+        workspace_dir = os.path.abspath(os.path.join(self.workspace_root, workspace_id))
+        rel_path = os.path.relpath(full_path, workspace_dir).replace(os.sep, "/")
+
+        # Reuse the preview computed for this version of the file
+        cache_key = preview_key(workspace_id, rel_path, full_path, st)
+        preview = self.preview_cache.get(cache_key)
+        if preview is None:
+            try:
+                preview = self._build_preview(workspace_id, rel_path, full_path, st.st_size)
+            except OSError as e:
+                # Read failures may be transient, so they are not cached
+                return {
+                    "preview_type": "error",
+                    "error": f"Error reading file: {e}",
+                    "path": rel_path
+                }
+            self.preview_cache.put(cache_key, preview)
+        return preview
+
+    def _build_preview(self, workspace_id: str, file_path: str, full_path: str,
+                       file_size: int) -> Dict:
+        """Compute the preview of one version of a file"""
+        # Check file size; streamed types and binaries (shown as hex pages)
+        # are never loaded whole
+        _, file_ext = os.path.splitext(file_path.lower())
         is_binary = self._is_binary_file(full_path)
-        max_size = self.max_binary_size if is_binary else self.max_text_size
         
-        if file_size > max_size:
+        if (not is_binary and file_size > self.max_text_size
+                and self.PREVIEW_TYPES.get(file_ext) not in self.STREAMED_TYPES):
             return {
                 "preview_type": "error",
                 "error": f"File too large to preview ({self._format_size(file_size)})",
@@ -141,7 +225,10 @@ class ArtifactPreviewManager:
             }
         
         # Determine the preview type
-        preview_type, content, meta = self._get_preview_content(full_path, file_path)
+        preview_type, content, meta = self._get_preview_content(full_path, file_path, workspace_id)
+        if preview_type == "binary":
+            meta["hex_url"] = self.artifact_url("hex", workspace_id, file_path)
+            meta["file_size"] = file_size
         
         return {
             "preview_type": preview_type,
@@ -151,12 +238,17 @@ class ArtifactPreviewManager:
             "size": self._format_size(file_size)
         }
     
-    def _get_preview_content(self, full_path: str, file_path: str) -> Tuple[str, Union[str, bytes], Dict]:
+    def _get_preview_content(self, full_path: str, file_path: str, workspace_id: str) -> Tuple[str, Union[str, bytes], Dict]:
         """Get the content for a preview based on the file type.
         
+        Images and PDFs are not inlined: their content is the URL of the raw
+        endpoint, and images also get a thumbnail URL when thumbnails can be
+        generated.
+        
         Args:
             full_path: Full path to the file
             file_path: Path to the file relative to the workspace
+            workspace_id: ID of the workspace
             
         Returns:
             Tuple of (preview_type, content, metadata)
@@ -174,72 +266,98 @@ class ArtifactPreviewManager:
         
         if preview_type == "code" or preview_type == "text" or preview_type == "markdown":
             # For text-based files
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Add CodeMirror mode for code files
-                if file_ext in self.CODEMIRROR_MODES:
-                    meta["mode"] = self.CODEMIRROR_MODES[file_ext]
-                    
-                return preview_type, content, meta
-            except UnicodeDecodeError:
-                # If we can't decode as UTF-8, it might be binary
+            content, _ = self.reader.read_text(full_path)
+            if content is None:
                 return "binary", self._get_binary_preview(full_path), meta
+
+            # Add CodeMirror mode for code files
+            if file_ext in self.CODEMIRROR_MODES:
+                meta["mode"] = self.CODEMIRROR_MODES[file_ext]
+
+            # Render Markdown here, so clients need not parse it per view
+            if preview_type == "markdown":
+                if self.run_blocking and len(content) > self.LARGE_MARKDOWN_CHARS:
+                    meta["html"] = self.run_blocking(self.markdown.render,
+                                                     content, False)
+                else:
+                    meta["html"] = self.markdown.render(content)
+
+            return preview_type, content, meta
                 
         elif preview_type == "image":
-            # For image files, return base64 encoded data
-            try:
-                with open(full_path, 'rb') as f:
-                    image_data = f.read()
-                
-                mime_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
-                data_uri = f"data:{mime_type};base64,{base64.b64encode(image_data).decode('ascii')}"
-                
-                meta["mime_type"] = mime_type
-                return "image", data_uri, meta
-                
-            except Exception as e:
-                return "error", str(e), meta
+            # For image files, link the raw file and a thumbnail
+            meta["mime_type"] = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            if self.thumbnails.supports(full_path):
+                meta["thumbnail_url"] = self.artifact_url("thumbnail", workspace_id, file_path)
+            return "image", self.artifact_url("raw", workspace_id, file_path), meta
                 
         elif preview_type == "pdf":
-            # For PDFs, return a data URI
-            try:
-                with open(full_path, 'rb') as f:
-                    pdf_data = f.read()
-                
-                data_uri = f"data:application/pdf;base64,{base64.b64encode(pdf_data).decode('ascii')}"
-                return "pdf", data_uri, meta
-                
-            except Exception as e:
-                return "error", str(e), meta
+            # For PDFs, link the raw file; viewers fetch it in ranges
+            meta["mime_type"] = "application/pdf"
+            return "pdf", self.artifact_url("raw", workspace_id, file_path), meta
                 
         elif preview_type == "table":
-            # For CSV/TSV files
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Add delimiter info for table rendering
-                meta["delimiter"] = "," if file_ext == ".csv" else "\t"
-                return "table", content, meta
-                
-            except UnicodeDecodeError:
+            # For CSV/TSV files, the first page; later pages come from
+            # get_table_page
+            if self._is_binary_file(full_path):
                 return "binary", self._get_binary_preview(full_path), meta
+            page = self.tables.page(full_path)
+            meta["delimiter"] = page["delimiter"]
+            meta["total_rows"] = page["total_rows"]
+            meta["page_url"] = self.artifact_url("table", workspace_id, file_path)
+            return "table", page, meta
         
         else:
-            # Try to read as text first
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # If we get here, it's readable as text
-                return "text", content, meta
-                
-            except UnicodeDecodeError:
-                # If we can't decode as UTF-8, treat as binary
+            # Read as text unless the file sniffs as binary
+            content, _ = self.reader.read_text(full_path)
+            if content is None:
                 return "binary", self._get_binary_preview(full_path), meta
+            return "text", content, meta
     
+    def get_table_page(self, workspace_id: str, file_path: str, offset: int = 0,
+                       limit: int = TablePreview.PAGE_SIZE, sort: Optional[str] = None,
+                       descending: bool = False, filter_text: Optional[str] = None,
+                       filter_column: Optional[str] = None) -> Dict:
+        """Get a window of rows of a CSV/TSV artifact.
+        
+        Args:
+            workspace_id: ID of the workspace
+            file_path: Path to the file relative to the workspace
+            offset: First row of the window, after sorting and filtering
+            limit: Number of rows
+            sort: Column name or index to sort by
+            descending: Sort order
+            filter_text: Substring to match, or a comparison like ">10" for
+                numeric columns
+            filter_column: Column name or index to filter; all if None
+            
+        Returns:
+            Dictionary with typed columns, rows and the total row count
+        """
+        full_path = self.resolve_path(workspace_id, file_path)
+        if full_path is None or not os.path.isfile(full_path):
+            raise FileNotFoundError(f"Artifact not found: {file_path}")
+        return self.tables.page(full_path, offset, limit, sort, descending,
+                                filter_text, filter_column)
+
+    def get_hex_page(self, workspace_id: str, file_path: str, offset: int = 0,
+                     length: int = HexViewer.PAGE_BYTES) -> Dict:
+        """Get a hex dump of any region of an artifact.
+        
+        Args:
+            workspace_id: ID of the workspace
+            file_path: Path to the file relative to the workspace
+            offset: First byte, aligned down to a 16-byte row
+            length: Number of bytes, at most HexViewer.MAX_PAGE_BYTES
+            
+        Returns:
+            Dictionary with the rows, file size and next page offset
+        """
+        full_path = self.resolve_path(workspace_id, file_path)
+        if full_path is None or not os.path.isfile(full_path):
+            raise FileNotFoundError(f"Artifact not found: {file_path}")
+        return self.hex_viewer.page(full_path, offset, length)
+
     def _get_binary_preview(self, full_path: str) -> str:
         """Create a hex dump preview for binary files.
         
@@ -249,31 +367,14 @@ class ArtifactPreviewManager:
         Returns:
             Hex dump as a string
         """
-        try:
-            # Read only the first 4KB for the hex dump
-            with open(full_path, 'rb') as f:
-                data = f.read(4096)
-            
-            # Create a hex dump
-            hex_dump = []
-            for i in range(0, len(data), 16):
-                chunk = data[i:i+16]
-                # Hex values
-                hex_line = ' '.join(f'{b:02x}' for b in chunk)
-                # ASCII representation (printable chars only)
-                ascii_line = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
-                
-                # Format address, hex values, and ASCII
-                line = f"{i:08x}:  {hex_line:<47}  |{ascii_line}|"
-                hex_dump.append(line)
-            
-            if len(data) == 4096:
-                hex_dump.append("... (truncated)")
-                
-            return '\n'.join(hex_dump)
-            
-        except Exception as e:
-            return f"Error reading binary file: {str(e)}"
+        # Only the first page; get_hex_page serves the rest. Read errors
+        # propagate so the failed preview is not cached
+        page = self.hex_viewer.page(full_path, 0, HexViewer.PAGE_BYTES)
+        hex_dump = list(page["rows"])
+        if page["next_offset"] is not None:
+            hex_dump.append("... (truncated)")
+
+        return '\n'.join(hex_dump)
             
     def _is_binary_file(self, file_path: str) -> bool:
         """Check if a file is likely to be binary.
@@ -289,22 +390,9 @@ class ArtifactPreviewManager:
         if ext in self.BINARY_EXTENSIONS:
             return True
         
-        # Check file signature (magic bytes)
+        # Check content, sniffed once per file version by the shared reader
         try:
-            with open(file_path, 'rb') as f:
-                chunk = f.read(1024)  # Read first 1KB to detect binary content
-                
-                # Look for null bytes or other non-text characters
-                if b'\x00' in chunk:
-                    return True
-                
-                # Check for high rate of non-ASCII characters
-                non_ascii = sum(1 for b in chunk if b < 32 and b not in (9, 10, 13))  # tab, LF, CR
-                if non_ascii > 0.3 * len(chunk):
-                    return True
-                    
-                return False
-                
+            return self.reader.is_binary(file_path)
         except Exception:
             # In case of error, assume it's binary for safety
             return True
@@ -323,49 +411,111 @@ class ArtifactPreviewManager:
                 return f"{size_bytes:.2f} {unit}".rstrip('0').rstrip('.') + ' ' + unit
             size_bytes /= 1024
 
-    def get_artifacts_list(self, workspace_id: str, directory: str = "") -> List[Dict]:
-        """Get a list of artifacts in a directory.
+    def _directory_listing(self, full_dir_path: str) -> Tuple[List[SortKey], Dict[SortKey, Dict]]:
+        """Get a directory's sorted keys and entries, scanning it if needed.
+        
+        One os.scandir pass builds every entry from its DirEntry, so each
+        file costs a single stat. Listings are reused while the directory's
+        mtime is unchanged and the listing is younger than LISTING_TTL
+        (file sizes can change without touching the directory).
+        
+        Args:
+            full_dir_path: Full path to the directory
+            
+        Returns:
+            Tuple of (sorted keys, entries by key)
+        """
+        mtime_ns = os.stat(full_dir_path).st_mtime_ns
+        cached = self._listings.get(full_dir_path)
+        if (cached and cached[0] == mtime_ns
+                and time.monotonic() - cached[1] < self.LISTING_TTL):
+            return cached[2], cached[3]
+        
+        entries = {}
+        with os.scandir(full_dir_path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if entry.name.startswith("."):
+                            continue
+                        entries[(0, entry.name.lower(), entry.name)] = {
+                            "name": entry.name,
+                            "type": "directory"
+                        }
+                    elif entry.is_file():
+                        st = entry.stat()
+                        _, ext = os.path.splitext(entry.name.lower())
+                        entries[(1, entry.name.lower(), entry.name)] = {
+                            "name": entry.name,
+                            "type": "file",
+                            "preview_type": self.PREVIEW_TYPES.get(ext, "unknown"),
+                            "size": st.st_size,
+                            "size_formatted": self._format_size(st.st_size),
+                            "modified": st.st_mtime
+                        }
+                except OSError:
+                    continue  # Removed while scanning
+        
+        keys = sorted(entries)
+        self._listings[full_dir_path] = (mtime_ns, time.monotonic(), keys, entries)
+        while len(self._listings) > self.MAX_LISTINGS:
+            self._listings.pop(next(iter(self._listings)))
+        return keys, entries
+
+    def get_artifacts_page(self, workspace_id: str, directory: str = "",
+                           limit: int = 200, cursor: Optional[str] = None) -> Dict:
+        """Get one page of the artifacts in a directory.
+        
+        Pages use the workspace tree's sort order (directories first, then
+        by name) and cursor format, so a cursor resumes after the last entry
+        returned even if entries were added or removed in between.
         
         Args:
             workspace_id: ID of the workspace
             directory: Directory path relative to the workspace
+            limit: Maximum number of entries
+            cursor: next_cursor of the previous page
             
         Returns:
-            List of dictionaries with artifact info
+            Dictionary with items, next_cursor, total_items and has_more
+
+        Raises:
+            FileNotFoundError: If the directory does not exist or escapes
+                the workspace
         """
-        # Construct the full path to the directory
-        full_dir_path = os.path.join(self.workspace_root, workspace_id, directory)
+        full_dir_path = self.resolve_path(workspace_id, directory)
+        if full_dir_path is None or not os.path.isdir(full_dir_path):
+            raise FileNotFoundError(f"Directory not found: {directory}")
         
-        if not os.path.exists(full_dir_path) or not os.path.isdir(full_dir_path):
-            return []
+        keys, entries = self._directory_listing(full_dir_path)
+        start = bisect.bisect_right(keys, decode_cursor(cursor)) if cursor else 0
+        page_keys = keys[start:start + max(1, limit)]
+        items = []
+        for key in page_keys:
+            item = dict(entries[key])
+            item["path"] = os.path.join(directory, item["name"]).replace("\\", "/")
+            items.append(item)
         
-        artifacts = []
-        for item in os.listdir(full_dir_path):
-            item_path = os.path.join(full_dir_path, item)
-            rel_path = os.path.join(directory, item).replace("\\", "/")
-            
-            if os.path.isfile(item_path):
-                # Get file info
-                _, ext = os.path.splitext(item.lower())
-                size = os.path.getsize(item_path)
-                mtime = os.path.getmtime(item_path)
-                
-                artifacts.append({
-                    "name": item,
-                    "path": rel_path,
-                    "type": "file",
-                    "preview_type": self.PREVIEW_TYPES.get(ext, "unknown"),
-                    "size": size,
-                    "size_formatted": self._format_size(size),
-                    "modified": mtime
-                })
-            elif os.path.isdir(item_path) and not item.startswith("."):
-                # Add directory
-                artifacts.append({
-                    "name": item,
-                    "path": rel_path,
-                    "type": "directory"
-                })
+        has_more = start + len(page_keys) < len(keys)
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(page_keys[-1]) if has_more and page_keys else None,
+            "total_items": len(keys),
+            "has_more": has_more
+        }
+
+    def get_artifacts_list(self, workspace_id: str, directory: str = "") -> List[Dict]:
+        """Get a list of all artifacts in a directory.
         
-        # Sort: directories first, then files by name
-        return sorted(artifacts, key=lambda x: (x["type"] != "directory", x["name"].lower()))
+        Args:
+            workspace_id: ID of the workspace
+            directory: Directory path relative to the workspace
+            
+        Returns:
+            List of dictionaries with artifact info, directories first
+        """
+        full_dir_path = self.resolve_path(workspace_id, directory)
+        if full_dir_path is None or not os.path.isdir(full_dir_path):
+            return []
+        keys, _ = self._directory_listing(full_dir_path)
+        return self.get_artifacts_page(workspace_id, directory, limit=len(keys))["items"]
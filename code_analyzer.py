@@ -1,10 +1,31 @@
 """Code analyzer module for analyzing and processing code files."""
 
 # pylama:ignore=E501,E251
+import hashlib
 import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import List
+from typing import (Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple)
+
+from ignore_rules import IgnoreMatcher
+
+WalkFunction = Callable[[str], Iterator[Tuple[str, List[os.DirEntry],
+                                              List[os.DirEntry]]]]
+
+# Pruned by the default walk; WorkspaceManager.walk_workspace applies its
+# own SKIP_FOLDERS plus gitignore rules
+DEFAULT_SKIP_DIRS = {
+    "node_modules", "__pycache__", "venv", "env", "dist", "build", "target",
+    "vendor", "coverage"
+}
+
+# (full path, relative path, digest of the cached version or None)
+AnalysisJob = Tuple[str, str, Optional[str]]
+# CodeIssue fields after file; cheaper than dataclasses to pickle and keep
+IssueRecord = Tuple[int, str, str, Optional[str]]
 
 
 @dataclass
@@ -18,51 +39,202 @@ class CodeIssue:
     suggestion: str = None
 
 
+def _analyze_batch(settings: Dict[str, int], jobs: Sequence[AnalysisJob]
+                   ) -> List[Tuple[str, str, Optional[List[IssueRecord]]]]:
+    """Read, hash and analyze a batch of files; runs in worker processes.
+
+    Returns (full path, digest, issue records) per file, with records None
+    when the content hash equals the cached one.
+    """
+    analyzer = CodeAnalyzer(max_workers=0, **settings)
+    results = []
+    for full_path, relative_path, known_digest in jobs:
+        try:
+            with open(full_path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Error analyzing {full_path}: {str(e)}")
+            continue
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if digest == known_digest:
+            results.append((full_path, digest, None))
+            continue
+        try:
+            issues = [(issue.line, issue.issue_type, issue.message,
+                       issue.suggestion)
+                      for issue in analyzer._analyze_content(
+                          relative_path, data.decode("utf-8"))]
+        except Exception as e:
+            print(f"Error analyzing {full_path}: {str(e)}")
+            issues = []
+        results.append((full_path, digest, issues))
+    return results
+
+
 class CodeAnalyzer:
-    """Analyzes code files for potential improvements."""
+    """Analyzes code files for potential improvements.
+
+    Files come from walk (WorkspaceManager.walk_workspace shares the
+    workspace scanner's skip folders and gitignore rules) and are analyzed
+    in a process pool, in batches. Results are cached per file by content
+    hash: files whose (inode, mtime, size) are unchanged are not read, and
+    touched files with the same hash are not re-analyzed, so a rerun after
+    one edit analyzes only that file.
+    """
+
+    BATCH_SIZE = 32  # Files per worker task
+    MIN_PARALLEL_FILES = 64  # Fewer changed files are analyzed in-process
+    MAX_CACHED_FILES = 50000
+
+    def __init__(self,
+                 max_line_length: int = 100,
+                 max_function_length: int = 50,
+                 max_params: int = 5,
+                 walk: Optional[WalkFunction] = None,
+                 max_workers: Optional[int] = None):
+        """
+        Args:
+            walk: Workspace walker yielding (rel_dir, dir_entries,
+                file_entries); defaults to a gitignore-aware walk skipping
+                dot folders and DEFAULT_SKIP_DIRS
+            max_workers: Worker processes, default one per CPU; 0 or 1
+                analyzes in-process
+        """
+        self.max_line_length = max_line_length
+        self.max_function_length = max_function_length
+        self.max_params = max_params
+        self.walk = walk or self._default_walk
+        self.max_workers = max_workers
+        # Full path -> ((inode, mtime_ns, size), digest, issue records)
+        self._results: Dict[str, Tuple[Tuple[int, int, int], str,
+                                       List[IssueRecord]]] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def _default_walk(directory: str):
+        return IgnoreMatcher(directory).walk(
+            skip_dir=lambda name: name.startswith(".") or name in DEFAULT_SKIP_DIRS,
+            skip_file=lambda name: name.startswith("."))
+
+    @property
+    def settings(self) -> Dict[str, int]:
+        return {
+            "max_line_length": self.max_line_length,
+            "max_function_length": self.max_function_length,
+            "max_params": self.max_params,
+        }
 
-    def __init__(self):
-        self.max_line_length = 100
-        self.max_function_length = 50
-        self.max_params = 5
+    def close(self) -> None:
+        """Shut down the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
 
     def analyze_directory(self,
                           directory: str,
                           file_pattern: str = None) -> List[CodeIssue]:
         """Analyze all code files in a directory."""
-        issues = []
-
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file_pattern and not re.match(file_pattern, file):
+        return list(self.iter_issues(directory, file_pattern))
+
+    def iter_issues(self,
+                    directory: str,
+                    file_pattern: str = None) -> Iterator[CodeIssue]:
+        """Yield issues of all code files in a directory as they are found.
+
+        Cached results come first; the rest follow batch by batch as the
+        workers finish, so issues are grouped per file but files are not in
+        walk order.
+        """
+        jobs: List[AnalysisJob] = []
+        keys: Dict[str, Tuple[int, int, int]] = {}
+        previous: Dict[str, List[IssueRecord]] = {}
+        seen = set()
+        for rel_dir, _, file_entries in self.walk(directory):
+            for entry in file_entries:
+                if file_pattern and not re.match(file_pattern, entry.name):
                     continue
-
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, directory)
-
                 # Skip non-code files
-                if not self._is_code_file(file):
+                if not self._is_code_file(entry.name):
                     continue
-
                 try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-
-                    # Analyze based on file type
-                    if file.endswith(".py"):
-                        issues.extend(
-                            self._analyze_python_file(relative_path, content))
-                    elif file.endswith(".js"):
-                        issues.extend(
-                            self._analyze_javascript_file(
-                                relative_path, content))
-                    else:
-                        issues.extend(
-                            self._analyze_generic_file(relative_path, content))
-                except Exception as e:
-                    print(f"Error analyzing {file_path}: {str(e)}")
+                    st = entry.stat()
+                except OSError:
+                    continue
 
-        return issues
+                full_path = os.path.abspath(entry.path)
+                relative_path = os.path.join(rel_dir, entry.name)
+                key = (st.st_ino, st.st_mtime_ns, st.st_size)
+                seen.add(full_path)
+                with self._lock:
+                    cached = self._results.get(full_path)
+                if cached and cached[0] == key:
+                    yield from self._relocate(cached[2], relative_path)
+                    continue
+                keys[full_path] = key
+                if cached:
+                    previous[full_path] = cached[2]
+                jobs.append((full_path, relative_path,
+                             cached[1] if cached else None))
+
+        # Forget files removed from this directory
+        prefix = os.path.join(os.path.abspath(directory), "")
+        with self._lock:
+            for path in [p for p in self._results
+                         if p.startswith(prefix) and p not in seen]:
+                del self._results[path]
+
+        relative_paths = {job[0]: job[1] for job in jobs}
+        for full_path, digest, issues in self._run(jobs):
+            if issues is None:
+                issues = previous[full_path]
+            with self._lock:
+                self._results[full_path] = (keys[full_path], digest, issues)
+                while len(self._results) > self.MAX_CACHED_FILES:
+                    del self._results[next(iter(self._results))]
+            yield from self._relocate(issues, relative_paths[full_path])
+
+    @staticmethod
+    def _relocate(records: List[IssueRecord],
+                  relative_path: str) -> Iterator[CodeIssue]:
+        """Issues from cached records, with the current relative path"""
+        for record in records:
+            yield CodeIssue(relative_path, *record)
+
+    def _run(self, jobs: List[AnalysisJob]
+             ) -> Iterator[Tuple[str, str, Optional[List[IssueRecord]]]]:
+        """Analyze jobs, in worker processes when there are enough"""
+        workers = (self.max_workers if self.max_workers is not None else
+                   os.cpu_count() or 1)
+        if workers <= 1 or len(jobs) < self.MIN_PARALLEL_FILES:
+            for i in range(0, len(jobs), self.BATCH_SIZE):
+                yield from _analyze_batch(self.settings,
+                                          jobs[i:i + self.BATCH_SIZE])
+            return
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        futures = [
+            self._pool.submit(_analyze_batch, self.settings,
+                              jobs[i:i + self.BATCH_SIZE])
+            for i in range(0, len(jobs), self.BATCH_SIZE)
+        ]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            # The caller may stop early
+            for future in futures:
+                future.cancel()
+
+    def _analyze_content(self, file_path: str,
+                         content: str) -> List[CodeIssue]:
+        """Analyze a file's content based on its type."""
+        if file_path.endswith(".py"):
+            return self._analyze_python_file(file_path, content)
+        if file_path.endswith(".js"):
+            return self._analyze_javascript_file(file_path, content)
+        return self._analyze_generic_file(file_path, content)
 
     def _is_code_file(self, filename: str) -> bool:
         """Check if a file is a code file based on extension."""
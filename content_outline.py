@@ -0,0 +1,183 @@
+"""Outline-based truncation that keeps the structure of source files."""
+
+# pylama:ignore=E501,C901
+import re
+from typing import Callable, List, Optional
+
+# Declarations and imports across the languages we commonly see
+STRUCTURE_PATTERN = re.compile(
+    r"^\s*(?:"
+    r"@[\w.]+"
+    r"|(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:def|class|function|interface|struct|enum|impl|trait|fn|func|module|namespace|type)\b"
+    r"|(?:public|private|protected|internal|static|abstract|final)\s"
+    r"|(?:export\s+)?(?:const|let|var)\s+\w+\s*=\s*(?:async\s+)?(?:\([^)]*\)|\w+)\s*=>"
+    r"|(?:import|from|#include|using|package|require|use)\b"
+    r")")
+DOC_PATTERN = re.compile(r'^\s*(?:"""|\'\'\'|/\*\*|\*|#|//)')
+
+ELISION_TEMPLATE = "{indent}... ({count} lines elided) ..."
+
+# Priority levels; lower is kept first
+STRUCTURE = 0
+RELEVANT = 1
+BODY_BASE = 2
+MAX_LEVEL = 8
+DOC_LINES_AFTER_SIGNATURE = 3
+QUERY_CONTEXT_LINES = 2
+
+
+class OutlineTruncator:
+    """Shrink text to a token budget by eliding bodies, not sampling lines.
+
+    Every line gets a priority: declarations and imports first, then
+    docstrings and lines around query matches, then bodies by nesting depth.
+    The deepest priority level that fits is found with one linear pass per
+    level (at most MAX_LEVEL + 2 passes), and dropped runs of lines collapse
+    into a single elision marker.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int]):
+        self.count_tokens = count_tokens
+        self.marker_tokens = max(1, count_tokens(
+            ELISION_TEMPLATE.format(indent="    ", count=1000)))
+
+    @staticmethod
+    def _indent_width(line: str) -> int:
+        expanded = line.expandtabs(4)
+        return len(expanded) - len(expanded.lstrip(" "))
+
+    def _priorities(self, lines: List[str],
+                    query_terms: List[str]) -> List[int]:
+        widths = [self._indent_width(line) if line.strip() else -1
+                  for line in lines]
+        unit = min((w for w in widths if w > 0), default=4)
+
+        priorities = []
+        docs_left = 0
+        for line, width in zip(lines, widths):
+            if width < 0:
+                priorities.append(MAX_LEVEL)
+                continue
+            if STRUCTURE_PATTERN.match(line):
+                priorities.append(STRUCTURE)
+                docs_left = DOC_LINES_AFTER_SIGNATURE
+                continue
+            if docs_left and DOC_PATTERN.match(line):
+                priorities.append(RELEVANT)
+                docs_left -= 1
+                continue
+            docs_left = 0
+            priorities.append(min(MAX_LEVEL, BODY_BASE + width // unit))
+
+        # Blank lines go with the line that follows them, so kept blocks
+        # stay separated without producing one-line elisions
+        following = MAX_LEVEL
+        for i in range(len(lines) - 1, -1, -1):
+            if widths[i] < 0:
+                priorities[i] = following
+            else:
+                following = priorities[i]
+
+        if query_terms:
+            for i, line in enumerate(lines):
+                lower = line.lower()
+                if any(term in lower for term in query_terms):
+                    for j in range(max(0, i - QUERY_CONTEXT_LINES),
+                                   min(len(lines), i + QUERY_CONTEXT_LINES + 1)):
+                        priorities[j] = min(priorities[j], RELEVANT)
+        return priorities
+
+    def _cost(self, keep: List[bool], costs: List[int]) -> int:
+        total = 0
+        in_gap = False
+        for kept, cost in zip(keep, costs):
+            if kept:
+                total += cost
+                in_gap = False
+            elif not in_gap:
+                total += self.marker_tokens
+                in_gap = True
+        return total
+
+    def truncate(self,
+                 content: str,
+                 max_tokens: int,
+                 query: Optional[str] = None) -> str:
+        """Fit content into max_tokens, preserving its outline"""
+        if self.count_tokens(content) <= max_tokens:
+            return content
+
+        lines = content.splitlines()
+        # +1 for the newline joining each line
+        costs = [self.count_tokens(line) + 1 for line in lines]
+        query_terms = [
+            term for term in re.findall(r"\w+", (query or "").lower())
+            if len(term) >= 3
+        ]
+        priorities = self._priorities(lines, query_terms)
+
+        # Find the deepest level whose lines all fit
+        keep = [False] * len(lines)
+        for level in range(MAX_LEVEL + 1):
+            candidate = [p <= level for p in priorities]
+            if self._cost(candidate, costs) > max_tokens:
+                break
+            keep = candidate
+
+        # Spend what is left on the next level, in file order
+        budget = max_tokens - self._cost(keep, costs)
+        next_level = min((p for p, k in zip(priorities, keep) if not k),
+                         default=None)
+        for i, (priority, cost) in enumerate(zip(priorities, costs)):
+            if budget <= 0:
+                break
+            if keep[i] or priority != next_level:
+                continue
+            # Splitting a gap adds a marker; filling a one-line gap drops one
+            prev_gap = i > 0 and not keep[i - 1]
+            next_gap = i + 1 < len(lines) and not keep[i + 1]
+            extra = cost
+            if prev_gap and next_gap:
+                extra += self.marker_tokens
+            elif not prev_gap and not next_gap:
+                extra -= self.marker_tokens
+            if extra <= budget:
+                keep[i] = True
+                budget -= extra
+
+        # Per-line costs only approximate the count of the joined text, so
+        # check the result and drop the lowest-priority kept lines (latest
+        # first) until it really fits
+        result = self._assemble(lines, keep)
+        drop_order = sorted((i for i, k in enumerate(keep) if k),
+                            key=lambda i: (priorities[i], i))
+        excess = self.count_tokens(result) - max_tokens
+        while excess > 0 and drop_order:
+            while excess > 0 and drop_order:
+                i = drop_order.pop()
+                keep[i] = False
+                excess -= costs[i]
+            result = self._assemble(lines, keep)
+            excess = self.count_tokens(result) - max_tokens
+        return result
+
+    @staticmethod
+    def _assemble(lines: List[str], keep: List[bool]) -> str:
+        """Join the kept lines, collapsing each dropped run into a marker"""
+        out: List[str] = []
+        gap = 0
+        gap_indent = ""
+        for line, kept in zip(lines, keep):
+            if kept:
+                if gap:
+                    out.append(
+                        ELISION_TEMPLATE.format(indent=gap_indent, count=gap))
+                    gap = 0
+                out.append(line)
+            else:
+                if not gap:
+                    gap_indent = line[:len(line) - len(line.lstrip())]
+                gap += 1
+        if gap:
+            out.append(ELISION_TEMPLATE.format(indent=gap_indent, count=gap))
+        return "\n".join(out)
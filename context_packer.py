@@ -0,0 +1,192 @@
+"""Token-budget-aware selection of context for LLM requests."""
+
+# pylama:ignore=E501
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+ATTACHMENT_PREFIX = "[ATTACHMENT] "
+
+
+@dataclass
+class ContextCandidate:
+    """A piece of context that may be included in a prompt."""
+
+    key: str
+    content: str
+    score: float
+    kind: str = "file"  # file, passage, symbol or attachment
+    required: bool = False
+    tokens: int = 0
+    # Filled in by the packer: the fraction of the original content kept,
+    # and whether a required candidate was kept although it does not fit
+    kept_fraction: float = field(default=1.0, compare=False)
+    over_budget: bool = field(default=False, compare=False)
+
+
+class ContextPacker:
+    """Pick the highest-value set of context candidates under a token budget.
+
+    Every candidate can be included whole, condensed to a fraction of its
+    size (through the truncate callable) or dropped. The choice is solved
+    as a multiple-choice knapsack over token costs bucketed to a bounded
+    grid, so packing stays cheap even with large budgets.
+    """
+
+    # Condensed variants offered for each candidate, as fractions of its
+    # own size and of the total budget
+    VARIANT_FRACTIONS = (0.5, 0.25)
+    # Upper bound on the number of DP cells per candidate
+    MAX_GRID = 2048
+    # Fixed per-item overhead for the "File: ...\nContent:\n" framing
+    ITEM_OVERHEAD_TOKENS = 16
+
+    def __init__(self,
+                 estimate_tokens: Callable[[str], int],
+                 truncate: Optional[Callable[[str, int], str]] = None):
+        self.estimate_tokens = estimate_tokens
+        self.truncate = truncate
+
+    def _variants(self, candidate: ContextCandidate,
+                  budget: int) -> List[Tuple[int, float, str]]:
+        """Get (tokens, value, content) options for a candidate"""
+        if not candidate.tokens:
+            candidate.tokens = self.estimate_tokens(candidate.content)
+        full = candidate.tokens + self.ITEM_OVERHEAD_TOKENS
+        variants = [(full, candidate.score, candidate.content)]
+        if self.truncate is None or candidate.tokens < 512:
+            return variants
+
+        targets = {int(candidate.tokens * f) for f in self.VARIANT_FRACTIONS}
+        targets |= {int(budget * f) for f in self.VARIANT_FRACTIONS}
+        for target in sorted(targets, reverse=True):
+            if target >= candidate.tokens or target < 256:
+                continue
+            condensed = self.truncate(candidate.content, target)
+            tokens = self.estimate_tokens(condensed) + self.ITEM_OVERHEAD_TOKENS
+            if tokens >= variants[-1][0]:
+                continue
+            # The most important parts survive condensing, so value falls
+            # off slower than size
+            kept = tokens / full
+            variants.append((tokens, candidate.score * kept**0.5, condensed))
+        return variants
+
+    def pack(self, candidates: List[ContextCandidate],
+             budget: int) -> List[ContextCandidate]:
+        """Select and condense candidates so their total cost fits budget.
+
+        Required candidates are placed first (condensed if they must be);
+        the rest of the budget is filled optimally by score. A required
+        candidate that does not fit even condensed is kept in its smallest
+        form and flagged over_budget. When everything fits whole, nothing
+        is condensed. The returned candidates keep their input order.
+        """
+        for candidate in candidates:
+            if not candidate.tokens:
+                candidate.tokens = self.estimate_tokens(candidate.content)
+        if sum(c.tokens + self.ITEM_OVERHEAD_TOKENS
+               for c in candidates) <= budget:
+            return [
+                ContextCandidate(key=c.key,
+                                 content=c.content,
+                                 score=c.score,
+                                 kind=c.kind,
+                                 required=c.required,
+                                 tokens=c.tokens) for c in candidates
+            ]
+
+        remaining = budget
+        chosen: Dict[int, Tuple[str, float]] = {}
+        over_budget = set()
+
+        optional = []
+        for index, candidate in enumerate(candidates):
+            variants = self._variants(candidate, budget)
+            if not candidate.required:
+                optional.append((index, variants))
+                continue
+            fitting = [v for v in variants if v[0] <= remaining]
+            tokens, _, content = fitting[0] if fitting else min(variants)
+            if not fitting:
+                over_budget.add(index)
+            chosen[index] = (content, tokens / variants[0][0])
+            remaining = max(0, remaining - tokens)
+
+        if optional and remaining > 0:
+            for index, (content, kept) in self._solve(optional,
+                                                      remaining).items():
+                chosen[index] = (content, kept)
+
+        packed = []
+        for index, candidate in enumerate(candidates):
+            if index not in chosen:
+                continue
+            content, kept = chosen[index]
+            packed.append(
+                ContextCandidate(key=candidate.key,
+                                 content=content,
+                                 score=candidate.score,
+                                 kind=candidate.kind,
+                                 required=candidate.required,
+                                 tokens=self.estimate_tokens(content),
+                                 kept_fraction=kept,
+                                 over_budget=index in over_budget))
+        return packed
+
+    def _solve(self, groups: List[Tuple[int, List[Tuple[int, float, str]]]],
+               budget: int) -> Dict[int, Tuple[str, float]]:
+        """Multiple-choice knapsack: at most one variant per group"""
+        unit = max(1, -(-budget // self.MAX_GRID))
+        capacity = budget // unit
+        # best[c] = best value using capacity c; choice[g][c] = variant index
+        best = [0.0] * (capacity + 1)
+        choices: List[List[int]] = []
+
+        for _, variants in groups:
+            weights = [-(-tokens // unit) for tokens, _, _ in variants]
+            new_best = best[:]
+            choice = [-1] * (capacity + 1)
+            for c in range(capacity + 1):
+                for v, (weight, (_, value, _)) in enumerate(
+                        zip(weights, variants)):
+                    if weight <= c and best[c - weight] + value > new_best[c]:
+                        new_best[c] = best[c - weight] + value
+                        choice[c] = v
+            best = new_best
+            choices.append(choice)
+
+        # Walk back through the groups to recover the chosen variants
+        selected: Dict[int, Tuple[str, float]] = {}
+        c = max(range(capacity + 1), key=lambda i: best[i])
+        for (index, variants), choice in zip(reversed(groups),
+                                             reversed(choices)):
+            v = choice[c]
+            if v < 0:
+                continue
+            tokens, _, content = variants[v]
+            selected[index] = (content, tokens / variants[0][0])
+            c -= -(-tokens // unit)
+        return selected
+
+
+def candidates_from_files(
+        files_content: Dict[str, str],
+        scores: Optional[Dict[str, float]] = None) -> List[ContextCandidate]:
+    """Build candidates from a path -> content mapping.
+
+    Without explicit scores, insertion order is taken as the ranking.
+    User attachments are always required.
+    """
+    candidates = []
+    for rank, (path, content) in enumerate(files_content.items()):
+        if not content:
+            continue
+        is_attachment = path.startswith(ATTACHMENT_PREFIX)
+        score = (scores or {}).get(path, 1.0 / (1 + rank))
+        candidates.append(
+            ContextCandidate(key=path,
+                             content=content,
+                             score=score,
+                             kind="attachment" if is_attachment else "file",
+                             required=is_attachment))
+    return candidates
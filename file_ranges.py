@@ -0,0 +1,129 @@
+"""Validators and byte/line range reads for serving workspace files."""
+
+# pylama:ignore=E501
+import os
+import re
+import zlib
+from typing import Iterator, Optional, Tuple
+
+STREAM_CHUNK_SIZE = 256 * 1024
+GZIP_LEVEL = 5
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong ETag from (inode, mtime_ns, size); changes whenever content can"""
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def parse_range_header(header: Optional[str],
+                       size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into an inclusive (start, end).
+
+    Returns None when there is no usable range (serve the whole file);
+    raises ValueError for ranges that cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None  # Multiple or unknown ranges: ignore, per RFC 9110
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def iter_file_range(path: str,
+                    start: int = 0,
+                    end: Optional[int] = None,
+                    chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream bytes start..end (inclusive) of a file in chunks"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(
+                chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def iter_gzip(chunks: Iterator[bytes],
+              level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Gzip a stream of chunks on the fly, without buffering it whole"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip framing
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def read_text_window(path: str,
+                     start: int,
+                     length: int,
+                     whole_lines: bool = True) -> Tuple[str, int]:
+    """Read about length bytes from start as text.
+
+    With whole_lines, the window is cut after its last newline (unless that
+    would leave it empty), so pages never split a line.
+
+    Returns:
+        (text, next_offset); next_offset is where the following page starts.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(length)
+    if whole_lines and len(data) == length:
+        cut = data.rfind(b"\n")
+        if cut >= 0:
+            data = data[:cut + 1]
+    return data.decode("utf-8", errors="replace"), start + len(data)
+
+
+def read_line_window(path: str, start_line: int,
+                     count: int) -> Tuple[str, int]:
+    """Read count lines starting at 0-based start_line.
+
+    Returns:
+        (text, byte offset just after the window).
+    """
+    lines = []
+    offset = 0
+    with open(path, "rb") as f:
+        for index, line in enumerate(f):
+            if index >= start_line + count:
+                break
+            offset += len(line)
+            if index >= start_line:
+                lines.append(line)
+    data = b"".join(lines)
+    return data.decode("utf-8", errors="replace"), offset
@@ -0,0 +1,216 @@
+"""Shared file reading with cached encoding and binary detection."""
+
+# pylama:ignore=E501
+import codecs
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# (inode, mtime_ns, size): identifies one version of a file
+FileKey = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class FileInfo:
+    """What sniffing one version of a file found."""
+
+    size: int
+    mtime: float
+    mtime_ns: int
+    ino: int
+    is_binary: bool
+    encoding: Optional[str]  # None for binary files
+
+    @property
+    def key(self) -> FileKey:
+        return self.ino, self.mtime_ns, self.size
+
+
+def file_key(st: os.stat_result) -> FileKey:
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# Control characters other than tab, LF, FF and CR
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in (9, 10, 12, 13))
+
+
+def looks_binary(sample: bytes) -> bool:
+    """Binary if the sample has NUL bytes or is over 30% control characters"""
+    if b"\x00" in sample:
+        return True
+    if not sample:
+        return False
+    control = len(sample) - len(sample.translate(None, _CONTROL_BYTES))
+    return control > 0.3 * len(sample)
+
+
+def _decode(data: bytes, encoding: str, final: bool = True) -> str:
+    """Decode strictly; with final=False a cut multi-byte tail is dropped"""
+    if final:
+        return data.decode(encoding)
+    return codecs.getincrementaldecoder(encoding)().decode(data, final=False)
+
+
+class FileReader:
+    """One place to read workspace files as text or bytes.
+
+    Each file is sniffed once per version: whether it is binary and which
+    encoding decodes it (UTF-8, else latin-1, which accepts any bytes). The
+    result is cached by path and validated against (inode, mtime_ns, size)
+    from a single fstat of the already open file, so repeated reads neither
+    re-sniff nor re-stat. Files of MMAP_THRESHOLD bytes or more are read
+    through mmap.
+    """
+
+    SNIFF_BYTES = 8192
+    MAX_ENTRIES = 4096
+    MMAP_THRESHOLD = 64 * 1024
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._infos: "OrderedDict[str, FileInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, path: str, st: os.stat_result) -> Optional[FileInfo]:
+        with self._lock:
+            info = self._infos.get(path)
+            if info is None or info.key != file_key(st):
+                return None
+            self._infos.move_to_end(path)
+            return info
+
+    def _store(self, path: str, info: FileInfo) -> FileInfo:
+        with self._lock:
+            self._infos[path] = info
+            self._infos.move_to_end(path)
+            while len(self._infos) > self.max_entries:
+                self._infos.popitem(last=False)
+        return info
+
+    def _sniff(self, path: str, st: os.stat_result,
+               sample: bytes) -> FileInfo:
+        is_binary = looks_binary(sample)
+        encoding = None
+        if not is_binary:
+            try:
+                _decode(sample, "utf-8", final=len(sample) >= st.st_size)
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "latin-1"
+        return self._store(
+            path,
+            FileInfo(st.st_size, st.st_mtime, st.st_mtime_ns, st.st_ino,
+                     is_binary, encoding))
+
+    def _info_for(self, path: str, f, st: os.stat_result) -> FileInfo:
+        info = self._cached(path, st)
+        if info is None:
+            sample = f.read(self.SNIFF_BYTES)
+            f.seek(0)
+            info = self._sniff(path, st, sample)
+        return info
+
+    def _read(self, f, size: int, start: int = 0,
+              length: Optional[int] = None) -> bytes:
+        end = size if length is None else min(size, start + length)
+        if start >= end:
+            return b""
+        if size >= self.MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[start:end]
+            except (ValueError, OSError):
+                pass  # Special files cannot be mapped; read normally
+        f.seek(start)
+        return f.read(end - start)
+
+    def _text(self, path: str, info: FileInfo, data: bytes, start: int,
+              final: bool) -> str:
+        try:
+            return _decode(data, info.encoding, final)
+        except UnicodeDecodeError:
+            if start > 0:
+                # A range may begin inside a multi-byte character
+                return data.decode(info.encoding, errors="replace")
+            # The sniffed prefix was UTF-8 but the rest is not
+            self._store(
+                path,
+                FileInfo(info.size, info.mtime, info.mtime_ns, info.ino,
+                         False, "latin-1"))
+            return data.decode("latin-1")
+
+    def sniff(self, path: str) -> FileInfo:
+        """Binary flag, encoding and stat details of a file"""
+        with open(path, "rb") as f:
+            return self._info_for(path, f, os.fstat(f.fileno()))
+
+    def is_binary(self, path: str) -> bool:
+        return self.sniff(path).is_binary
+
+    def read_bytes(self,
+                   path: str,
+                   start: int = 0,
+                   length: Optional[int] = None) -> bytes:
+        """Raw bytes of a file, or of length bytes from start"""
+        with open(path, "rb") as f:
+            return self._read(f, os.fstat(f.fileno()).st_size, start, length)
+
+    def read_text(self,
+                  path: str,
+                  start: int = 0,
+                  length: Optional[int] = None
+                  ) -> Tuple[Optional[str], FileInfo]:
+        """Text of a file, or of length bytes from start.
+
+        Returns:
+            (text, info); text is None for binary files. A multi-byte
+            character cut by the end of a range is dropped.
+        """
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            info = self._info_for(path, f, st)
+            if info.is_binary:
+                return None, info
+            data = self._read(f, st.st_size, start, length)
+        final = start + len(data) >= info.size
+        return self._text(path, info, data, start, final), info
+
+    def read_head(self, path: str,
+                  max_lines: int) -> Tuple[Optional[str], bool]:
+        """First max_lines lines of a file, without reading the rest.
+
+        Returns:
+            (text, truncated); text is None for binary files.
+        """
+        lines = []
+        truncated = False
+        with open(path, "rb") as f:
+            info = self._info_for(path, f, os.fstat(f.fileno()))
+            if info.is_binary:
+                return None, False
+            for i, line in enumerate(f):
+                if i >= max_lines:
+                    truncated = True
+                    break
+                lines.append(line)
+        return b"".join(lines).decode(info.encoding, errors="replace"), truncated
+
+    def forget(self, path: str) -> None:
+        with self._lock:
+            self._infos.pop(path, None)
+
+
+_reader: Optional[FileReader] = None
+_reader_lock = threading.Lock()
+
+
+def get_file_reader() -> FileReader:
+    """Get the reader shared by every subsystem, so they share its cache"""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = FileReader()
+        return _reader
@@ -0,0 +1,163 @@
+"""Background computation of recursive folder sizes, cached by mtime."""
+
+# pylama:ignore=E501
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# (path, skip_ignored)
+SizeKey = Tuple[str, bool]
+# Called with (path, size, files, error)
+SizeCallback = Callable[[str, int, int, Optional[str]], None]
+
+
+class FolderSizeCache:
+    """Recursive size and file count of folders, computed off the request path.
+
+    Results are cached per folder and reused while the folder's own mtime
+    is unchanged and the entry is younger than MAX_AGE (changes deep inside
+    a folder do not touch its mtime). Scans use os.scandir without following
+    symlinks and call pause every YIELD_EVERY entries, so a cooperative
+    server (eventlet) keeps serving requests while large trees are scanned.
+    Both the cache and the queue of waiting scans are bounded: the least
+    recently used sizes and the oldest waiting scans are dropped.
+    """
+
+    MAX_AGE = 600  # Seconds a cached size is trusted
+    YIELD_EVERY = 256  # Entries scanned between pauses
+    MAX_ENTRIES = 4096  # Cached folder sizes
+    MAX_QUEUED = 256  # Scans waiting to start
+
+    def __init__(self,
+                 skip_names: Optional[Set[str]] = None,
+                 max_workers: int = 2,
+                 pause: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            skip_names: Folder names left out when skip_ignored is requested
+            max_workers: Folders scanned at once
+            pause: Called periodically during scans to yield to other work
+        """
+        self.skip_names = skip_names or set()
+        self.pause = pause
+        self._cache: "OrderedDict[SizeKey, Tuple[int, float, int, int]]" = OrderedDict()
+        # Callbacks of queued and running scans
+        self._waiters: Dict[SizeKey, List[SizeCallback]] = {}
+        self._queued: "OrderedDict[SizeKey, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get(self,
+            path: str,
+            skip_ignored: bool = True) -> Optional[Tuple[int, int]]:
+        """Get a cached (size, files) if still valid, else None"""
+        with self._lock:
+            cached = self._cache.get((path, skip_ignored))
+            if cached is not None:
+                self._cache.move_to_end((path, skip_ignored))
+        if cached is None:
+            return None
+        mtime_ns, computed_at, size, files = cached
+        if time.time() - computed_at > self.MAX_AGE:
+            return None
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return None
+        except OSError:
+            return None
+        return size, files
+
+    def compute(self, path: str, skip_ignored: bool = True) -> Tuple[int, int]:
+        """Scan a folder for (total size in bytes, file count)"""
+        size = 0
+        files = 0
+        scanned = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        scanned += 1
+                        if self.pause and scanned % self.YIELD_EVERY == 0:
+                            self.pause()
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not (skip_ignored
+                                        and entry.name in self.skip_names):
+                                    stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                size += entry.stat(
+                                    follow_symlinks=False).st_size
+                                files += 1
+                        except OSError:
+                            continue
+            except OSError:
+                # Unreadable subfolders are skipped; only the root must open
+                if current == path:
+                    raise
+        return size, files
+
+    def _run(self, key: SizeKey) -> None:
+        path, skip_ignored = key
+        with self._lock:
+            self._queued.pop(key, None)
+        error = None
+        size = files = 0
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            size, files = self.compute(path, skip_ignored)
+            with self._lock:
+                self._cache[key] = (mtime_ns, time.time(), size, files)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.MAX_ENTRIES:
+                    self._cache.popitem(last=False)
+        except OSError as e:
+            error = str(e)
+
+        with self._lock:
+            callbacks = self._waiters.pop(key, [])
+        self._notify(callbacks, path, size, files, error)
+
+    @staticmethod
+    def _notify(callbacks: List[SizeCallback], path: str, size: int,
+                files: int, error: Optional[str]) -> None:
+        for callback in callbacks:
+            try:
+                callback(path, size, files, error)
+            except Exception as e:
+                print(f"Folder size callback failed for {path}: {e}")
+
+    def request(self,
+                paths: Iterable[str],
+                callback: Optional[SizeCallback] = None,
+                skip_ignored: bool = True) -> None:
+        """Compute sizes in the background, calling back as each finishes.
+
+        Without a callback the sizes are only cached for later get calls.
+        A folder already queued or being scanned is not scanned again; the
+        callback joins that scan. Beyond MAX_QUEUED waiting scans the
+        oldest is dropped and its callbacks get an error.
+        """
+        dropped: List[Tuple[str, List[SizeCallback]]] = []
+        for path in paths:
+            key = (path, skip_ignored)
+            with self._lock:
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    if callback is not None:
+                        waiters.append(callback)
+                    continue
+                self._waiters[key] = [callback] if callback is not None else []
+                while len(self._queued) >= self.MAX_QUEUED:
+                    old_key, future = self._queued.popitem(last=False)
+                    if future.cancel():
+                        dropped.append(
+                            (old_key[0], self._waiters.pop(old_key, [])))
+                self._queued[key] = self._executor.submit(self._run, key)
+        for old_path, callbacks in dropped:
+            self._notify(callbacks, old_path, 0, 0,
+                         "Size request dropped: too many pending")
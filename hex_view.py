@@ -0,0 +1,92 @@
+"""Paged hex dumps of binary files."""
+
+# pylama:ignore=E501
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+ROW_BYTES = 16
+_HEX_ROW_WIDTH = ROW_BYTES * 3 - 1  # "xx " per byte, no trailing space
+
+# Maps every byte to itself if printable ASCII, else to "."
+_PRINTABLE = bytes(b if 32 <= b < 127 else ord(".") for b in range(256))
+
+
+def format_hex_rows(data: bytes, base_offset: int = 0) -> List[str]:
+    """Hex dump rows of data: address, 16 hex bytes and their ASCII.
+
+    The hex and ASCII columns are built for the whole buffer at once with
+    bytes.hex and bytes.translate; rows are then slices of those strings.
+    """
+    hex_text = data.hex(" ")
+    ascii_text = data.translate(_PRINTABLE).decode("ascii")
+    rows = []
+    for start in range(0, len(data), ROW_BYTES):
+        hex_row = hex_text[start * 3:start * 3 + _HEX_ROW_WIDTH]
+        rows.append(
+            f"{base_offset + start:08x}:  {hex_row:<{_HEX_ROW_WIDTH}}  |{ascii_text[start:start + ROW_BYTES]}|"
+        )
+    return rows
+
+
+class HexViewer:
+    """Hex pages of any region of a file, read through mmap and cached.
+
+    Offsets are aligned down to whole rows. Formatted pages are cached per
+    (path, inode, mtime_ns, size, offset, length), so paging back and forth
+    reformats nothing.
+    """
+
+    PAGE_BYTES = 4096
+    MAX_PAGE_BYTES = 64 * 1024
+    MAX_PAGES = 64
+
+    def __init__(self):
+        self._pages: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page(self,
+             path: str,
+             offset: int = 0,
+             length: int = PAGE_BYTES) -> Dict[str, Any]:
+        """Hex dump of length bytes from offset.
+
+        Returns:
+            Dictionary with the aligned offset, the rows, the file size and
+            the offset of the next page (None at the end of the file)
+        """
+        offset = max(0, offset) // ROW_BYTES * ROW_BYTES
+        length = max(ROW_BYTES, min(length, self.MAX_PAGE_BYTES))
+        # Whole rows only, so next_offset starts a row and pages never overlap
+        length = -(-length // ROW_BYTES) * ROW_BYTES
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            key = (os.path.abspath(path), st.st_ino, st.st_mtime_ns,
+                   st.st_size, offset, length)
+            with self._lock:
+                cached = self._pages.get(key)
+                if cached is not None:
+                    self._pages.move_to_end(key)
+                    return cached
+
+            end = min(st.st_size, offset + length)
+            if offset >= end:
+                data = b""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[offset:end]
+
+        page = {
+            "offset": offset,
+            "length": len(data),
+            "file_size": st.st_size,
+            "rows": format_hex_rows(data, offset),
+            "next_offset": end if end < st.st_size else None,
+        }
+        with self._lock:
+            self._pages[key] = page
+            while len(self._pages) > self.MAX_PAGES:
+                self._pages.popitem(last=False)
+        return page
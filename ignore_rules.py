@@ -0,0 +1,295 @@
+"""Gitignore rule engine with per-directory scoping and compiled matchers."""
+
+# pylama:ignore=E501,C901
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
+
+
+@dataclass
+class IgnoreRule:
+    """A single parsed gitignore rule."""
+
+    pattern: str
+    regex: str
+    negated: bool
+    dir_only: bool
+
+
+def _translate_glob(glob: str) -> str:
+    """Translate a gitignore glob (without leading/trailing slash) to a regex body"""
+    out = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == "*":
+            if glob[i:i + 2] == "**":
+                at_start = i == 0 or glob[i - 1] == "/"
+                at_end = i + 2 == n or glob[i + 2] == "/"
+                if at_start and at_end:
+                    if i + 2 == n:
+                        # Trailing "**" matches everything inside
+                        out.append(".*")
+                        i += 2
+                    else:
+                        # "**/" matches zero or more directories
+                        out.append("(?:.*/)?")
+                        i += 3
+                    continue
+                # "**" not surrounded by slashes behaves like "*"
+                out.append("[^/]*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and glob[j] in "!^":
+                j += 1
+            if j < n and glob[j] == "]":
+                j += 1
+            while j < n and glob[j] != "]":
+                j += 1
+            if j >= n:
+                out.append(re.escape(c))
+            else:
+                body = glob[i + 1:j]
+                if body[:1] in "!^":
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(glob[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_rule(line: str) -> Optional[IgnoreRule]:
+    """Parse one line of a .gitignore file, returning None for blanks and comments"""
+    line = line.rstrip("\n").rstrip("\r")
+    # Trailing spaces are ignored unless escaped
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+    if not line or line.startswith("#"):
+        return None
+
+    negated = False
+    if line.startswith("!"):
+        negated = True
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # A slash anywhere but the end anchors the pattern to the .gitignore directory
+    anchored = "/" in line
+    glob = line.lstrip("/")
+    body = _translate_glob(glob)
+    regex = body if anchored else f"(?:.*/)?{body}"
+    return IgnoreRule(pattern=line,
+                      regex=regex,
+                      negated=negated,
+                      dir_only=dir_only)
+
+
+class IgnoreRuleSet:
+    """Rules from one source, compiled into a few combined regexes.
+
+    Consecutive rules of the same polarity are merged into a single
+    alternation, so matching a path costs one regex call per polarity run
+    rather than one per pattern. Runs are evaluated last-to-first; the first
+    run that matches decides, which preserves gitignore's "last rule wins".
+    """
+
+    def __init__(self, rules: List[IgnoreRule]):
+        self.rules = rules
+        self._file_runs = self._compile_runs(
+            [r for r in rules if not r.dir_only])
+        self._dir_runs = self._compile_runs(rules)
+
+    @staticmethod
+    def _compile_runs(
+            rules: List[IgnoreRule]) -> List[Tuple[bool, Pattern[str]]]:
+        runs: List[Tuple[bool, List[str]]] = []
+        for rule in rules:
+            if runs and runs[-1][0] == rule.negated:
+                runs[-1][1].append(rule.regex)
+            else:
+                runs.append((rule.negated, [rule.regex]))
+        compiled = [(negated, re.compile("^(?:" + "|".join(f"(?:{r})"
+                                                           for r in regexes) +
+                                          ")$", re.DOTALL))
+                    for negated, regexes in runs]
+        compiled.reverse()
+        return compiled
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """Return True if ignored, False if re-included, None if no rule applies"""
+        for negated, regex in (self._dir_runs if is_dir else self._file_runs):
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    @classmethod
+    def from_lines(cls, lines) -> "IgnoreRuleSet":
+        rules = []
+        for line in lines:
+            rule = parse_rule(line)
+            if rule:
+                rules.append(rule)
+        return cls(rules)
+
+    @classmethod
+    def from_file(cls, path: str) -> "IgnoreRuleSet":
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return cls.from_lines(f)
+        except OSError:
+            return cls([])
+
+
+EMPTY_RULES = IgnoreRuleSet([])
+
+
+class IgnoreMatcher:
+    """Gitignore matcher for one workspace, scoped per directory.
+
+    Each directory's own .gitignore is loaded lazily and cached by mtime.
+    Deeper .gitignore files take precedence over shallower ones, and the
+    optional global rules (the workspace root .gitignore) apply last.
+    """
+
+    def __init__(self, root: str, global_rules: IgnoreRuleSet = EMPTY_RULES):
+        self.root = os.path.abspath(root)
+        self.global_rules = global_rules
+        self._dir_rules: Dict[str, Tuple[float, IgnoreRuleSet]] = {}
+        self._lock = threading.Lock()
+        self._info_exclude = IgnoreRuleSet.from_file(
+            os.path.join(self.root, ".git", "info", "exclude"))
+
+    def rules_for(self, rel_dir: str) -> IgnoreRuleSet:
+        """Get the rules defined by the .gitignore in rel_dir ("" for root)"""
+        path = os.path.join(self.root, rel_dir, ".gitignore")
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            with self._lock:
+                self._dir_rules.pop(rel_dir, None)
+            return EMPTY_RULES
+
+        with self._lock:
+            cached = self._dir_rules.get(rel_dir)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        rules = IgnoreRuleSet.from_file(path)
+        with self._lock:
+            self._dir_rules[rel_dir] = (mtime, rules)
+        return rules
+
+    def chain_for(self, rel_dir: str) -> List[Tuple[str, IgnoreRuleSet]]:
+        """Get (base_dir, rules) pairs applying inside rel_dir, deepest first"""
+        rel_dir = rel_dir.replace("\\", "/").strip("/")
+        if rel_dir in ("", "."):
+            parts = []
+        else:
+            parts = rel_dir.split("/")
+        chain = []
+        for depth in range(len(parts), -1, -1):
+            base = "/".join(parts[:depth])
+            rules = self.rules_for(base)
+            if rules:
+                chain.append((base, rules))
+        if self._info_exclude:
+            chain.append(("", self._info_exclude))
+        if self.global_rules:
+            chain.append(("", self.global_rules))
+        return chain
+
+    @staticmethod
+    def match_chain(chain: List[Tuple[str, IgnoreRuleSet]], rel_path: str,
+                    is_dir: bool) -> bool:
+        """Check a workspace-relative path against a precomputed rule chain"""
+        for base, rules in chain:
+            local = rel_path[len(base) + 1:] if base else rel_path
+            verdict = rules.match(local, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        """Check whether a workspace-relative path is ignored.
+
+        Ancestor directories are not checked; callers walking the tree are
+        expected to prune ignored directories, as git does.
+        """
+        rel_path = rel_path.replace("\\", "/").strip("/")
+        if not rel_path or rel_path == ".":
+            return False
+        chain = self.chain_for(os.path.dirname(rel_path))
+        return self.match_chain(chain, rel_path, is_dir)
+
+    def walk(
+        self,
+        rel_dir: str = "",
+        skip_dir=None,
+        skip_file=None,
+    ) -> Iterator[Tuple[str, List[os.DirEntry], List[os.DirEntry]]]:
+        """Walk the workspace top-down, pruning ignored subtrees.
+
+        Yields (rel_dir, dir_entries, file_entries) like os.walk, but with
+        DirEntry objects. Removing entries from dir_entries prunes them.
+        skip_dir/skip_file are optional predicates on the entry name.
+        """
+        start = rel_dir.replace("\\", "/").strip("/")
+        stack = [(start, self.chain_for(start))]
+        while stack:
+            current, chain = stack.pop()
+            dirs: List[os.DirEntry] = []
+            files: List[os.DirEntry] = []
+            try:
+                with os.scandir(os.path.join(self.root, current)) as it:
+                    for entry in it:
+                        rel = f"{current}/{entry.name}" if current else entry.name
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            continue
+                        if is_dir:
+                            if skip_dir and skip_dir(entry.name):
+                                continue
+                            if self.match_chain(chain, rel, True):
+                                continue
+                            dirs.append(entry)
+                        else:
+                            if skip_file and skip_file(entry.name):
+                                continue
+                            if self.match_chain(chain, rel, False):
+                                continue
+                            files.append(entry)
+            except OSError:
+                continue
+
+            yield current, dirs, files
+
+            for entry in reversed(dirs):
+                child = f"{current}/{entry.name}" if current else entry.name
+                # Children inherit the parent chain; only their own
+                # .gitignore needs a stat
+                rules = self.rules_for(child)
+                stack.append((child, [(child, rules)] + chain if rules else chain))
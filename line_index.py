@@ -0,0 +1,229 @@
+"""Sparse line-offset indexes for random access into large text files."""
+
+# pylama:ignore=E501
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Callable, Optional, Tuple
+
+INDEX_MAGIC = b"LIDX\x01"
+# stride, line_count, file size, mtime_ns, inode, path length
+_HEADER = struct.Struct("<QQQQQI")
+
+
+class LineIndex:
+    """Byte offset of every stride-th line of one file version.
+
+    offsets[k] is where line k * stride starts, so any line is reached by
+    one seek plus a scan over fewer than stride lines.
+    """
+
+    __slots__ = ("path", "stride", "line_count", "size", "mtime_ns", "ino",
+                 "offsets")
+
+    def __init__(self, path: str, stride: int, line_count: int, size: int,
+                 mtime_ns: int, ino: int, offsets: array):
+        self.path = path
+        self.stride = stride
+        self.line_count = line_count
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        self.offsets = offsets
+
+    def matches(self, st: os.stat_result) -> bool:
+        """Whether the index still describes the file behind st"""
+        return (st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+                and st.st_ino == self.ino)
+
+
+def build_line_index(path: str,
+                     stride: int,
+                     read_size: int = 1024 * 1024,
+                     pause: Optional[Callable[[], None]] = None) -> LineIndex:
+    """Index a file in one streaming pass.
+
+    Newlines are located with bytes.split and accumulate, so the pass runs
+    at C speed instead of looping over lines in Python.
+    """
+    st = os.stat(path)
+    offsets = array("Q", [0])
+    newlines = 0  # Newlines before the current chunk
+    base = 0  # Byte offset of the current chunk
+    last_byte = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(read_size)
+            if not chunk:
+                break
+            pieces = chunk.split(b"\n")
+            found = len(pieces) - 1
+            if found:
+                # Start (relative to the chunk) of each line after a newline
+                starts = list(
+                    accumulate(map((1).__add__, map(len, pieces[:-1]))))
+                # Line newlines + i + 1 starts at starts[i]; keep multiples
+                first = (-(newlines + 1)) % stride
+                offsets.extend(map(base.__add__, starts[first::stride]))
+            newlines += found
+            base += len(chunk)
+            last_byte = chunk[-1:]
+            if pause:
+                pause()
+
+    line_count = newlines + (1 if last_byte not in (b"", b"\n") else 0)
+    # A trailing newline does not start another line
+    while len(offsets) > 1 and offsets[-1] >= base:
+        offsets.pop()
+    return LineIndex(os.path.abspath(path), stride, line_count, base,
+                     st.st_mtime_ns, st.st_ino, offsets)
+
+
+class LineIndexStore:
+    """Line indexes for large files, persisted in one metadata directory.
+
+    Indexes are built on first use, written next to the other workspace
+    metadata and kept in a small in-memory LRU. A persisted index is only
+    used while the file's inode, mtime and size are unchanged. Line windows
+    are read through mmap: one seek to the nearest indexed line, then a scan
+    over at most stride lines.
+    """
+
+    STRIDE = 1000  # Lines between recorded offsets
+    MEMORY_ENTRIES = 32
+    INDEX_SUFFIX = ".idx"
+
+    def __init__(self,
+                 index_dir: str,
+                 stride: int = STRIDE,
+                 pause: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            index_dir: Directory holding one index file per indexed file
+            stride: Lines between recorded offsets
+            pause: Called between read chunks while building an index
+        """
+        self.index_dir = index_dir
+        self.stride = stride
+        self.pause = pause
+        self._memory: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _index_path(self, path: str) -> str:
+        digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, digest + self.INDEX_SUFFIX)
+
+    def _load(self, path: str) -> Optional[LineIndex]:
+        try:
+            with open(self._index_path(path), "rb") as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                (stride, line_count, size, mtime_ns, ino,
+                 path_len) = _HEADER.unpack(f.read(_HEADER.size))
+                if f.read(path_len).decode("utf-8") != path:
+                    return None  # Hash collision
+                offsets = array("Q")
+                offsets.frombytes(f.read())
+        except (OSError, struct.error, ValueError):
+            return None
+        return LineIndex(path, stride, line_count, size, mtime_ns, ino,
+                         offsets)
+
+    def _save(self, index: LineIndex) -> None:
+        """Write an index atomically"""
+        target = self._index_path(index.path)
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        encoded_path = index.path.encode("utf-8")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_MAGIC)
+                f.write(
+                    _HEADER.pack(index.stride, index.line_count, index.size,
+                                 index.mtime_ns, index.ino,
+                                 len(encoded_path)))
+                f.write(encoded_path)
+                index.offsets.tofile(f)
+            os.replace(tmp_path, target)
+        except OSError as e:
+            print(f"Failed to write line index for {index.path}: {e}")
+
+    def get(self, path: str) -> LineIndex:
+        """The current index of a file, loading or building it as needed"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            index = self._memory.get(path)
+            if index is not None and index.matches(st):
+                self._memory.move_to_end(path)
+                return index
+
+        index = self._load(path)
+        if index is None or not index.matches(st) or index.stride != self.stride:
+            index = build_line_index(path, self.stride, pause=self.pause)
+            self._save(index)
+
+        with self._lock:
+            self._memory[path] = index
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+        return index
+
+    def read_lines(self, path: str, start_line: int,
+                   count: int) -> Tuple[bytes, int, int]:
+        """Read count lines starting at 0-based start_line.
+
+        Returns:
+            (raw bytes, byte offset just after them, total line count)
+        """
+        index = self.get(path)
+        block = start_line // index.stride
+        if index.size == 0 or block >= len(index.offsets):
+            return b"", index.size, index.line_count
+
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0,
+                                              access=mmap.ACCESS_READ) as mm:
+            start = index.offsets[block]
+            for _ in range(start_line - block * index.stride):
+                newline = mm.find(b"\n", start)
+                if newline < 0:
+                    return b"", index.size, index.line_count
+                start = newline + 1
+            end = start
+            for _ in range(count):
+                newline = mm.find(b"\n", end)
+                if newline < 0:
+                    end = index.size
+                    break
+                end = newline + 1
+            return mm[start:end], end, index.line_count
+
+    def forget(self, prefix: str) -> None:
+        """Drop indexes of files under a directory, in memory and on disk"""
+        prefix = os.path.abspath(prefix) + os.sep
+        with self._lock:
+            for path in [p for p in self._memory if p.startswith(prefix)]:
+                del self._memory[path]
+        try:
+            names = os.listdir(self.index_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(self.INDEX_SUFFIX):
+                continue
+            index_path = os.path.join(self.index_dir, name)
+            try:
+                with open(index_path, "rb") as f:
+                    f.seek(len(INDEX_MAGIC))
+                    path_len = _HEADER.unpack(f.read(_HEADER.size))[-1]
+                    path = f.read(path_len).decode("utf-8", errors="replace")
+                if path.startswith(prefix):
+                    os.remove(index_path)
+            except (OSError, struct.error):
+                continue
@@ -0,0 +1,562 @@
+"""Server-side Markdown (GFM subset) rendering with cached blocks."""
+
+# pylama:ignore=E501,C901
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+_FENCE = re.compile(r"^( {0,3})(`{3,}|~{3,})([^`]*)$")
+_ATX = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$")
+_HR = re.compile(r"^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$")
+_SETEXT = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+_LIST_ITEM = re.compile(r"^( {0,3})([-*+]|\d{1,9}[.)])([ \t]+|$)")
+_QUOTE = re.compile(r"^ {0,3}> ?")
+_TABLE_DELIMITER = re.compile(r"^ {0,3}\|?[ \t]*:?-+:?[ \t]*(\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$")
+_TASK = re.compile(r"^\[([ xX])\][ \t]+")
+_CELL_SPLIT = re.compile(r"(?<!\\)\|")
+
+_CODE_SPAN = re.compile(r"(`+)(.+?)(?<!`)\1(?!`)", re.S)
+_ESCAPE = re.compile(r"\\([!-/:-@\[-`{-~])")
+# The (destination "title") after a link's "]". The destination is either
+# <bracketed> or may hold one level of balanced parentheses; it stops at an
+# unbalanced "(" and the title at the next quote, so a failed match never
+# scans far
+_LINK_TAIL = re.compile(r"\(\s*(?:&lt;((?:[^\n&]|&(?!lt;|gt;))*)&gt;|((?:[^\s()]|\([^\s()]*\))+))(?:\s+&quot;((?:[^&\n]|&(?!quot;))*)&quot;)?\s*\)")
+_AUTOLINK = re.compile(r"&lt;((?:https?://|mailto:)(?:[^\s\x00&]|&(?!lt;|gt;))+)&gt;")
+_BARE_URL = re.compile(r"(?<![\w/\x00])https?://(?:[^\s&\x00]|&amp;)+")
+_DELIMITER_RUN = re.compile(r"\*+|_+|~+")
+_WORD_CHAR = re.compile(r"\w")
+_PLACEHOLDER = re.compile(r"\x00(\d+)\x00")
+_URL_SCHEME = re.compile(r"^[a-z][a-z0-9+.-]*:")
+_SAFE_SCHEMES = ("http:", "https:", "mailto:")
+_URL_EDGE_CONTROLS = re.compile(r"^[\x00-\x20]+|[\x00-\x20]+$")
+_URL_EMBEDDED_WHITESPACE = re.compile(r"[\t\n\r]")
+
+# (kind, first line, end line) of one top-level block
+Block = Tuple[str, int, int]
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+def _starts_block(line: str) -> bool:
+    """Whether a line interrupts a paragraph"""
+    if _FENCE.match(line) or _ATX.match(line) or _HR.match(line) or _QUOTE.match(line):
+        return True
+    item = _LIST_ITEM.match(line)
+    # Only non-empty items, and ordered lists starting at 1, interrupt
+    return bool(item and line[item.end():].strip()
+                and (item.group(2)[0] in "-*+" or item.group(2)[:-1] == "1"))
+
+
+def _closes_fence(line: str, marker: str) -> bool:
+    stripped = line.strip()
+    return (_indent(line) <= 3 and len(stripped) >= len(marker)
+            and stripped == marker[0] * len(stripped))
+
+
+def _list_end(lines: List[str], i: int) -> int:
+    """End of the list starting at line i.
+
+    Blank lines stay in the list when an item or an indented line follows.
+    """
+    n = len(lines)
+    i += 1
+    while i < n:
+        line = lines[i]
+        if not line.strip():
+            j = i + 1
+            while j < n and not lines[j].strip():
+                j += 1
+            if j < n and (_indent(lines[j]) >= 2 or (_LIST_ITEM.match(lines[j]) and not _HR.match(lines[j]))):
+                i = j
+                continue
+            break
+        if _indent(line) >= 2 or (_LIST_ITEM.match(line) and not _HR.match(line)):
+            i += 1
+        elif _starts_block(line):
+            break
+        else:
+            i += 1  # Lazy continuation of the last item
+    return i
+
+
+def split_blocks(lines: List[str]) -> List[Block]:
+    """Top-level blocks of Markdown lines (without line endings).
+
+    Where a block ends depends only on the lines up to the start of the
+    next block, so in a growing text every block but the last is final.
+    """
+    blocks = []
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        start = i
+        fence = _FENCE.match(line)
+        if fence:
+            kind = "fence"
+            i += 1
+            while i < n and not _closes_fence(lines[i], fence.group(2)):
+                i += 1
+            i = min(i + 1, n)
+        elif _ATX.match(line):
+            kind = "heading"
+            i += 1
+        elif _HR.match(line):
+            kind = "hr"
+            i += 1
+        elif _QUOTE.match(line):
+            kind = "quote"
+            i += 1
+            while i < n and lines[i].strip() and (_QUOTE.match(lines[i]) or not _starts_block(lines[i])):
+                i += 1
+        elif _LIST_ITEM.match(line):
+            kind = "list"
+            i = _list_end(lines, i)
+        elif _indent(line) >= 4:
+            kind = "code"
+            i += 1
+            while i < n and (not lines[i].strip() or _indent(lines[i]) >= 4):
+                i += 1
+            while not lines[i - 1].strip():
+                i -= 1
+        elif ("|" in line and i + 1 < n and "|" in lines[i + 1]
+              and _TABLE_DELIMITER.match(lines[i + 1])):
+            kind = "table"
+            i += 2
+            while i < n and "|" in lines[i] and not _starts_block(lines[i]):
+                i += 1
+        else:
+            kind = "paragraph"
+            i += 1
+            while i < n and lines[i].strip():
+                if _SETEXT.match(lines[i]):
+                    kind = "setext"
+                    i += 1
+                    break
+                if _starts_block(lines[i]):
+                    break
+                i += 1
+        blocks.append((kind, start, i))
+    return blocks
+
+
+def _safe_url(url: str) -> str:
+    """Allow only web and mailto links (or relative ones) in an escaped URL.
+
+    Browsers ignore leading controls and embedded tabs/newlines, so they are
+    removed before the scheme check and the cleaned URL is emitted.
+    """
+    cleaned = _URL_EMBEDDED_WHITESPACE.sub("", _URL_EDGE_CONTROLS.sub("", html.unescape(url)))
+    lowered = cleaned.lower()
+    if _URL_SCHEME.match(lowered) and not lowered.startswith(_SAFE_SCHEMES):
+        return "#"
+    return html.escape(cleaned)
+
+
+def _replace_links(text: str, opener: str, render: Callable[[str, str, Optional[str]], str]) -> str:
+    """Replace [text](destination "title") links, or images with opener "![".
+
+    The text is what lies between the last opener and the first "]" after
+    it. When that "]" is not followed by a destination, no opener before it
+    can be, so the scan resumes after it and stays linear.
+    """
+    parts: List[str] = []
+    pos = 0
+    start = text.find(opener)
+    while start >= 0:
+        close = text.find("]", start + len(opener))
+        if close < 0:
+            break
+        tail = _LINK_TAIL.match(text, close + 1)
+        if tail is None:
+            start = text.find(opener, close + 1)
+            continue
+        start = text.rfind(opener, start, close)
+        label = text[start + len(opener):close]
+        if not label and opener == "[":
+            start = text.find(opener, close + 1)
+            continue
+        parts.append(text[pos:start])
+        destination = tail.group(1) if tail.group(1) is not None else tail.group(2)
+        parts.append(render(label, destination, tail.group(3)))
+        pos = tail.end()
+        start = text.find(opener, pos)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _emphasis(text: str) -> str:
+    """Emphasis, strong emphasis and strikethrough.
+
+    Runs of *, _ and ~ are delimiters. Each closing run is matched with the
+    nearest opening run of the same character on a stack, as in CommonMark,
+    so the cost is linear in the text.
+    """
+    parts: List[object] = []
+    stack: List[list] = []  # Open runs: [char, count, open tags, close tags]
+    bottom: Dict[str, int] = {}  # Stack height below which a char has no opener
+    pos = 0
+    for match in _DELIMITER_RUN.finditer(text):
+        start, end = match.span()
+        char = text[start]
+        before = text[start - 1] if start else " "
+        after = text[end] if end < len(text) else " "
+        run = [char, end - start, [], []]
+        parts.append(text[pos:start])
+        parts.append(run)
+        pos = end
+        can_open = not after.isspace()
+        can_close = not before.isspace()
+        if char == "_":
+            can_open = can_open and not _WORD_CHAR.match(before)
+            can_close = can_close and not _WORD_CHAR.match(after)
+        elif char == "~" and run[1] < 2:
+            continue
+        while can_close and run[1]:
+            k = len(stack) - 1
+            floor = bottom.get(char, 0)
+            while k >= floor and stack[k][0] != char:
+                k -= 1
+            if k < floor:
+                bottom[char] = len(stack)
+                break
+            opener = stack[k]
+            if char == "~":
+                used, tag = 2, "del"
+            elif opener[1] >= 2 and run[1] >= 2:
+                used, tag = 2, "strong"
+            else:
+                used, tag = 1, "em"
+            opener[1] -= used
+            run[1] -= used
+            opener[2].append(f"<{tag}>")
+            run[3].append(f"</{tag}>")
+            # Runs between the pair can no longer be matched
+            del stack[k + 1:]
+            if opener[1] < (2 if char == "~" else 1):
+                del stack[k]
+            bottom = {c: min(h, len(stack)) for c, h in bottom.items()}
+            if char == "~" and run[1] < 2:
+                break
+        if can_open and run[1] >= (2 if char == "~" else 1):
+            stack.append(run)
+    parts.append(text[pos:])
+    return "".join(part if isinstance(part, str) else
+                   "".join(part[3]) + part[0] * part[1] + "".join(reversed(part[2]))
+                   for part in parts)
+
+
+def _table_cells(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in _CELL_SPLIT.split(line)]
+
+
+class MarkdownRenderer:
+    """Markdown to HTML with GitHub-style extensions, cached by content hash.
+
+    Supports headings, paragraphs (single newlines become <br>), fenced and
+    indented code, block quotes, nested and task lists, tables, rules,
+    emphasis, strikethrough, code spans, links, images and bare URLs. Raw
+    HTML is escaped and links with non-web schemes are dropped.
+
+    Whole documents are cached by the hash of their text and each
+    top-level block by the hash of its source, so re-rendering an edited
+    document or a growing chat response only renders the blocks that
+    changed.
+    """
+
+    MAX_DOCUMENTS = 256
+    MAX_BLOCKS = 4096
+
+    def __init__(self):
+        self._documents: "OrderedDict[str, str]" = OrderedDict()
+        self._blocks: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"),
+                               digest_size=16).hexdigest()
+
+    @staticmethod
+    def _lookup(cache: "OrderedDict[str, str]", key: str) -> Optional[str]:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _store(cache: "OrderedDict[str, str]", key: str, value: str,
+               limit: int) -> None:
+        cache[key] = value
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def render(self, text: str, cache: bool = True) -> str:
+        """HTML for a Markdown document.
+
+        Args:
+            text: Markdown source
+            cache: Whether to cache the result; off for text that is still
+                changing, such as the tail of a streamed response
+        """
+        if not cache:
+            return self._render_lines(text.splitlines())
+        key = self._hash(text)
+        with self._lock:
+            cached = self._lookup(self._documents, key)
+        if cached is not None:
+            return cached
+        lines = text.splitlines()
+        rendered = "\n".join(self.block(kind, lines[start:end])
+                             for kind, start, end in split_blocks(lines))
+        with self._lock:
+            self._store(self._documents, key, rendered, self.MAX_DOCUMENTS)
+        return rendered
+
+    def block(self, kind: str, lines: List[str]) -> str:
+        """HTML for one top-level block, cached by its source"""
+        key = self._hash(kind + "\x00" + "\n".join(lines))
+        with self._lock:
+            cached = self._lookup(self._blocks, key)
+        if cached is not None:
+            return cached
+        rendered = self._render_block(kind, lines)
+        with self._lock:
+            self._store(self._blocks, key, rendered, self.MAX_BLOCKS)
+        return rendered
+
+    def _render_lines(self, lines: List[str], tight: bool = False) -> str:
+        return "\n".join(self._render_block(kind, lines[start:end], tight)
+                         for kind, start, end in split_blocks(lines))
+
+    def _render_block(self, kind: str, lines: List[str], tight: bool = False) -> str:
+        if kind == "fence":
+            fence = _FENCE.match(lines[0])
+            indent, marker = len(fence.group(1)), fence.group(2)
+            body = lines[1:]
+            if body and _closes_fence(body[-1], marker):
+                body = body[:-1]
+            body = [line[min(indent, _indent(line)):] for line in body]
+            info = fence.group(3).split()
+            return self._code_block("\n".join(body), info[0] if info else "")
+        if kind == "code":
+            return self._code_block("\n".join(line[4:] for line in lines), "")
+        if kind == "heading":
+            heading = _ATX.match(lines[0])
+            level = len(heading.group(1))
+            return f"<h{level}>{self._inline(heading.group(2) or '')}</h{level}>"
+        if kind == "setext":
+            level = 1 if lines[-1].strip()[0] == "=" else 2
+            text = "\n".join(line.strip() for line in lines[:-1])
+            return f"<h{level}>{self._inline(text)}</h{level}>"
+        if kind == "hr":
+            return "<hr>"
+        if kind == "quote":
+            inner = [_QUOTE.sub("", line, count=1) for line in lines]
+            return f"<blockquote>\n{self._render_lines(inner)}\n</blockquote>"
+        if kind == "list":
+            return self._render_list(lines)
+        if kind == "table":
+            return self._render_table(lines)
+        text = self._inline("\n".join(line.strip() for line in lines))
+        text = text.replace("\n", "<br>\n")
+        return text if tight else f"<p>{text}</p>"
+
+    @staticmethod
+    def _code_block(code: str, language: str) -> str:
+        language = html.escape(language or "plaintext")
+        return (f'<pre data-language="{language}" class="code-block">'
+                f'<code class="language-{language}">{html.escape(code, quote=False)}</code></pre>')
+
+    def _render_list(self, lines: List[str]) -> str:
+        # Each item: [ordered, number, content indent, lines]
+        items = []
+        for line in lines:
+            line = line.expandtabs(4)
+            item = _LIST_ITEM.match(line)
+            if item and not _HR.match(line) and (not items or _indent(line) < items[-1][2]):
+                marker = item.group(2)
+                ordered = marker[-1] in ".)"
+                rest = line[item.end():]
+                content_indent = item.start(3) + (min(len(item.group(3)), 4) if rest.strip() else 1)
+                items.append([ordered, int(marker[:-1]) if ordered else 1,
+                              content_indent, [line[content_indent:] if rest.strip() else ""]])
+            elif not line.strip():
+                items[-1][3].append("")
+            else:
+                items[-1][3].append(line[min(_indent(line), items[-1][2]):])
+
+        # Ordered and bullet items alternate as separate lists
+        groups: List[list] = []
+        for item in items:
+            if not groups or groups[-1][0][0] != item[0]:
+                groups.append([])
+            groups[-1].append(item)
+
+        parts = []
+        for group in groups:
+            # A blank line between items, or inside one, makes a list loose
+            loose = False
+            for index, (_, _, _, content) in enumerate(group):
+                trailing = 0
+                while trailing < len(content) and not content[-1 - trailing].strip():
+                    trailing += 1
+                if (trailing and index < len(group) - 1) or any(
+                        not line.strip() for line in content[:len(content) - trailing]):
+                    loose = True
+
+            ordered, number = group[0][0], group[0][1]
+            start = f' start="{number}"' if ordered and number != 1 else ""
+            parts.append(f"<ol{start}>" if ordered else "<ul>")
+            for _, _, _, content in group:
+                text = "\n".join(content).strip("\n")
+                checkbox = ""
+                task = _TASK.match(text)
+                if task:
+                    checked = " checked" if task.group(1) in "xX" else ""
+                    checkbox = f'<input type="checkbox" disabled{checked}> '
+                    text = text[task.end():]
+                inner = self._render_lines(text.split("\n"), tight=not loose)
+                parts.append(f"<li>{checkbox}{inner}</li>")
+            parts.append("</ol>" if ordered else "</ul>")
+        return "\n".join(parts)
+
+    def _render_table(self, lines: List[str]) -> str:
+        header = _table_cells(lines[0])
+        aligns = []
+        for cell in _table_cells(lines[1]):
+            if cell.startswith(":") and cell.endswith(":"):
+                aligns.append(' style="text-align:center"')
+            elif cell.endswith(":"):
+                aligns.append(' style="text-align:right"')
+            elif cell.startswith(":"):
+                aligns.append(' style="text-align:left"')
+            else:
+                aligns.append("")
+        aligns = (aligns + [""] * len(header))[:len(header)]
+
+        parts = ["<table>", "<thead>", "<tr>"]
+        parts.extend(f"<th{align}>{self._inline(cell)}</th>"
+                     for cell, align in zip(header, aligns))
+        parts.extend(["</tr>", "</thead>"])
+        if len(lines) > 2:
+            parts.append("<tbody>")
+            for line in lines[2:]:
+                cells = (_table_cells(line) + [""] * len(header))[:len(header)]
+                parts.append("<tr>" + "".join(
+                    f"<td{align}>{self._inline(cell)}</td>"
+                    for cell, align in zip(cells, aligns)) + "</tr>")
+            parts.append("</tbody>")
+        parts.append("</table>")
+        return "\n".join(parts)
+
+    def _inline(self, text: str) -> str:
+        """Inline Markdown to HTML.
+
+        Code spans, escapes and links are replaced by \\x00n\\x00
+        placeholders as they are rendered, so later patterns never see
+        their contents.
+        """
+        stash: List[str] = []
+
+        def hold(value: str) -> str:
+            stash.append(value)
+            return f"\x00{len(stash) - 1}\x00"
+
+        def code_span(match):
+            code = match.group(2)
+            if len(code) > 2 and code[0] == code[-1] == " " and code.strip():
+                code = code[1:-1]
+            code = html.escape(code.replace("\n", " "), quote=False)
+            return hold(f"<code>{code}</code>")
+
+        def image(alt, destination, title):
+            alt = _PLACEHOLDER.sub("", alt)
+            title = f' title="{title}"' if title else ""
+            return hold(f'<img src="{_safe_url(destination)}" alt="{alt}"{title}>')
+
+        def link(label, destination, title):
+            title = f' title="{title}"' if title else ""
+            return hold(f'<a href="{_safe_url(destination)}"{title} target="_blank" rel="noopener noreferrer">'
+                        f"{_emphasis(label)}</a>")
+
+        def url(match):
+            address = match.group(0) if match.lastindex is None else match.group(1)
+            trailing = ""
+            while address and address[-1] in ".,:;!?)]'*_~":
+                trailing = address[-1] + trailing
+                address = address[:-1]
+            return hold(f'<a href="{_safe_url(address)}" target="_blank" rel="noopener noreferrer">{address}</a>') + trailing
+
+        text = text.replace("\x00", "\ufffd")
+        text = _CODE_SPAN.sub(code_span, text)
+        text = _ESCAPE.sub(lambda m: hold(html.escape(m.group(1))), text)
+        text = html.escape(text)
+        text = _replace_links(text, "![", image)
+        text = _replace_links(text, "[", link)
+        text = _AUTOLINK.sub(url, text)
+        text = _BARE_URL.sub(url, text)
+        text = _emphasis(text)
+        while "\x00" in text:
+            text = _PLACEHOLDER.sub(lambda m: stash[int(m.group(1))], text)
+        return text
+
+
+class MarkdownStream:
+    """Incremental HTML for Markdown arriving in pieces, such as chat tokens.
+
+    A top-level block is final once the next one has started, so each is
+    rendered exactly once (and cached) when that happens; only the trailing,
+    unfinished block is re-rendered per update. Clients append the final
+    blocks and replace the tail, making the total work linear in the
+    response length.
+    """
+
+    def __init__(self, renderer: MarkdownRenderer):
+        self.renderer = renderer
+        self._pending = ""  # Text from the start of the unfinished block
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        """Add text to the stream.
+
+        Returns:
+            Tuple of (HTML of blocks this text completed, HTML of the
+            unfinished tail)
+        """
+        pending = self._pending + text
+        complete = pending[:pending.rfind("\n") + 1]
+        lines = complete.splitlines(keepends=True)
+        blocks = split_blocks([line.rstrip("\r\n") for line in lines])
+
+        finished = []
+        if len(blocks) > 1:
+            for kind, start, end in blocks[:-1]:
+                finished.append(self.renderer.block(
+                    kind, [line.rstrip("\r\n") for line in lines[start:end]]))
+            pending = pending[sum(len(line) for line in lines[:blocks[-1][1]]):]
+        self._pending = pending
+        return "\n".join(finished), self.renderer.render(pending, cache=False)
+
+
+_markdown_renderer: Optional[MarkdownRenderer] = None
+
+
+def get_markdown_renderer() -> MarkdownRenderer:
+    """The process-wide renderer, so all callers share one cache"""
+    global _markdown_renderer
+    if _markdown_renderer is None:
+        _markdown_renderer = MarkdownRenderer()
+    return _markdown_renderer
@@ -0,0 +1,94 @@
+"""Byte-bounded cache of computed artifact previews."""
+
+# pylama:ignore=E501
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# (workspace id, relative path, path, inode, mtime_ns, size): one version
+# of one file as addressed by a request, since payloads embed the workspace
+# id and relative path in their URLs
+PreviewKey = Tuple[str, str, str, int, int, int]
+
+
+def preview_key(workspace_id: str, rel_path: str, path: str,
+                st: os.stat_result) -> PreviewKey:
+    return workspace_id, rel_path, path, st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory held by a JSON-like payload, in bytes"""
+    if isinstance(value, (str, bytes)):
+        return len(value) + 50
+    if isinstance(value, dict):
+        return 64 + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(item) for item in value)
+    return 28
+
+
+class PreviewCache:
+    """LRU cache of preview payloads within a byte budget.
+
+    Entries are keyed by file identity and version, so an edited file
+    misses naturally and its stale entry ages out. Hits, misses and
+    evictions are counted for stats().
+    """
+
+    MAX_BYTES = 64 * 1024 * 1024
+    MAX_ENTRY_FRACTION = 0.25  # Larger payloads are not cached
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[PreviewKey, Tuple[Dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: PreviewKey) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: PreviewKey, preview: Dict) -> None:
+        size = estimate_size(preview)
+        if size > self.max_bytes * self.MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (preview, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, memory use and hit rate since startup"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,58 @@
+"""Short-lived cache of stat results for hot file paths."""
+
+# pylama:ignore=E501
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class StatCache:
+    """stat() results reused for TTL seconds.
+
+    One request typically stats the same file while scanning, scoring,
+    loading, caching and indexing it; on network filesystems each of those
+    is a round trip. Scans seed the cache with the stat they already did,
+    later steps read it back, and writers invalidate the paths they touch.
+    The TTL bounds how long a change made behind our back goes unnoticed.
+    """
+
+    TTL = 1.0  # Seconds a stat result is reused
+    MAX_ENTRIES = 20000
+
+    def __init__(self, ttl: float = TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, os.stat_result]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, path: str, st: os.stat_result) -> os.stat_result:
+        """Remember a stat result obtained elsewhere (e.g. from a DirEntry)"""
+        with self._lock:
+            self._entries[path] = (time.monotonic(), st)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return st
+
+    def stat(self, path: str) -> os.stat_result:
+        """os.stat(path), served from the cache while fresh; raises OSError"""
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return self.put(path, os.stat(path))
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -4,6 +4,10 @@ let currentModel = null;
 let pendingChanges = null;
 let socket = null;
 let expandedDirs = new Map(); // Track expanded directories and their pagination state
+let treeState = { workspace: null, version: null, nodes: new Map() }; // Client copy of the compact tree
+let virtualTree = null; // Windowed tree state for large workspaces
+let fileContentCache = new Map(); // File windows by workspace, path and range, revalidated by ETag
+let chatStreamTarget = null; // Assistant message receiving streamed HTML
 let term = null;
 let fitAddon = null;
 let isTerminalExpanded = false;
@@ -174,6 +178,44 @@ function initializeWebSocket() {
         updateConnectionStatus(false);
     });
     
+    // Background removal of deleted workspaces
+    socket.on('workspace_delete_progress', (data) => {
+        if (data.done) {
+            updateStatus(`Workspace ${data.workspace_id} removed`, 5);
+            return;
+        }
+        const total = data.expected ? ` of ~${data.expected}` : '';
+        const step = data.expected ? Math.min(5, (data.removed / data.expected) * 5) : 0;
+        updateStatus(`Removing workspace ${data.workspace_id}: ${data.removed}${total} entries`, step);
+    });
+    
+    // Folder sizes for the import browser, as they finish
+    socket.on('folder_size', (data) => {
+        const folderDiv = Array.from(document.querySelectorAll('[data-folder-path]'))
+            .find(el => el.dataset.folderPath === data.path);
+        const sizeSpan = folderDiv && folderDiv.querySelector('.folder-size');
+        if (sizeSpan) {
+            sizeSpan.textContent = data.error ? 'Size unavailable' : formatFolderSize(data.files, data.size);
+        }
+    });
+    
+    // Streamed chat responses, rendered server-side: finished blocks are
+    // appended once and only the unfinished tail is replaced
+    socket.on('chat_stream', (data) => {
+        if (!chatStreamTarget) return;
+        let body = chatStreamTarget.querySelector('.chat-stream-body');
+        if (!body) {
+            chatStreamTarget.innerHTML = '<div class="chat-stream-body"></div><div class="chat-stream-tail"></div>';
+            body = chatStreamTarget.querySelector('.chat-stream-body');
+        }
+        if (data.append) {
+            body.insertAdjacentHTML('beforeend', data.append);
+        }
+        chatStreamTarget.querySelector('.chat-stream-tail').innerHTML = data.tail || '';
+        const chatHistory = document.getElementById('chatHistory');
+        chatHistory.scrollTop = chatHistory.scrollHeight;
+    });
+    
     // Terminal events
     socket.on('terminal_output', (data) => {
         term.write(data);
@@ -415,7 +457,8 @@ async function loadWorkspaceHistory() {
                 
                 const statsSpan = document.createElement('span');
                 statsSpan.className = 'text-sm text-gray-400 block mt-1';
-                statsSpan.textContent = `${workspace.file_count} files`;
+                // Counts are computed in the background for new workspaces
+                statsSpan.textContent = workspace.file_count === null ? 'Counting files...' : `${workspace.file_count} files`;
                 
                 infoDiv.appendChild(nameSpan);
                 infoDiv.appendChild(statsSpan);
@@ -423,6 +466,31 @@ async function loadWorkspaceHistory() {
                 const actionsDiv = document.createElement('div');
                 actionsDiv.className = 'flex items-center gap-2';
                 
+                // Forking is cheap: files are shared copy-on-write
+                const forkBtn = document.createElement('button');
+                forkBtn.className = 'p-2 text-green-400 hover:text-green-300 transition-colors';
+                forkBtn.innerHTML = '<i class="fas fa-code-branch"></i>';
+                forkBtn.title = 'Fork workspace';
+                forkBtn.onclick = (e) => {
+                    e.stopPropagation();
+                    const newName = prompt('Enter a name for the fork:', `${workspace.id}-fork`);
+                    if (newName) {
+                        forkWorkspace(workspace.id, newName);
+                    }
+                };
+                actionsDiv.appendChild(forkBtn);
+                
+                const exportBtn = document.createElement('button');
+                exportBtn.className = 'p-2 text-gray-400 hover:text-gray-300 transition-colors';
+                exportBtn.innerHTML = '<i class="fas fa-file-export"></i>';
+                exportBtn.title = 'Export workspace archive';
+                exportBtn.onclick = (e) => {
+                    e.stopPropagation();
+                    // The archive streams straight to a download
+                    window.location.href = `/workspace/export?workspace_id=${encodeURIComponent(workspace.id)}`;
+                };
+                actionsDiv.appendChild(exportBtn);
+                
                 if (isImported) {
                     // Show Unlink button for imported workspaces
                     const unlinkBtn = document.createElement('button');
@@ -505,6 +573,67 @@ async function deleteWorkspace(workspaceId) {
     }
 }
 
+function importWorkspaceArchive() {
+    const input = document.createElement('input');
+    input.type = 'file';
+    input.accept = '.tar,.tar.gz,.tgz,.tar.zst';
+    input.onchange = async () => {
+        const file = input.files[0];
+        if (!file) return;
+        const defaultName = file.name.replace(/\.(tar\.gz|tgz|tar\.zst|tar)$/, '');
+        const workspaceId = prompt('Enter a name for the imported workspace:', defaultName);
+        if (!workspaceId) return;
+        
+        showLoading('Importing workspace...');
+        try {
+            // The file is sent as the raw body and extracted as it arrives
+            const response = await fetch(`/workspace/import_archive?workspace_id=${encodeURIComponent(workspaceId)}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file
+            });
+            const data = await response.json();
+            if (data.status === 'success') {
+                showError('Workspace imported successfully', 'success');
+                loadWorkspaceHistory();
+            } else {
+                showError(data.message || 'Failed to import workspace');
+            }
+        } catch (error) {
+            console.error('Error:', error);
+            showError('Failed to import workspace: ' + error.message);
+        } finally {
+            hideLoading();
+        }
+    };
+    input.click();
+}
+
+async function forkWorkspace(workspaceId, newName) {
+    try {
+        const response = await fetch('/workspace/fork', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                workspace_id: workspaceId,
+                new_name: newName
+            })
+        });
+
+        const data = await response.json();
+        
+        if (data.status === 'success') {
+            showError(`Workspace forked as ${data.workspace_id}`, 'success');
+            loadWorkspaceHistory();
+        } else {
+            showError(data.message || 'Failed to fork workspace');
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showError('Failed to fork workspace: ' + error.message);
+    }
+}
+
 async function renameWorkspace(workspaceId, newName) {
     try {
         const response = await fetch('/workspace/rename', {
@@ -572,7 +701,7 @@ async function selectWorkspace(path) {
         const response = await fetch('/workspace/structure', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ workspace_dir: path })
+            body: JSON.stringify({ workspace_dir: path, ...treeRequestFields() })
         });
         
         const data = await response.json();
@@ -591,11 +720,7 @@ async function selectWorkspace(path) {
             }
             
             // Update tree structure
-            const workspaceTree = document.getElementById('workspaceTree');
-            if (workspaceTree) {
-                workspaceTree.innerHTML = '';
-                buildTree(data.structure, workspaceTree);
-            }
+            updateWorkspaceTreeFromResponse(data);
 
             // Send terminal command to change directory
             if (socket) {
@@ -642,7 +767,7 @@ async function expandDirectory(dirElement, path) {
     
     try {
         // Get or initialize pagination state
-        let paginationState = expandedDirs.get(path) || { page: 1, hasMore: true, loading: false };
+        let paginationState = expandedDirs.get(path) || { cursor: null, hasMore: true, loading: false };
         if (paginationState.loading) return;
         
         paginationState.loading = true;
@@ -654,7 +779,7 @@ async function expandDirectory(dirElement, path) {
             body: JSON.stringify({
                 workspace_dir: currentWorkspace,
                 dir_path: path,
-                page: paginationState.page,
+                cursor: paginationState.cursor,
                 page_size: 100
             })
         });
@@ -697,7 +822,7 @@ async function expandDirectory(dirElement, path) {
             
             // Update pagination state
             paginationState.hasMore = data.has_more;
-            paginationState.page++;
+            paginationState.cursor = data.next_cursor;
             paginationState.loading = false;
             expandedDirs.set(path, paginationState);
             
@@ -724,6 +849,12 @@ async function loadMoreItems(path) {
     const paginationState = expandedDirs.get(path);
     if (!paginationState || paginationState.loading || !paginationState.hasMore) return;
     
+    // Folders rendered by buildTree keep their children container
+    if (paginationState.container) {
+        await loadMoreTreeItems(path, paginationState);
+        return;
+    }
+    
     // Find the directory element and its children container
     const dirElement = Array.from(document.querySelectorAll('[aria-expanded="true"]'))
         .find(el => el.querySelector('span').textContent === path.split('/').pop());
@@ -741,15 +872,301 @@ async function loadMoreItems(path) {
     }
 }
 
+async function loadMoreTreeItems(path, paginationState) {
+    const container = paginationState.container;
+    paginationState.loading = true;
+    try {
+        const response = await fetch('/workspace/expand', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                workspace_dir: currentWorkspace,
+                dir_path: path,
+                cursor: paginationState.cursor,
+                page_size: 100
+            })
+        });
+        const data = await response.json();
+        if (!response.ok || data.status !== 'success') {
+            throw new Error(data.message || 'Failed to load folder contents');
+        }
+        
+        // Replace the "Load More" button with the next page
+        const loadMoreButton = container.querySelector(':scope > .load-more');
+        if (loadMoreButton) {
+            loadMoreButton.remove();
+        }
+        buildTree(data.items, container, path);
+        
+        paginationState.cursor = data.next_cursor;
+        paginationState.hasMore = data.has_more;
+        if (data.has_more) {
+            appendLoadMoreButton(container, path, data.total_items - container.querySelectorAll(':scope > .tree-item').length);
+        }
+    } catch (error) {
+        console.error('Error loading more items:', error);
+        showError(`Failed to load folder contents: ${error.message}`);
+    } finally {
+        paginationState.loading = false;
+    }
+}
+
+function appendLoadMoreButton(container, path, remaining) {
+    const loadMoreDiv = document.createElement('div');
+    loadMoreDiv.className = 'load-more text-center py-2';
+    const button = document.createElement('button');
+    button.className = 'text-sm text-blue-400 hover:text-blue-300';
+    button.textContent = `Load More (${remaining} more)`;
+    button.onclick = (e) => {
+        e.stopPropagation();
+        loadMoreItems(path);
+    };
+    loadMoreDiv.appendChild(button);
+    container.appendChild(loadMoreDiv);
+}
+
 function updateWorkspaceTree(structure) {
     const workspaceTree = document.getElementById('workspaceTree');
     if (workspaceTree) {
+        virtualTree = null;
+        workspaceTree.onscroll = null;
         workspaceTree.innerHTML = '';
         expandedDirs.clear(); // Reset expanded directories state
         buildTree(structure, workspaceTree);
     }
 }
 
+// Fields asking the server for the compact tree format, as a delta against
+// the version we already hold for the current workspace
+function treeRequestFields() {
+    return {
+        tree_format: 'compact',
+        tree_version: treeState.workspace === currentWorkspace ? treeState.version : null
+    };
+}
+
+function decodeTreeColumns(columns, nodes) {
+    columns.name.forEach((name, i) => {
+        const parentIndex = columns.parent[i];
+        const path = parentIndex >= 0 ? `${columns.dirs[parentIndex]}/${name}` : name;
+        nodes.set(path, {
+            isDir: columns.is_dir[i] === 1,
+            size: columns.size[i],
+            hasChildren: columns.has_children[i] === 1
+        });
+    });
+}
+
+// Apply a full or delta tree payload; returns false if nothing changed
+function applyTreePayload(tree) {
+    if (tree.full) {
+        treeState.nodes = new Map();
+        decodeTreeColumns(tree.full, treeState.nodes);
+    } else if (tree.version === treeState.version || tree.base_version !== treeState.version) {
+        return false;
+    } else {
+        (tree.removed || []).forEach(path => {
+            const prefix = `${path}/`;
+            treeState.nodes.delete(path);
+            for (const key of Array.from(treeState.nodes.keys())) {
+                if (key.startsWith(prefix)) {
+                    treeState.nodes.delete(key);
+                }
+            }
+        });
+        if (tree.added) decodeTreeColumns(tree.added, treeState.nodes);
+        if (tree.changed) decodeTreeColumns(tree.changed, treeState.nodes);
+    }
+    treeState.version = tree.version;
+    return true;
+}
+
+// Rebuild the nested structure buildTree expects from the flat node map
+function treeStateToStructure() {
+    const root = [];
+    const items = new Map();
+    treeState.nodes.forEach((node, path) => {
+        const name = path.split('/').pop();
+        items.set(path, node.isDir
+            ? { type: 'directory', path: name, has_children: node.hasChildren, children: [] }
+            : { type: 'file', path: name, size: node.size });
+    });
+    items.forEach((item, path) => {
+        const slash = path.lastIndexOf('/');
+        const parent = slash >= 0 ? items.get(path.substring(0, slash)) : null;
+        (parent ? parent.children : root).push(item);
+    });
+    const sortItems = list => {
+        list.sort((a, b) => (a.type === 'directory' ? 0 : 1) - (b.type === 'directory' ? 0 : 1) ||
+            a.path.toLowerCase().localeCompare(b.path.toLowerCase()));
+        list.forEach(item => item.children && sortItems(item.children));
+    };
+    sortItems(root);
+    return root;
+}
+
+function updateWorkspaceTreeFromResponse(data) {
+    if (data.tree) {
+        if (treeState.workspace !== currentWorkspace) {
+            treeState = { workspace: currentWorkspace, version: null, nodes: new Map() };
+        }
+        const changed = applyTreePayload(data.tree);
+        if (data.tree.virtual) {
+            showVirtualTree();
+        } else if (changed || virtualTree) {
+            updateWorkspaceTree(treeStateToStructure());
+        }
+    } else if (data.structure) {
+        treeState = { workspace: null, version: null, nodes: new Map() };
+        updateWorkspaceTree(data.structure);
+    }
+}
+
+// Windowed rendering for large workspaces: the server flattens the expanded
+// folders and only the rows in view (plus some overscan) are in the DOM
+const TREE_ROW_HEIGHT = 28;
+const TREE_OVERSCAN_ROWS = 20;
+
+function showVirtualTree() {
+    const workspaceTree = document.getElementById('workspaceTree');
+    if (!workspaceTree) return;
+    
+    if (!virtualTree || virtualTree.workspace !== currentWorkspace || !workspaceTree.contains(virtualTree.spacer)) {
+        workspaceTree.innerHTML = '';
+        expandedDirs.clear();
+        const spacer = document.createElement('div');
+        spacer.className = 'virtual-tree-spacer';
+        spacer.style.position = 'relative';
+        workspaceTree.appendChild(spacer);
+        virtualTree = {
+            workspace: currentWorkspace,
+            expanded: new Set(),
+            spacer: spacer,
+            requestId: 0,
+            scheduled: false
+        };
+        workspaceTree.onscroll = scheduleVirtualTreeRender;
+    }
+    renderVirtualTreeWindow();
+}
+
+function scheduleVirtualTreeRender() {
+    if (!virtualTree || virtualTree.scheduled) return;
+    virtualTree.scheduled = true;
+    requestAnimationFrame(() => {
+        if (!virtualTree) return;
+        virtualTree.scheduled = false;
+        renderVirtualTreeWindow();
+    });
+}
+
+async function renderVirtualTreeWindow() {
+    const state = virtualTree;
+    const workspaceTree = document.getElementById('workspaceTree');
+    if (!state || !workspaceTree) return;
+    
+    const offset = Math.max(0, Math.floor(workspaceTree.scrollTop / TREE_ROW_HEIGHT) - TREE_OVERSCAN_ROWS);
+    const limit = Math.ceil(workspaceTree.clientHeight / TREE_ROW_HEIGHT) + 2 * TREE_OVERSCAN_ROWS;
+    const requestId = ++state.requestId;
+    
+    try {
+        const response = await fetch('/workspace/window', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                workspace_dir: state.workspace,
+                expanded: Array.from(state.expanded),
+                offset: offset,
+                limit: limit
+            })
+        });
+        const data = await response.json();
+        
+        // Drop responses overtaken by a newer scroll or workspace switch
+        if (state !== virtualTree || requestId !== state.requestId) return;
+        if (data.status !== 'success') {
+            throw new Error(data.message || 'Failed to load workspace tree');
+        }
+        
+        state.spacer.style.height = `${data.total_rows * TREE_ROW_HEIGHT}px`;
+        const fragment = document.createDocumentFragment();
+        data.rows.forEach((row, i) => {
+            fragment.appendChild(createVirtualTreeRow(row, data.offset + i));
+        });
+        state.spacer.replaceChildren(fragment);
+    } catch (error) {
+        console.error('Error loading tree window:', error);
+        showError('Failed to load workspace tree: ' + error.message);
+    }
+}
+
+function createVirtualTreeRow(row, index) {
+    const isDirectory = row.type === 'directory';
+    const header = document.createElement('div');
+    header.className = `${isDirectory ? 'folder-header' : 'file-header'} flex items-center gap-2 p-1 hover:bg-gray-700 rounded cursor-pointer`;
+    header.style.position = 'absolute';
+    header.style.left = '0';
+    header.style.right = '0';
+    header.style.top = `${index * TREE_ROW_HEIGHT}px`;
+    header.style.height = `${TREE_ROW_HEIGHT}px`;
+    header.style.paddingLeft = `${row.depth * 16 + 4}px`;
+    header.dataset.path = row.path;
+    
+    const icon = document.createElement('i');
+    if (isDirectory) {
+        icon.className = row.expanded ? 'fas fa-folder-open text-yellow-400' : 'fas fa-folder text-yellow-400';
+    } else {
+        icon.className = `fas ${getFileIcon(row.name)}`;
+    }
+    header.appendChild(icon);
+    
+    const name = document.createElement('span');
+    name.className = 'name text-gray-300 truncate';
+    name.textContent = row.name;
+    header.appendChild(name);
+    
+    const kind = isDirectory ? 'directory' : 'file';
+    const codeGenBtn = document.createElement('button');
+    codeGenBtn.className = 'code-gen-btn';
+    codeGenBtn.innerHTML = '<i class="fas fa-code"></i>';
+    codeGenBtn.title = 'Get Code Insights';
+    codeGenBtn.onclick = (e) => {
+        e.stopPropagation();
+        getCodeGeneration(row.path, kind);
+    };
+    header.appendChild(codeGenBtn);
+    
+    const recBtn = document.createElement('button');
+    recBtn.className = 'recommendation-btn';
+    recBtn.innerHTML = '<i class="fas fa-brain"></i>';
+    recBtn.title = 'Get AI Insights';
+    recBtn.onclick = (e) => {
+        e.stopPropagation();
+        getRecommendations(row.path, kind);
+    };
+    header.appendChild(recBtn);
+    
+    header.onclick = (e) => {
+        e.stopPropagation();
+        if (!isDirectory) {
+            showFileContent(row.path);
+            return;
+        }
+        // Collapsed folders keep their expanded descendants for next time
+        if (row.expanded) {
+            virtualTree.expanded.delete(row.path);
+        } else if (row.has_children) {
+            virtualTree.expanded.add(row.path);
+        }
+        renderVirtualTreeWindow();
+    };
+    return header;
+}
+
+function formatFolderSize(files, size) {
+    return `${files} files · ${formatFileSize(size)}`;
+}
+
 function buildTree(structure, container, parentPath = '') {
     structure.forEach(item => {
         const itemDiv = document.createElement('div');
@@ -830,7 +1247,6 @@ function buildTree(structure, container, parentPath = '') {
                         const requestData = {
                             workspace_dir: currentWorkspace,
                             dir_path: fullPath,  // Use the full path here
-                            page: 1,
                             page_size: 100
                         };
                         
@@ -873,17 +1289,16 @@ function buildTree(structure, container, parentPath = '') {
                                 // Pass the current full path as parent path for nested items
                                 buildTree(data.items, children, fullPath);
                                 
-                                // Add "Load More" button if there are more items
+                                // Add "Load More" button if there are more items;
+                                // the next page resumes from the returned cursor
+                                expandedDirs.set(fullPath, {
+                                    cursor: data.next_cursor,
+                                    hasMore: data.has_more,
+                                    loading: false,
+                                    container: children
+                                });
                                 if (data.has_more) {
-                                    const loadMoreDiv = document.createElement('div');
-                                    loadMoreDiv.className = 'text-center py-2';
-                                    loadMoreDiv.innerHTML = `
-                                        <button class="text-sm text-blue-400 hover:text-blue-300"
-                                                onclick="loadMoreItems('${fullPath}')">
-                                            Load More (${data.total_items - data.items.length} more)
-                                        </button>
-                                    `;
-                                    children.appendChild(loadMoreDiv);
+                                    appendLoadMoreButton(children, fullPath, data.total_items - data.items.length);
                                 }
                                 
                                 console.log('Successfully built tree with', data.items.length, 'items');
@@ -1153,7 +1568,8 @@ async function processPrompt() {
                 workspace_dir: currentWorkspace,
                 model_id: document.getElementById('modelSelect').value,
                 attachments: attachments,
-                context_path: contextPath  // Add the context path if available
+                context_path: contextPath,  // Add the context path if available
+                ...treeRequestFields()
             })
         });
 
@@ -1165,9 +1581,7 @@ async function processPrompt() {
         }
 
         currentWorkspace = data.workspace_dir;
-        if (data.structure) {
-            updateWorkspaceTree(data.structure);
-        }
+        updateWorkspaceTreeFromResponse(data);
         if (data.requires_approval) {
             showApprovalModal(data);
         }
@@ -1207,6 +1621,7 @@ async function sendChatMessage() {
 
     // Show loading indicator
     const loadingMessage = appendChatMessage('<i class="fas fa-spinner fa-spin"></i> Thinking...', 'assistant', true);
+    chatStreamTarget = loadingMessage;
     
     try {
         const response = await fetch('/chat', {
@@ -1225,16 +1640,18 @@ async function sendChatMessage() {
         const data = await response.json();
         
         // Remove loading message
+        chatStreamTarget = null;
         loadingMessage.remove();
 
         if (data.status === 'success') {
-            const formattedResponse = formatChatResponse(data.response);
-            appendChatMessage(formattedResponse, 'assistant', true);
+            // The response is already rendered to HTML by the server
+            highlightChatCode(appendChatMessage(data.response, 'assistant', true));
         } else {
             appendErrorMessage(data.message || 'Failed to get response');
         }
     } catch (error) {
         console.error('Error:', error);
+        chatStreamTarget = null;
         loadingMessage.remove();
         appendErrorMessage('Error: ' + error.message);
     }
@@ -1251,87 +1668,13 @@ function clearChatHistory() {
     }
 }
 
-function formatChatResponse(text) {
-    // Configure marked options for GitHub-like rendering
-    marked.setOptions({
-        gfm: true,                // GitHub Flavored Markdown
-        breaks: true,             // Add <br> on single line breaks
-        headerIds: true,          // Add ids to headers
-        mangle: false,            // Don't escape header IDs
-        pedantic: false,          // Don't be too strict
-        smartLists: true,         // Use smarter list behavior
-        smartypants: true,        // Use smart punctuation
-        highlight: function(code, lang) {
-            // Add syntax highlighting classes
-            if (lang && hljs.getLanguage(lang)) {
-                try {
-                    return hljs.highlight(code, { language: lang }).value;
-                } catch (err) {}
-            }
-            return code;
+function highlightChatCode(messageDiv) {
+    messageDiv.querySelectorAll('pre code[class^="language-"]').forEach(block => {
+        const language = block.className.replace('language-', '');
+        if (hljs.getLanguage(language)) {
+            hljs.highlightElement(block);
         }
     });
-
-    // Split text into code blocks and regular text
-    const parts = text.split('```');
-    const formattedParts = [];
-    
-    for (let i = 0; i < parts.length; i++) {
-        if (i % 2 === 0) {
-            // Regular text: convert markdown to HTML
-            let regularText = parts[i].trim();
-            if (regularText) {
-                regularText = marked.parse(regularText);
-                formattedParts.push(regularText);
-            }
-        } else {
-            // Code block: preserve formatting and add syntax highlighting
-            let code = parts[i];
-            let language = '';
-            
-            // Check if language is specified
-            const firstLineBreak = code.indexOf('\n');
-            if (firstLineBreak !== -1) {
-                language = code.substring(0, firstLineBreak).trim();
-                code = code.substring(firstLineBreak + 1);
-            }
-            
-            // Clean up code
-            code = code.trim()
-                .replace(/\n\s*\n/g, '\n')  // Remove empty lines
-                .replace(/[ \t]+$/gm, '')   // Remove trailing spaces
-                .replace(/^\s+|\s+$/g, ''); // Remove leading/trailing spaces
-            
-            // Escape HTML entities
-            code = code
-                .replace(/&/g, '&amp;')
-                .replace(/</g, '&lt;')
-                .replace(/>/g, '&gt;')
-                .replace(/"/g, '&quot;')
-                .replace(/'/g, '&#39;');
-
-            // Apply syntax highlighting if language is specified
-            if (language && hljs.getLanguage(language)) {
-                try {
-                    code = hljs.highlight(code, { language: language }).value;
-                } catch (err) {}
-            }
-
-            // Create code block with language label
-            formattedParts.push(`<pre data-language="${language || 'plaintext'}" class="code-block"><code class="language-${language || 'plaintext'}">${code}</code></pre>`);
-        }
-    }
-    
-    // Join parts and clean up
-    let result = formattedParts.join('\n');
-    
-    // Clean up any unwanted tags or spaces
-    result = result
-        .replace(/<\/pre>\s+<p>/g, '</pre><p>')
-        .replace(/<\/p>\s+<pre>/g, '</p><pre>')
-        .replace(/\s+$/g, '');
-    
-    return result;
 }
 
 function appendChatMessage(content, type, isHtml = false) {
@@ -1651,16 +1994,15 @@ async function applyChanges(operations) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 workspace_dir: currentWorkspace,
-                operations: operations
+                operations: operations,
+                ...treeRequestFields()
             })
         });
 
         const data = await response.json();
         
         if (data.status === 'success') {
-            if (data.structure) {
-                updateWorkspaceTree(data.structure);
-            }
+            updateWorkspaceTreeFromResponse(data);
             showError('Changes applied successfully', 'success');
         } else {
             showError(data.message || 'Failed to apply changes');
@@ -1674,6 +2016,47 @@ async function applyChanges(operations) {
 }
 
 // File Viewing
+const FILE_CACHE_ENTRIES = 50;
+
+// Fetch file content (or one window of it), reusing the cached copy when
+// the server answers 304 Not Modified for its ETag.
+async function fetchFileWindow(relativePath, range = {}) {
+    const key = `${currentWorkspace}::${relativePath}::${JSON.stringify(range)}`;
+    const cached = fileContentCache.get(key);
+    const headers = { 'Content-Type': 'application/json' };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await fetch('/workspace/file', {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({
+            workspace_dir: currentWorkspace,
+            file_path: relativePath,
+            ...range
+        })
+    });
+
+    if (response.status === 304 && cached) {
+        // Refresh recency so the entry is evicted last
+        fileContentCache.delete(key);
+        fileContentCache.set(key, cached);
+        return cached.data;
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (data.status === 'success' && etag) {
+        fileContentCache.delete(key);
+        fileContentCache.set(key, { etag, data });
+        if (fileContentCache.size > FILE_CACHE_ENTRIES) {
+            fileContentCache.delete(fileContentCache.keys().next().value);
+        }
+    }
+    return data;
+}
+
 async function showFileContent(filePath) {
     const modal = document.getElementById('approvalModal');
     const preview = document.getElementById('changesPreview');
@@ -1693,16 +2076,7 @@ async function showFileContent(filePath) {
         console.log('Original file path:', filePath);  // Debug log
         console.log('Relative path:', relativePath);  // Debug log
 
-        const response = await fetch('/workspace/file', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                workspace_dir: currentWorkspace,
-                file_path: relativePath
-            })
-        });
-
-        const data = await response.json();
+        const data = await fetchFileWindow(relativePath);
         console.log('File content response:', data);  // Debug log
         
         if (data.status === 'success') {
@@ -1722,7 +2096,7 @@ async function showFileContent(filePath) {
             console.log('File size:', data.file_size, 'Formatted:', fileSize);  // Debug log
             
             const fileSizeDisplay = data.truncated 
-                ? `<p class="text-yellow-400 text-sm mt-1">File is large (${fileSize}). Showing preview of first 1000 lines.</p>` 
+                ? `<p class="file-window-status text-yellow-400 text-sm mt-1">File is large (${fileSize}). Showing first ${formatFileSize(data.next_byte)}.</p>` 
                 : `<p class="text-gray-400 text-sm mt-1">File size: ${fileSize}</p>`;
             
             fileInfo.innerHTML = `
@@ -1790,6 +2164,72 @@ async function showFileContent(filePath) {
                 console.log('Editor refreshed');  // Debug log
             }, 100);
 
+            // Large files are read window by window
+            if (data.truncated) {
+                let nextByte = data.next_byte;
+                const status = fileInfo.querySelector('.file-window-status');
+                const moreBtn = document.createElement('button');
+                moreBtn.className = 'btn btn-secondary mr-2';
+                moreBtn.innerHTML = '<i class="fas fa-angle-double-down mr-2"></i>Load more';
+                moreBtn.onclick = async () => {
+                    moreBtn.disabled = true;
+                    try {
+                        const more = await fetchFileWindow(relativePath, { byte_start: nextByte });
+                        if (more.status !== 'success') {
+                            throw new Error(more.message || 'Unknown error');
+                        }
+                        const last = editor.lastLine();
+                        const separator = editor.getLine(last) === '' ? '' : '\n';
+                        editor.replaceRange(separator + more.content.replace(/\n$/, ''),
+                            CodeMirror.Pos(last, editor.getLine(last).length));
+                        nextByte = more.next_byte;
+                        if (more.truncated) {
+                            status.textContent = `File is large (${fileSize}). Showing first ${formatFileSize(nextByte)}.`;
+                        } else {
+                            status.textContent = `File size: ${fileSize}`;
+                            moreBtn.remove();
+                        }
+                    } catch (error) {
+                        console.error('Error loading more content:', error);
+                        showError('Failed to load more: ' + error.message);
+                    } finally {
+                        moreBtn.disabled = false;
+                    }
+                };
+                modalFooter.appendChild(moreBtn);
+
+                // Jump anywhere in the file; the server seeks via its line index
+                const lineInput = document.createElement('input');
+                lineInput.type = 'number';
+                lineInput.min = '1';
+                lineInput.placeholder = 'Go to line';
+                lineInput.className = 'bg-gray-700 text-white rounded px-2 py-1 mr-2 w-32';
+                lineInput.onkeydown = async (e) => {
+                    if (e.key !== 'Enter' || !lineInput.value) return;
+                    const lineStart = Math.max(0, parseInt(lineInput.value, 10) - 1);
+                    try {
+                        const jump = await fetchFileWindow(relativePath, { line_start: lineStart, line_count: 2000 });
+                        if (jump.status !== 'success') {
+                            throw new Error(jump.message || 'Unknown error');
+                        }
+                        editor.setOption('firstLineNumber', lineStart + 1);
+                        editor.setValue(jump.content.replace(/\n$/, ''));
+                        nextByte = jump.next_byte;
+                        const lines = jump.total_lines ? ` of ${jump.total_lines.toLocaleString()} lines` : '';
+                        status.textContent = `File is large (${fileSize}). Showing from line ${lineStart + 1}${lines}.`;
+                        if (jump.truncated && !moreBtn.isConnected) {
+                            modalFooter.insertBefore(moreBtn, lineInput);
+                        } else if (!jump.truncated) {
+                            moreBtn.remove();
+                        }
+                    } catch (error) {
+                        console.error('Error jumping to line:', error);
+                        showError('Failed to load line: ' + error.message);
+                    }
+                };
+                modalFooter.appendChild(lineInput);
+            }
+
             // Add close button to footer
             const closeBtn = document.createElement('button');
             closeBtn.className = 'btn btn-secondary';
@@ -2079,7 +2519,11 @@ async function showFolderBrowser(path = null) {
         }
 
         showLoading('Loading folders...');
-        const response = await fetch(`/available-folders${path ? `?path=${encodeURIComponent(path)}` : ''}`);
+        // Folder sizes are computed in the background and pushed over the socket
+        const params = new URLSearchParams();
+        if (path) params.set('path', path);
+        if (socket && socket.id) params.set('sid', socket.id);
+        const response = await fetch(`/available-folders?${params.toString()}`);
         const data = await response.json();
         
         if (data.status !== 'success') {
@@ -2132,9 +2576,12 @@ async function showFolderBrowser(path = null) {
             
             let details = '';
             if (item.is_importable) {
+                const sizeText = item.size_pending
+                    ? '<i class="fas fa-spinner fa-spin mr-1"></i>Calculating size...'
+                    : formatFolderSize(item.files, item.size);
                 details = `
                     <div class="text-sm text-gray-400 mt-1">
-                        ${item.files} files · ${formatFileSize(item.size)} · 
+                        <span class="folder-size">${sizeText}</span> · 
                         Modified: ${new Date(item.modified * 1000).toLocaleString()}
                     </div>
                 `;
@@ -2149,6 +2596,7 @@ async function showFolderBrowser(path = null) {
             `;
             
             folderDiv.appendChild(info);
+            folderDiv.dataset.folderPath = item.path;
             
             // Add import button for importable folders
             if (item.is_importable) {
@@ -2240,6 +2688,7 @@ async function getRecommendations(path, type) {
     
     // Show loading indicator
     const loadingMessage = appendChatMessage('<i class="fas fa-spinner fa-spin"></i> Analyzing...', 'assistant', true);
+    chatStreamTarget = loadingMessage;
     
     try {
         const response = await fetch('/chat', {
@@ -2258,16 +2707,18 @@ async function getRecommendations(path, type) {
         const data = await response.json();
         
         // Remove loading message
+        chatStreamTarget = null;
         loadingMessage.remove();
 
         if (data.status === 'success') {
-            const formattedResponse = formatChatResponse(data.response);
-            appendChatMessage(formattedResponse, 'assistant', true);
+            // The response is already rendered to HTML by the server
+            highlightChatCode(appendChatMessage(data.response, 'assistant', true));
         } else {
             appendErrorMessage(data.message || 'Failed to get recommendations');
         }
     } catch (error) {
         console.error('Error:', error);
+        chatStreamTarget = null;
         loadingMessage.remove();
         appendErrorMessage('Error: ' + error.message);
     }
@@ -0,0 +1,419 @@
+"""Paged CSV/TSV previews with server-side sort and filter."""
+
+# pylama:ignore=E501,C901
+import csv
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from file_reader import FileReader, get_file_reader
+
+_INTEGER = re.compile(r"^[+-]?\d+$")
+_NUMBER = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+_BOOLEANS = {"true", "false", "yes", "no"}
+_COMPARISON = re.compile(r"^(>=|<=|!=|>|<|=)\s*(.+)$")
+
+# (sort column, descending, filter column, filter text)
+ViewKey = Tuple[Optional[int], bool, Optional[int], str]
+
+
+def infer_type(values: List[str]) -> str:
+    """Narrowest of integer, number, boolean, date and string fitting values"""
+    values = [v.strip() for v in values if v.strip()]
+    if not values:
+        return "string"
+    for name, matches in (("integer", _INTEGER.match),
+                          ("number", _NUMBER.match),
+                          ("boolean", lambda v: v.lower() in _BOOLEANS),
+                          ("date", _DATE.match)):
+        if all(matches(v) for v in values):
+            return name
+    return "string"
+
+
+def _number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TableIndex:
+    """Structure of one version of a delimited file.
+
+    offsets[k] is where data row k * stride starts; rows spanning lines
+    (quoted newlines) are kept whole.
+    """
+
+    def __init__(self, key: Tuple[int, int, int], delimiter: str,
+                 encoding: str, columns: List[str], types: List[str],
+                 data_start: int, stride: int):
+        self.key = key
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.columns = columns
+        self.types = types
+        self.data_start = data_start
+        self.stride = stride
+        self.offsets = array("Q")
+        self.row_count = 0
+        self.views: "OrderedDict[ViewKey, array]" = OrderedDict()
+
+
+class TablePreview:
+    """Row windows of CSV/TSV files of any size, at flat cost per page.
+
+    The first request streams the file once, recording the byte offset of
+    every ROW_STRIDE-th row and inferring column types from the first rows;
+    unsorted pages then cost one seek plus at most ROW_STRIDE skipped rows.
+    A sort or filter streams the file once more to build a view (the
+    offsets of matching rows in order), after which each page reads only
+    its own rows. Indexes and views are kept per file version in memory.
+    """
+
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    ROW_STRIDE = 128
+    TYPE_SAMPLE_ROWS = 1000
+    PARSE_BATCH = 4096  # Rows decoded and parsed together
+    MAX_TABLES = 8
+    MAX_VIEWS = 8  # Sorted/filtered views kept per table
+
+    def __init__(self,
+                 reader: Optional[FileReader] = None,
+                 pause: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            reader: Shared file reader, for encoding detection
+            pause: Called between batches while streaming a file
+        """
+        self.reader = reader or get_file_reader()
+        self.pause = pause
+        self._tables: "OrderedDict[str, TableIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ends_in_quotes(line: bytes, in_quotes: bool, delimiter: bytes) -> bool:
+        """Whether a quoted field is still open at the end of line.
+
+        Like the csv module, only a quote at the start of a field opens a
+        quoted field; quotes elsewhere (55" screen) are literal.
+        """
+        i = 0
+        n = len(line)
+        while i < n:
+            if in_quotes:
+                j = line.find(b'"', i)
+                if j < 0:
+                    return True
+                if line[j + 1:j + 2] == b'"':  # Escaped quote
+                    i = j + 2
+                    continue
+                in_quotes = False
+                i = j + 1
+            elif line[i:i + 1] == b'"':
+                in_quotes = True
+                i += 1
+                continue
+            # Skip to the start of the next field
+            k = line.find(delimiter, i)
+            if k < 0:
+                return False
+            i = k + 1
+        return in_quotes
+
+    def _records(self, f, start: int,
+                 delimiter: str) -> Iterator[Tuple[int, bytes]]:
+        """Yield (offset, raw bytes) of each record from start.
+
+        A record ends at a newline outside a quoted field.
+        """
+        separator = delimiter.encode("latin-1")
+        f.seek(start)
+        offset = start
+        pending: List[bytes] = []
+        pending_start = start
+        in_quotes = False
+        for line in f:
+            if not pending:
+                pending_start = offset
+            pending.append(line)
+            offset += len(line)
+            if in_quotes or b'"' in line:
+                in_quotes = self._ends_in_quotes(line, in_quotes, separator)
+            if not in_quotes:
+                yield pending_start, pending[0] if len(
+                    pending) == 1 else b"".join(pending)
+                pending = []
+        if pending:
+            yield pending_start, b"".join(pending)
+
+    @staticmethod
+    def _parse_record(text: str, delimiter: str) -> List[str]:
+        """Parse one record, splitting on the delimiter if csv rejects it"""
+        try:
+            return next(csv.reader([text], delimiter=delimiter), [])
+        except csv.Error:
+            return text.rstrip("\r\n").split(delimiter)
+
+    def _parse(self, table: TableIndex, raw: List[bytes]) -> List[List[str]]:
+        texts = [r.decode(table.encoding, errors="replace") for r in raw]
+        try:
+            rows = list(csv.reader(texts, delimiter=table.delimiter))
+            if len(rows) == len(texts):
+                return rows
+        except csv.Error:
+            pass
+        # A malformed record must not fail the whole page
+        return [self._parse_record(text, table.delimiter) for text in texts]
+
+    def _batches(self, table: TableIndex, f
+                 ) -> Iterator[Tuple[List[int], List[List[str]]]]:
+        """Stream all data rows as batches of (offsets, parsed rows)"""
+        offsets: List[int] = []
+        raw: List[bytes] = []
+        for offset, record in self._records(f, table.data_start,
+                                            table.delimiter):
+            offsets.append(offset)
+            raw.append(record)
+            if len(raw) >= self.PARSE_BATCH:
+                yield offsets, self._parse(table, raw)
+                offsets, raw = [], []
+                if self.pause:
+                    self.pause()
+        if raw:
+            yield offsets, self._parse(table, raw)
+
+    def _build(self, path: str, st: os.stat_result) -> TableIndex:
+        info = self.reader.sniff(path)
+        encoding = info.encoding or "latin-1"
+        with open(path, "rb") as f:
+            sample = f.read(64 * 1024).decode(encoding, errors="replace")
+            if path.lower().endswith(".tsv"):
+                delimiter = "\t"
+            else:
+                try:
+                    delimiter = csv.Sniffer().sniff(sample,
+                                                    delimiters=",;\t|").delimiter
+                except csv.Error:
+                    delimiter = ","
+
+            records = self._records(f, 0, delimiter)
+            header = next(records, None)
+            data_start = header[0] + len(header[1]) if header else 0
+            columns = (self._parse_record(
+                header[1].decode(encoding, errors="replace"), delimiter)
+                       if header else [])
+            table = TableIndex((st.st_ino, st.st_mtime_ns, st.st_size),
+                               delimiter, encoding, columns, [],
+                               data_start, self.ROW_STRIDE)
+
+            # Only offsets are needed here, so rows past the type sample
+            # are never decoded or parsed
+            sample_rows: List[bytes] = []
+            row = 0
+            for offset, record in self._records(f, data_start, delimiter):
+                if row % self.ROW_STRIDE == 0:
+                    table.offsets.append(offset)
+                    if self.pause and row % (self.ROW_STRIDE * 256) == 0:
+                        self.pause()
+                if row < self.TYPE_SAMPLE_ROWS:
+                    sample_rows.append(record)
+                row += 1
+            table.row_count = row
+
+        samples: List[List[str]] = [[] for _ in columns]
+        for values in self._parse(table, sample_rows):
+            for i, value in enumerate(values[:len(columns)]):
+                samples[i].append(value)
+        table.types = [infer_type(values) for values in samples]
+        return table
+
+    def _table(self, path: str) -> TableIndex:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            table = self._tables.get(path)
+            if table is not None and table.key == key:
+                self._tables.move_to_end(path)
+                return table
+        table = self._build(path, st)
+        with self._lock:
+            self._tables[path] = table
+            while len(self._tables) > self.MAX_TABLES:
+                self._tables.popitem(last=False)
+        return table
+
+    def _sort_key(self, column_type: str) -> Callable[[str], Tuple]:
+        """Key putting empty or unparseable values last in either order"""
+        if column_type in ("integer", "number"):
+            def key(value):
+                number = _number(value)
+                return (1, 0.0) if number is None else (0, number)
+        else:
+            def key(value):
+                return (0, value.lower()) if value.strip() else (1, "")
+        return key
+
+    def _matcher(self, table: TableIndex, column: Optional[int],
+                 text: str) -> Callable[[List[str]], bool]:
+        """Row predicate: a comparison on numeric columns, else substring"""
+        if column is not None and table.types[column] in ("integer",
+                                                          "number"):
+            comparison = _COMPARISON.match(text.strip())
+            target = _number(comparison.group(2)) if comparison else None
+            if target is not None:
+                op = comparison.group(1)
+                tests = {
+                    ">": lambda v: v > target,
+                    "<": lambda v: v < target,
+                    ">=": lambda v: v >= target,
+                    "<=": lambda v: v <= target,
+                    "=": lambda v: v == target,
+                    "!=": lambda v: v != target,
+                }
+                test = tests[op]
+
+                def compare(values):
+                    if column >= len(values):
+                        return False
+                    number = _number(values[column])
+                    return number is not None and test(number)
+
+                return compare
+
+        needle = text.lower()
+        if column is None:
+            return lambda values: any(needle in v.lower() for v in values)
+        return lambda values: (column < len(values)
+                               and needle in values[column].lower())
+
+    def _view(self, path: str, table: TableIndex, view_key: ViewKey) -> array:
+        """Offsets of the rows a sort/filter selects, in display order"""
+        with self._lock:
+            view = table.views.get(view_key)
+            if view is not None:
+                table.views.move_to_end(view_key)
+                return view
+
+        sort_column, descending, filter_column, filter_text = view_key
+        matches = (self._matcher(table, filter_column, filter_text)
+                   if filter_text else None)
+        selected: List[int] = []
+        keys: List[Tuple] = []
+        sort_key = (self._sort_key(table.types[sort_column])
+                    if sort_column is not None else None)
+        with open(path, "rb") as f:
+            for offsets, rows in self._batches(table, f):
+                for offset, values in zip(offsets, rows):
+                    if matches is not None and not matches(values):
+                        continue
+                    selected.append(offset)
+                    if sort_key is not None:
+                        keys.append(
+                            sort_key(values[sort_column] if sort_column < len(
+                                values) else ""))
+
+        if sort_key is not None:
+            order = sorted(range(len(selected)), key=keys.__getitem__)
+            if descending:
+                # Keep empty values last when reversing
+                filled = [i for i in order if keys[i][0] == 0]
+                order = filled[::-1] + order[len(filled):]
+            selected = [selected[i] for i in order]
+
+        view = array("Q", selected)
+        with self._lock:
+            table.views[view_key] = view
+            while len(table.views) > self.MAX_VIEWS:
+                table.views.popitem(last=False)
+        return view
+
+    def _column(self, table: TableIndex, column: Any) -> Optional[int]:
+        """Resolve a column given by name or index"""
+        if column is None or column == "":
+            return None
+        if isinstance(column, str) and column in table.columns:
+            return table.columns.index(column)
+        try:
+            index = int(column)
+        except (TypeError, ValueError):
+            raise ValueError(f"Unknown column: {column}")
+        if not 0 <= index < len(table.columns):
+            raise ValueError(f"Unknown column: {column}")
+        return index
+
+    def page(self,
+             path: str,
+             offset: int = 0,
+             limit: int = PAGE_SIZE,
+             sort: Any = None,
+             descending: bool = False,
+             filter_text: Optional[str] = None,
+             filter_column: Any = None) -> Dict[str, Any]:
+        """A window of rows, optionally sorted and filtered.
+
+        Args:
+            path: CSV/TSV file
+            offset: First row of the window, after sorting and filtering
+            limit: Rows in the window, at most MAX_PAGE_SIZE
+            sort: Column name or index to sort by
+            descending: Sort order
+            filter_text: Substring to match, or a comparison such as ">10"
+                when filter_column is numeric
+            filter_column: Column name or index to filter; all if None
+
+        Returns:
+            Columns with inferred types, the rows, and the total row count
+            of the (filtered) view.
+        """
+        table = self._table(path)
+        limit = max(0, min(limit, self.MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        sort_column = self._column(table, sort)
+        filter_index = self._column(table, filter_column)
+
+        rows: List[List[str]] = []
+        if sort_column is None and not filter_text:
+            total = table.row_count
+            block = offset // table.stride
+            if offset < total and block < len(table.offsets):
+                skip = offset - block * table.stride
+                raw = []
+                with open(path, "rb") as f:
+                    for _, record in self._records(f, table.offsets[block],
+                                                   table.delimiter):
+                        if skip:
+                            skip -= 1
+                            continue
+                        raw.append(record)
+                        if len(raw) >= limit:
+                            break
+                rows = self._parse(table, raw)
+        else:
+            view = self._view(path, table,
+                              (sort_column, bool(descending), filter_index,
+                               filter_text or ""))
+            total = len(view)
+            raw = []
+            with open(path, "rb") as f:
+                for position in view[offset:offset + limit]:
+                    raw.append(
+                        next(self._records(f, position, table.delimiter))[1])
+            rows = self._parse(table, raw)
+
+        return {
+            "columns": [{
+                "name": name,
+                "type": column_type
+            } for name, column_type in zip(table.columns, table.types)],
+            "rows": rows,
+            "offset": offset,
+            "total_rows": total,
+            "delimiter": table.delimiter,
+        }
@@ -0,0 +1,44 @@
+from workspace_manager import TermSummary
+
+
+def matches(text, query):
+    summary = TermSummary.from_text(text)
+    return any(
+        summary.might_contain(TermSummary.hash_term(term))
+        for term in TermSummary.query_terms(query))
+
+
+def test_whole_words_match():
+    assert matches("def login(user): pass", "login")
+    assert matches("def login(user): pass", "LOGIN")
+
+
+def test_prefixes_match():
+    assert matches("Uses token authentication.", "auth")
+    assert matches("Uses token authentication.", "authenticat")
+
+
+def test_camel_case_parts_match():
+    text = "class AuthManager: parse HTTPRequest"
+    assert matches(text, "auth")
+    assert matches(text, "manager")
+    assert matches(text, "authmanager")
+    assert matches(text, "request")
+    assert matches(text, "http")
+
+
+def test_snake_case_parts_match():
+    text = "refresh_access_token = user_id"
+    assert matches(text, "access")
+    assert matches(text, "token")
+    assert matches(text, "id")
+    assert matches(text, "refresh_acc")
+
+
+def test_long_terms_match_by_prefix():
+    assert matches("internationalization_helpers", "internationalization")
+
+
+def test_absent_terms_do_not_match():
+    # Hashes are deterministic, so this false-positive check is stable
+    assert not matches("alpha beta", "gamma")
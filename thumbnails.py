@@ -0,0 +1,180 @@
+"""On-disk cache of image thumbnails keyed by content hash."""
+
+# pylama:ignore=E501
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Set, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: without Pillow, previews use the full image
+    Image = None
+    ImageOps = None
+
+# Formats Pillow can decode that are worth thumbnailing
+THUMBNAIL_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"}
+
+
+class ThumbnailCache:
+    """Small renditions of workspace images, generated once per content.
+
+    Thumbnails are stored under cache_dir by the SHA-256 of the source
+    bytes, so identical images (forks, copies) share one thumbnail and an
+    edited image gets a new one. Digests are remembered per (inode,
+    mtime_ns, size), so an unchanged file is not re-hashed. Opaque images
+    become JPEGs and images with transparency PNGs.
+
+    Hashing and decoding are slow for large images, so request handlers
+    use cached() and render_async(): the work runs on a background worker,
+    through run_blocking if given (e.g. eventlet.tpool.execute, to keep it
+    off the event loop).
+    """
+
+    SIZE = 256  # Longest side in pixels
+    JPEG_QUALITY = 80
+    HASH_BLOCK_SIZE = 1024 * 1024
+    MAX_DIGESTS = 4096  # Remembered file digests
+
+    def __init__(self,
+                 cache_dir: str,
+                 size: int = SIZE,
+                 run_blocking: Optional[Callable[..., Any]] = None):
+        """
+        Args:
+            cache_dir: Directory holding the thumbnails
+            size: Longest side of a thumbnail in pixels
+            run_blocking: Called as run_blocking(func, *args) to run
+                hashing and rendering in background jobs
+        """
+        self.cache_dir = cache_dir
+        self.size = size
+        self.run_blocking = run_blocking
+        self._digests: "OrderedDict[str, Tuple[Tuple[int, int, int], str]]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._workers = ThreadPoolExecutor(max_workers=2)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def supports(self, path: str) -> bool:
+        return (self.available and os.path.splitext(path.lower())[1]
+                in THUMBNAIL_EXTENSIONS)
+
+    def content_hash(self, path: str) -> str:
+        """SHA-256 of a file, cached per file version"""
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        cached = self._known_digest(path, key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(self.HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+        with self._lock:
+            self._digests[path] = (key, digest.hexdigest())
+            self._digests.move_to_end(path)
+            while len(self._digests) > self.MAX_DIGESTS:
+                self._digests.popitem(last=False)
+        return digest.hexdigest()
+
+    def _known_digest(self, path: str, key: Tuple[int, int, int]) -> Optional[str]:
+        with self._lock:
+            cached = self._digests.get(path)
+            if cached and cached[0] == key:
+                self._digests.move_to_end(path)
+                return cached[1]
+        return None
+
+    def _cached_path(self, digest: str) -> Optional[str]:
+        base = os.path.join(self.cache_dir, digest[:2],
+                            f"{digest}-{self.size}")
+        for ext in (".jpg", ".png"):
+            if os.path.exists(base + ext):
+                return base + ext
+        return None
+
+    def _render(self, path: str, digest: str) -> str:
+        with Image.open(path) as image:
+            # JPEGs can decode at a reduced scale directly
+            image.draft("RGB", (self.size, self.size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((self.size, self.size))
+            has_alpha = (image.mode in ("RGBA", "LA", "PA")
+                         or "transparency" in image.info)
+
+            target_dir = os.path.join(self.cache_dir, digest[:2])
+            os.makedirs(target_dir, exist_ok=True)
+            ext = ".png" if has_alpha else ".jpg"
+            target = os.path.join(target_dir, f"{digest}-{self.size}{ext}")
+            tmp_path = f"{target}.{threading.get_ident()}.tmp"
+            try:
+                if has_alpha:
+                    image.convert("RGBA").save(tmp_path, "PNG", optimize=True)
+                else:
+                    image.convert("RGB").save(tmp_path,
+                                              "JPEG",
+                                              quality=self.JPEG_QUALITY,
+                                              optimize=True)
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return target
+
+    def get(self, path: str) -> Optional[str]:
+        """Path of an image's thumbnail, rendering it on first use.
+
+        Returns None when Pillow is missing or the image cannot be decoded.
+        """
+        if not self.supports(path):
+            return None
+        try:
+            digest = self.content_hash(path)
+            return self._cached_path(digest) or self._render(path, digest)
+        except Exception as e:
+            print(f"Could not create thumbnail for {path}: {e}")
+            return None
+
+    def cached(self, path: str) -> Optional[str]:
+        """Path of an image's thumbnail if it is ready, without hashing or
+        decoding anything"""
+        if not self.supports(path):
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        digest = self._known_digest(path, (st.st_ino, st.st_mtime_ns, st.st_size))
+        return self._cached_path(digest) if digest else None
+
+    def render_async(self, path: str) -> None:
+        """Make an image's thumbnail in the background, once at a time"""
+        if not self.supports(path):
+            return
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._workers.submit(self._render_job, path)
+
+    def _render_job(self, path: str) -> None:
+        try:
+            if self.run_blocking:
+                self.run_blocking(self.get, path)
+            else:
+                self.get(path)
+        finally:
+            with self._lock:
+                self._pending.discard(path)
@@ -0,0 +1,184 @@
+"""Per-model token counting with calibrated estimators and cached counts."""
+
+# pylama:ignore=E501
+import abc
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:  # Optional: exact counts for OpenAI-family models
+    tiktoken = None
+
+
+class TokenCounter(abc.ABC):
+    """Interface for counting tokens in text for one tokenizer family."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+
+
+@dataclass
+class TokenizerProfile:
+    """Calibration for the heuristic estimator of one tokenizer family.
+
+    Text is split the way BPE pre-tokenizers split it (words, numbers,
+    punctuation runs, whitespace runs), and each piece is costed from its
+    length. This follows code full of symbols and indentation far better
+    than a flat characters-per-token ratio.
+    """
+
+    chars_per_word_token: float = 4.0
+    digits_per_token: int = 3
+    chars_per_punct_token: float = 1.5
+    spaces_per_token: int = 8
+    # Non-ASCII letters (CJK etc.) are roughly one token per character
+    non_ascii_per_token: float = 1.0
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """Offline token estimator calibrated per tokenizer family."""
+
+    PIECE_PATTERN = re.compile(
+        r"(?P<word> ?[A-Za-z]+)"
+        r"|(?P<num>\d+)"
+        r"|(?P<other> ?[^\W\d_]+)"
+        r"|(?P<newline>\n[ \t]*)"
+        r"|(?P<space>[ \t]+)"
+        r"|(?P<punct> ?[^\w\s]+)"
+        r"|(?P<misc>\S)")
+
+    def __init__(self, name: str, profile: TokenizerProfile):
+        self.name = name
+        self.profile = profile
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        p = self.profile
+        total = 0
+        for match in self.PIECE_PATTERN.finditer(text):
+            kind = match.lastgroup
+            length = match.end() - match.start()
+            if kind == "word":
+                total += math.ceil(length / p.chars_per_word_token)
+            elif kind == "num":
+                total += math.ceil(length / p.digits_per_token)
+            elif kind == "other":
+                total += math.ceil(length / p.non_ascii_per_token)
+            elif kind in ("newline", "space"):
+                total += math.ceil(length / p.spaces_per_token)
+            elif kind == "punct":
+                total += math.ceil(length / p.chars_per_punct_token)
+            else:
+                total += 1
+        return total
+
+
+class TiktokenCounter(TokenCounter):
+    """Exact counts through tiktoken, when it is installed."""
+
+    def __init__(self, encoding_name: str):
+        self.name = encoding_name
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class CachedTokenCounter(TokenCounter):
+    """Wrap a counter with an LRU cache keyed by content hash.
+
+    Hashing is far cheaper than counting, so unchanged files (and repeated
+    system prompts) are counted once per process rather than per request.
+    """
+
+    MIN_CACHED_LENGTH = 256
+
+    def __init__(self, counter: TokenCounter, max_entries: int = 8192):
+        self.counter = counter
+        self.name = counter.name
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> int:
+        if len(text) < self.MIN_CACHED_LENGTH:
+            return self.counter.count(text)
+
+        key = hashlib.blake2b(text.encode("utf-8", errors="surrogatepass"),
+                              digest_size=16).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        tokens = self.counter.count(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = tokens
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return tokens
+
+
+# Calibrations per tokenizer family, keyed by the "tokenizer" entry of a
+# model configuration
+PROFILES: Dict[str, TokenizerProfile] = {
+    "o200k": TokenizerProfile(chars_per_word_token=4.4,
+                              chars_per_punct_token=1.8),
+    "cl100k": TokenizerProfile(chars_per_word_token=4.0,
+                               chars_per_punct_token=1.6),
+    "claude": TokenizerProfile(chars_per_word_token=3.6,
+                               chars_per_punct_token=1.4,
+                               spaces_per_token=4),
+    "gemini": TokenizerProfile(chars_per_word_token=4.2,
+                               digits_per_token=1,
+                               chars_per_punct_token=1.5),
+    "deepseek": TokenizerProfile(chars_per_word_token=3.8,
+                                 digits_per_token=1,
+                                 chars_per_punct_token=1.5,
+                                 spaces_per_token=4),
+    "mistral": TokenizerProfile(chars_per_word_token=3.5,
+                                digits_per_token=1,
+                                chars_per_punct_token=1.3,
+                                spaces_per_token=4),
+}
+DEFAULT_TOKENIZER = "cl100k"
+
+# Families that tiktoken can count exactly
+TIKTOKEN_ENCODINGS = {"o200k": "o200k_base", "cl100k": "cl100k_base"}
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(tokenizer: Optional[str] = None) -> TokenCounter:
+    """Get the shared, cached counter for a tokenizer family"""
+    tokenizer = tokenizer if tokenizer in PROFILES else DEFAULT_TOKENIZER
+    with _counters_lock:
+        counter = _counters.get(tokenizer)
+        if counter is None:
+            base: TokenCounter = HeuristicTokenCounter(
+                tokenizer, PROFILES[tokenizer])
+            if tiktoken is not None and tokenizer in TIKTOKEN_ENCODINGS:
+                try:
+                    base = TiktokenCounter(TIKTOKEN_ENCODINGS[tokenizer])
+                except Exception as e:
+                    # Encodings are downloaded on first use; stay offline
+                    print(f"Falling back to estimated token counts: {e}")
+            counter = CachedTokenCounter(base)
+            _counters[tokenizer] = counter
+        return counter
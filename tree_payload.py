@@ -0,0 +1,172 @@
+"""Compact, versioned wire format for workspace tree structures."""
+
+# pylama:ignore=E501
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (is_dir, size, has_children) of one node, keyed by its relative path
+NodeInfo = Tuple[int, int, int]
+
+# Distinguishes versions handed out by this process from earlier ones
+_EPOCH = os.urandom(4).hex()
+_version_counter = itertools.count(1)
+
+
+def flatten_structure(structure: List[dict],
+                      parent: str = "") -> Dict[str, NodeInfo]:
+    """Flatten a nested structure (names relative to parent) into path -> info.
+
+    The result is in pre-order, so parents come before their children.
+    """
+    flat: Dict[str, NodeInfo] = {}
+    stack = [(parent, structure)]
+    while stack:
+        base, items = stack.pop()
+        nested = []
+        for item in items:
+            path = f"{base}/{item['path']}" if base else item["path"]
+            if item.get("type") == "directory":
+                children = item.get("children") or []
+                flat[path] = (1, 0, int(bool(item.get("has_children", children))))
+                if children:
+                    nested.append((path, children))
+            else:
+                flat[path] = (0, int(item.get("size") or 0), 0)
+        # Push in reverse so children are visited in listing order
+        stack.extend(reversed(nested))
+    return flat
+
+
+def encode_columns(paths: Iterable[str],
+                   flat: Dict[str, NodeInfo]) -> dict:
+    """Encode nodes as columnar arrays with names relative to their parent.
+
+    Each directory path is sent once in "dirs"; every node refers to its
+    parent by index into that table (-1 for the workspace root).
+    """
+    dirs: List[str] = []
+    dir_index: Dict[str, int] = {}
+    parent, name, is_dir, size, has_children = [], [], [], [], []
+    for path in paths:
+        head, _, tail = path.rpartition("/")
+        if head:
+            index = dir_index.get(head)
+            if index is None:
+                index = dir_index[head] = len(dirs)
+                dirs.append(head)
+        else:
+            index = -1
+        node_is_dir, node_size, node_children = flat[path]
+        parent.append(index)
+        name.append(tail)
+        is_dir.append(node_is_dir)
+        size.append(node_size)
+        has_children.append(node_children)
+    return {
+        "dirs": dirs,
+        "parent": parent,
+        "name": name,
+        "is_dir": is_dir,
+        "size": size,
+        "has_children": has_children,
+    }
+
+
+def diff_flat(old: Dict[str, NodeInfo],
+              new: Dict[str, NodeInfo]) -> Tuple[List[str], List[str], List[str]]:
+    """Get (added, removed, changed) paths between two flattened trees.
+
+    Removed paths below an already removed directory are left out, since
+    removing a directory removes its subtree.
+    """
+    added = [path for path in new if path not in old]
+    changed = [
+        path for path, info in new.items()
+        if path in old and old[path] != info
+    ]
+    removed_dirs = set()
+    removed = []
+    for path in old:
+        if path in new:
+            continue
+        head = path.rpartition("/")[0]
+        covered = False
+        while head:
+            if head in removed_dirs:
+                covered = True
+                break
+            head = head.rpartition("/")[0]
+        if old[path][0]:
+            removed_dirs.add(path)
+        if not covered:
+            removed.append(path)
+    return added, removed, changed
+
+
+class StructureHistory:
+    """Recent snapshots of one workspace's structure, for delta payloads.
+
+    Every distinct structure gets a version token. A client that reports a
+    token still held here receives only the added, removed and changed
+    nodes; otherwise it receives the full tree.
+    """
+
+    MAX_SNAPSHOTS = 8
+
+    def __init__(self):
+        self._snapshots: "OrderedDict[str, Dict[str, NodeInfo]]" = OrderedDict()
+        self._latest_structure: Optional[List[dict]] = None
+        self._latest_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def record(self, structure: List[dict]) -> str:
+        """Store a structure snapshot if it changed; returns its version"""
+        with self._lock:
+            # The structure cache hands back the same list while unchanged
+            if structure is self._latest_structure:
+                return self._latest_version
+            flat = flatten_structure(structure)
+            if (self._latest_version is not None
+                    and self._snapshots.get(self._latest_version) == flat):
+                self._latest_structure = structure
+                return self._latest_version
+
+            version = f"{_EPOCH}.{next(_version_counter)}"
+            self._snapshots[version] = flat
+            while len(self._snapshots) > self.MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+            self._latest_structure = structure
+            self._latest_version = version
+            return version
+
+    def payload(self, structure: List[dict],
+                since_version: Optional[str] = None) -> dict:
+        """Build the compact payload for a structure.
+
+        Returns {"version", "full": columns} or, when since_version is
+        known, {"version", "base_version"} plus whichever of "added",
+        "removed" and "changed" are non-empty.
+        """
+        version = self.record(structure)
+        with self._lock:
+            current = self._snapshots[version]
+            base = self._snapshots.get(since_version) if since_version else None
+
+        if base is None:
+            return {"version": version, "full": encode_columns(current, current)}
+        if since_version == version:
+            return {"version": version, "base_version": since_version}
+
+        added, removed, changed = diff_flat(base, current)
+        delta = {"version": version, "base_version": since_version}
+        # Empty sections are left out to keep small edits small
+        if added:
+            delta["added"] = encode_columns(added, current)
+        if removed:
+            delta["removed"] = removed
+        if changed:
+            delta["changed"] = encode_columns(changed, current)
+        return delta
@@ -0,0 +1,275 @@
+"""Streaming export and import of workspaces as compressed tar archives."""
+
+# pylama:ignore=E501,C901
+import gzip
+import io
+import os
+import queue
+import shutil
+import tarfile
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # Optional: faster compression than gzip
+    zstandard = None
+
+# Archive members under this directory carry workspace metadata, not files
+META_DIR = ".workspace-meta"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+GZIP_LEVEL = 3  # Favor throughput; archives are for transfer, not storage
+ZSTD_LEVEL = 3
+QUEUE_CHUNKS = 16  # Compressed chunks buffered between writer and response
+
+# Import limits, so a small compressed archive cannot fill the disk
+MAX_IMPORT_BYTES = 8 * 1024**3  # Total size of extracted files
+MAX_IMPORT_MEMBERS = 500000
+MAX_METADATA_BYTES = 1024 * 1024  # Per metadata entry, held in memory
+
+WalkFunction = Callable[[str], Iterator[Tuple[str, List[os.DirEntry],
+                                              List[os.DirEntry]]]]
+
+DEFAULT_COMPRESSION = "zstd" if zstandard is not None else "gzip"
+EXTENSIONS = {"zstd": ".tar.zst", "gzip": ".tar.gz"}
+MIME_TYPES = {"zstd": "application/zstd", "gzip": "application/gzip"}
+
+
+class _QueueWriter(io.RawIOBase):
+    """Write-only file object handing chunks to a bounded queue."""
+
+    def __init__(self, chunks: "queue.Queue[Optional[bytes]]",
+                 cancelled: threading.Event):
+        self._chunks = chunks
+        self._cancelled = cancelled
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if data:
+            chunk = bytes(data)
+            # Stop producing once the consumer has gone away
+            while True:
+                if self._cancelled.is_set():
+                    raise OSError("Export cancelled")
+                try:
+                    self._chunks.put(chunk, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+        return len(data)
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Read-only stream that replays bytes already peeked from another."""
+
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def resolve_compression(requested: Optional[str]) -> str:
+    """Pick an available compression, falling back to gzip"""
+    if requested == "zstd" and zstandard is not None:
+        return "zstd"
+    if requested in (None, ""):
+        return DEFAULT_COMPRESSION
+    return "gzip"
+
+
+def _write_archive(workspace_dir: str, walk: WalkFunction, compression: str,
+                   metadata: Dict[str, bytes], sink: _QueueWriter) -> None:
+    if compression == "zstd":
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+            sink, closefd=False)
+    else:
+        compressed = gzip.GzipFile(fileobj=sink,
+                                   mode="wb",
+                                   compresslevel=GZIP_LEVEL)
+
+    with compressed:
+        with tarfile.open(fileobj=compressed, mode="w|",
+                          format=tarfile.PAX_FORMAT) as tar:
+            tar.copybufsize = COPY_BUFFER_SIZE
+            for rel_dir, dir_entries, file_entries in walk(workspace_dir):
+                for entry in dir_entries:
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    tar.add(entry.path, arcname=rel, recursive=False)
+                for entry in file_entries:
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    # Files that cannot be opened are skipped. Once the
+                    # header is written, a failed read (e.g. the file shrank)
+                    # cannot be skipped without corrupting the archive, so
+                    # it aborts the export.
+                    try:
+                        f = open(entry.path, "rb")
+                    except OSError as e:
+                        print(f"Skipping {rel} in export: {e}")
+                        continue
+                    with f:
+                        info = tar.gettarinfo(arcname=rel, fileobj=f)
+                        tar.addfile(info, f)
+
+            for name, data in metadata.items():
+                info = tarfile.TarInfo(f"{META_DIR}/{name}")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+
+
+def stream_export(workspace_dir: str,
+                  walk: WalkFunction,
+                  compression: str = DEFAULT_COMPRESSION,
+                  metadata: Optional[Dict[str, bytes]] = None
+                  ) -> Iterator[bytes]:
+    """Stream a workspace as a compressed tar archive.
+
+    Files come from walk (so skip folders and ignore rules apply) and are
+    read in COPY_BUFFER_SIZE blocks. Archiving runs on a worker thread
+    feeding a bounded queue of compressed chunks, so memory stays constant
+    however large the files are. metadata entries are added under META_DIR.
+    """
+    chunks: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    errors: List[BaseException] = []
+
+    def produce():
+        try:
+            _write_archive(workspace_dir, walk, compression, metadata or {},
+                           _QueueWriter(chunks, cancelled))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # The end marker must get through even if the queue is full
+            while not cancelled.is_set():
+                try:
+                    chunks.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    threading.Thread(target=produce, name="workspace-export",
+                     daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        cancelled.set()
+    if errors:
+        raise errors[0]
+
+
+def _decompressed(stream):
+    """Wrap an archive stream with the decompressor its magic bytes call for"""
+    magic = stream.read(4)
+    reader = io.BufferedReader(_PrefixedReader(magic, stream),
+                               buffer_size=COPY_BUFFER_SIZE)
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("zstd archives need the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(reader)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=reader, mode="rb")
+    return reader  # Uncompressed tar
+
+
+def _safe_member_path(name: str) -> Optional[str]:
+    """Normalize an archive member name, rejecting paths that escape"""
+    name = name.replace("\\", "/").lstrip("/")
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return os.path.join(*parts)
+
+
+def import_archive(stream,
+                   target_dir: str,
+                   max_bytes: int = MAX_IMPORT_BYTES,
+                   max_members: int = MAX_IMPORT_MEMBERS) -> Dict[str, bytes]:
+    """Extract a workspace archive from a stream into target_dir.
+
+    The archive is read strictly sequentially, so it can come straight from
+    a request body. Only directories and regular files are extracted; links,
+    devices and paths escaping the workspace are skipped. Files are
+    extracted into a temporary sibling directory that is renamed into place
+    at the end, so a failed import leaves nothing behind. Imports exceeding
+    max_bytes of files, max_members entries or MAX_METADATA_BYTES per
+    metadata entry are aborted with ValueError.
+
+    Returns:
+        Metadata entries found under META_DIR, by name.
+    """
+    if os.path.exists(target_dir):
+        raise ValueError("A workspace with this name already exists")
+
+    staging_dir = os.path.join(
+        os.path.dirname(target_dir),
+        f".incoming-{os.path.basename(target_dir)}-{time.time_ns()}")
+    os.makedirs(staging_dir)
+    metadata: Dict[str, bytes] = {}
+    total_bytes = 0
+    members = 0
+    try:
+        with tarfile.open(fileobj=_decompressed(stream), mode="r|") as tar:
+            for member in tar:
+                members += 1
+                if members > max_members:
+                    raise ValueError(
+                        f"Archive has more than {max_members} entries")
+                if member.isfile():
+                    # Sizes come from the headers, so this is checked
+                    # before anything is written
+                    total_bytes += member.size
+                    if total_bytes > max_bytes:
+                        raise ValueError(
+                            f"Archive expands to more than {max_bytes} bytes")
+
+                rel = _safe_member_path(member.name)
+                if rel is None:
+                    continue
+                if rel.split(os.sep, 1)[0] == META_DIR:
+                    if member.isfile():
+                        if member.size > MAX_METADATA_BYTES:
+                            raise ValueError(
+                                f"Metadata entry {member.name} is too large")
+                        source = tar.extractfile(member)
+                        metadata[rel[len(META_DIR) + 1:]] = source.read(
+                            MAX_METADATA_BYTES)
+                    continue
+
+                path = os.path.join(staging_dir, rel)
+                if member.isdir():
+                    os.makedirs(path, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    source = tar.extractfile(member)
+                    with open(path, "wb") as f:
+                        shutil.copyfileobj(source, f, COPY_BUFFER_SIZE)
+                    os.utime(path, (member.mtime, member.mtime))
+        os.rename(staging_dir, target_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return metadata
@@ -0,0 +1,88 @@
+"""Copy-on-write cloning of workspace trees."""
+
+# pylama:ignore=E501
+import errno
+import os
+import shutil
+from typing import Dict, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, files are copied
+    fcntl = None
+
+# ioctl request cloning a whole file on Linux (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Errors meaning "this filesystem/platform cannot do it", not a real failure
+_UNSUPPORTED = {
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.EPERM,
+    errno.ENOSYS
+}
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError:
+            os.close(fd)
+            os.remove(dst)
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+
+
+class TreeCloner:
+    """Clone a directory tree sharing file data wherever possible.
+
+    Each file is reflinked when the filesystem supports it (a true
+    copy-on-write clone), else copied. Files are never hardlinked: any
+    in-place write (the terminal, an external editor) would then change
+    both workspaces, or an imported project's original files. Once reflinks
+    fail as unsupported they are not retried for the rest of the tree.
+    """
+
+    def __init__(self, skip_root_names: Optional[Set[str]] = None):
+        self.skip_root_names = skip_root_names or set()
+        self.counts: Dict[str, int] = {"reflink": 0, "copy": 0}
+        self._reflink_ok = fcntl is not None and hasattr(fcntl, "ioctl")
+
+    def clone_file(self, src: str, dst: str) -> str:
+        """Clone one file; returns the method used"""
+        if self._reflink_ok:
+            try:
+                _reflink(src, dst)
+                self.counts["reflink"] += 1
+                return "reflink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self._reflink_ok = False
+        shutil.copy2(src, dst)
+        self.counts["copy"] += 1
+        return "copy"
+
+    def clone_tree(self, src_root: str, dst_root: str) -> Dict[str, int]:
+        """Clone src_root into dst_root, which must not exist yet"""
+        os.makedirs(dst_root)
+        stack = [("", True)]
+        while stack:
+            rel_dir, is_root = stack.pop()
+            src_dir = os.path.join(src_root, rel_dir)
+            with os.scandir(src_dir) as it:
+                entries = list(it)
+            for entry in entries:
+                if is_root and entry.name in self.skip_root_names:
+                    continue
+                rel = os.path.join(rel_dir, entry.name)
+                dst = os.path.join(dst_root, rel)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), dst)
+                elif entry.is_dir():
+                    os.mkdir(dst)
+                    stack.append((rel, False))
+                else:
+                    self.clone_file(entry.path, dst)
+        return dict(self.counts)
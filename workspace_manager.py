@@ -2,6 +2,7 @@
 
 # pylama:ignore=E501,C901,E125,E251
 import hashlib
+import json
 import logging
 import math
 import mmap
@@ -11,9 +12,20 @@ import threading
 import time
 from collections import Counter, defaultdict
 from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from content_outline import OutlineTruncator
+import file_ranges
+from file_reader import get_file_reader
+from ignore_rules import IgnoreMatcher, IgnoreRuleSet
+from line_index import LineIndexStore
+from stat_cache import StatCache
+from token_counter import TokenCounter, get_token_counter
+from tree_payload import StructureHistory
+from workspace_manifest import ManifestStore, WorkspaceManifest
+from workspace_tree import WorkspaceTree
 
 
 @dataclass
@@ -24,6 +36,69 @@ class Document:
     length: int
 
 
+class TermSummary:
+    """Compact Bloom filter over the distinct terms of a file.
+
+    Built once per file version so query scoring can test term membership
+    without touching the filesystem. False positives are possible (about 2%
+    at the default sizing), false negatives are not.
+
+    Each word is stored with its camelCase/snake_case parts and the
+    prefixes of all of them, so a query term matches the start of a word
+    or of a word part ("auth" matches authentication and AuthManager,
+    "manager" matches AuthManager and auth_manager).
+    """
+
+    BITS_PER_TERM = 10
+    NUM_HASHES = 3
+    TERM_PATTERN = re.compile(r"\w+")
+    PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+    MIN_PREFIX = 3  # Shorter words and parts only match whole
+    MAX_PREFIX = 16  # Longer query terms are matched by this prefix
+
+    def __init__(self, terms: Set[str]):
+        self.num_bits = max(64, len(terms) * self.BITS_PER_TERM)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        for term in terms:
+            for pos in self._positions(self.hash_term(term)):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    @classmethod
+    def from_text(cls, text: str) -> "TermSummary":
+        terms: Set[str] = set()
+        for word in set(cls.TERM_PATTERN.findall(text)):
+            parts = {part.lower() for part in cls.PART_PATTERN.findall(word)}
+            parts.add(word.lower())
+            for part in parts:
+                for end in range(min(cls.MIN_PREFIX, len(part)),
+                                 min(len(part), cls.MAX_PREFIX) + 1):
+                    terms.add(part[:end])
+        return cls(terms)
+
+    @classmethod
+    def query_terms(cls, query: str) -> List[str]:
+        """Split a query into the same normalized terms used for summaries"""
+        return list(dict.fromkeys(
+            term[:cls.MAX_PREFIX]
+            for term in cls.TERM_PATTERN.findall(query.lower())))
+
+    @staticmethod
+    def hash_term(term: str) -> Tuple[int, int]:
+        """Hash a term once; the result can be tested against any summary"""
+        digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+        return (int.from_bytes(digest[:4], "little"),
+                int.from_bytes(digest[4:], "little") | 1)
+
+    def _positions(self, hashed: Tuple[int, int]):
+        h1, h2 = hashed
+        for i in range(self.NUM_HASHES):
+            yield (h1 + i * h2) % self.num_bits
+
+    def might_contain(self, hashed: Tuple[int, int]) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(hashed))
+
+
 class BM25Search:
 
     def __init__(self, k1: float = 1.5, b: float = 0.75):
@@ -87,6 +162,45 @@ class BM25Search:
                     self.avg_doc_length = 0
                 self.idf_cache.clear()
 
+    def remove_prefix(self, prefix: str) -> int:
+        """Remove all documents under a path prefix; returns how many"""
+        with self._lock:
+            paths = [path for path in self.documents if path.startswith(prefix)]
+            if not paths:
+                return 0
+            for path in paths:
+                del self.documents[path]
+            self.total_docs = len(self.documents)
+            if self.total_docs > 0:
+                total_length = sum(doc.length
+                                   for doc in self.documents.values())
+                self.avg_doc_length = total_length / self.total_docs
+            else:
+                self.avg_doc_length = 0
+            self.idf_cache.clear()
+            return len(paths)
+
+    def copy_prefix(self, old_prefix: str, new_prefix: str) -> int:
+        """Duplicate all documents under one path prefix to another"""
+        with self._lock:
+            copies = [
+                Document(path=new_prefix + path[len(old_prefix):],
+                         content=doc.content,
+                         term_freqs=doc.term_freqs,
+                         length=doc.length)
+                for path, doc in self.documents.items()
+                if path.startswith(old_prefix)
+            ]
+            if not copies:
+                return 0
+            for doc in copies:
+                self.documents[doc.path] = doc
+            self.total_docs = len(self.documents)
+            total_length = sum(doc.length for doc in self.documents.values())
+            self.avg_doc_length = total_length / self.total_docs
+            self.idf_cache.clear()
+            return len(copies)
+
     def _calculate_idf(self, term: str) -> float:
         """Calculate Inverse Document Frequency for a term"""
         if term in self.idf_cache:
@@ -186,6 +300,11 @@ class WorkspaceManager:
     PREVIEW_SIZE = 10 * 1024  # 10KB for previews
     CHUNK_SIZE = 1024 * 1024  # 1MB chunks for large file reading
     LAZY_LOAD_THRESHOLD = 1000  # Number of files before switching to lazy loading
+    VIRTUAL_TREE_THRESHOLD = 500  # Number of files before the UI renders windows
+    MAX_WINDOW_ROWS = 500  # Maximum rows per tree window request
+    MANIFEST_DIR = ".manifests"  # Under the workspace root
+    STATS_YIELD_EVERY = 256  # Entries scanned between yields in stats walks
+    LINE_INDEX_DIR = ".line-index"  # Under the workspace root
     MAX_CACHE_SIZE = 100 * 1024 * 1024  # 100MB max cache size
     MAX_CACHE_ENTRIES = 1000  # Maximum number of cached files
     INDEXING_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB chunks for indexing
@@ -276,16 +395,28 @@ class WorkspaceManager:
         self.logger.info("Initialized BM25 search index")
 
         # Enhanced caching system with LRU and size tracking
+        self.file_reader = get_file_reader()
+        self.stats = StatCache()
         self._content_cache: Dict[str, Tuple[str, float, int]] = {}
-        self._structure_cache: Dict[str, Tuple[List[dict], float]] = {}
+        self._structure_cache: Dict[str, Tuple[List[dict], int]] = {}
+        self._trees: Dict[str, WorkspaceTree] = {}
+        self._structure_histories: Dict[str, StructureHistory] = {}
+        self.manifests = ManifestStore(
+            os.path.join(workspace_root, self.MANIFEST_DIR),
+            self._compute_workspace_stats)
+        self.line_indexes = LineIndexStore(
+            os.path.join(workspace_root, self.LINE_INDEX_DIR),
+            pause=lambda: time.sleep(0))
         self._chunk_cache: Dict[str, Dict[int, str]] = {}
         self._symbol_cache: Dict[str, Dict[str, List[Tuple[int, str]]]] = {}
         self._dependency_graph: Dict[str, Set[str]] = defaultdict(set)
         self._file_index: Dict[str, Dict[str, Any]] = {}
+        self._term_summaries: Dict[str, Tuple[float, int, TermSummary]] = {}
         self._cache_size = 0
         self._cache_lock = threading.Lock()
         self._executor = ThreadPoolExecutor(max_workers=4)
-        self._gitignore_patterns: List[str] = []
+        self._gitignore_rules = IgnoreRuleSet([])
+        self._ignore_matchers: Dict[str, IgnoreMatcher] = {}
 
         self.logger.debug("Initialized caching systems and thread pool")
         self._load_gitignore()
@@ -310,11 +441,10 @@ class WorkspaceManager:
                     content: Optional[str] = None) -> Dict[str, Any]:
         """Index file contents for faster searching and context understanding"""
         if not content:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            except UnicodeDecodeError:
+            content, _ = self.file_reader.read_text(file_path)
+            if content is None:
                 return {}  # Skip binary files
+        st = self.stats.stat(file_path)
 
         ext = Path(file_path).suffix.lower()
         lang = "python" if ext == ".py" else "javascript" if ext == ".js" else None
@@ -322,9 +452,9 @@ class WorkspaceManager:
         index = {
             "symbols": defaultdict(list),
             "imports": set(),
-            "size": os.path.getsize(file_path),
+            "size": st.st_size,
             "hash": hashlib.md5(content.encode()).hexdigest(),
-            "last_modified": os.path.getmtime(file_path),
+            "last_modified": st.st_mtime,
             "language": lang,
         }
 
@@ -338,8 +468,46 @@ class WorkspaceManager:
                             index["imports"].add(line.strip())
 
         self._file_index[file_path] = index
+        self._store_term_summary(file_path, content, index["last_modified"],
+                                 index["size"])
         return index
 
+    def _store_term_summary(self, file_path: str, content: str, mtime: float,
+                            size: int) -> TermSummary:
+        """Build and cache the term summary for a file version"""
+        summary = TermSummary.from_text(content)
+        self._term_summaries[file_path] = (mtime, size, summary)
+        return summary
+
+    def _get_term_summary(self, file_path: str) -> Optional[TermSummary]:
+        """Get a file's term summary, (re)building it if missing or stale"""
+        try:
+            st = self.stats.stat(file_path)
+        except OSError:
+            self._term_summaries.pop(file_path, None)
+            return None
+
+        cached = self._term_summaries.get(file_path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+
+        if st.st_size > self.MAX_FILE_SIZE:
+            return None
+        try:
+            with open(file_path, "rb") as f:
+                if st.st_size == 0:
+                    data = b""
+                else:
+                    with mmap.mmap(f.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as mm:
+                        data = mm[:]
+        except (ValueError, OSError) as e:
+            self.logger.debug(f"Could not summarize {file_path}: {e}")
+            return None
+        return self._store_term_summary(
+            file_path, data.decode("utf-8", errors="ignore"), st.st_mtime,
+            st.st_size)
+
     def _analyze_dependencies(
             self, files_content: Dict[str, str]) -> Dict[str, Set[str]]:
         """Analyze and cache file dependencies"""
@@ -367,7 +535,8 @@ class WorkspaceManager:
                           num_chunks: int = 1) -> str:
         """Enhanced file content retrieval with chunked reading and caching"""
         try:
-            file_size = os.path.getsize(file_path)
+            st = self.stats.stat(file_path)
+            file_size = st.st_size
             self.logger.debug(
                 f"Reading file {file_path} (size: {file_size} bytes)")
 
@@ -375,63 +544,22 @@ class WorkspaceManager:
             if file_size < self.LARGE_FILE_THRESHOLD:
                 if file_path in self._content_cache:
                     content, mtime, size = self._content_cache[file_path]
-                    if os.path.getmtime(
-                            file_path) == mtime and size == file_size:
+                    if st.st_mtime == mtime and size == file_size:
                         self.logger.debug(f"Cache hit for {file_path}")
                         return content
 
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        self._update_cache_size(file_path, content)
-                        self._content_cache[file_path] = (
-                            content,
-                            os.path.getmtime(file_path),
-                            file_size,
-                        )
-
-                        # Add to search index if it's a new file
-                        if file_path not in self.search_index.documents:
-                            try:
-                                rel_path = os.path.relpath(
-                                    file_path, self.workspace_root)
-                                self.search_index.add_document(
-                                    rel_path, content)
-                                self.logger.debug(
-                                    f"Added {rel_path} to search index")
-                            except Exception as e:
-                                self.logger.warning(
-                                    f"Failed to add {file_path} to search index: {e}"
-                                )
-
-                        return content
-                except UnicodeDecodeError:
-                    with open(file_path, "r", encoding="latin-1") as f:
-                        content = f.read()
-                        self._update_cache_size(file_path, content)
-                        self._content_cache[file_path] = (
-                            content,
-                            os.path.getmtime(file_path),
-                            file_size,
-                        )
-
-                        # Add to search index if it's a new file
-                        if file_path not in self.search_index.documents:
-                            try:
-                                rel_path = os.path.relpath(
-                                    file_path, self.workspace_root)
-                                self.search_index.add_document(
-                                    rel_path, content)
-                                self.logger.debug(
-                                    f"Added {rel_path} to search index")
-                            except Exception as e:
-                                self.logger.warning(
-                                    f"Failed to add {file_path} to search index: {e}"
-                                )
-
-                        return content
-
-            # For large files, use chunk cache and mmap for efficiency
+                content, info = self.file_reader.read_text(file_path)
+                if content is None:
+                    return ""  # Binary
+                self._update_cache_size(file_path, content)
+                self._content_cache[file_path] = (content, info.mtime,
+                                                  info.size)
+                self._store_term_summary(file_path, content, info.mtime,
+                                         info.size)
+                self._add_to_search_index(file_path, content)
+                return content
+
+            # For large files, use chunk cache; the reader maps them
             if file_path not in self._chunk_cache:
                 self._chunk_cache[file_path] = {}
 
@@ -445,46 +573,34 @@ class WorkspaceManager:
                 if offset >= file_size:
                     break
 
-                try:
-                    with open(file_path, "rb") as f:
-                        with mmap.mmap(f.fileno(), 0,
-                                       access=mmap.ACCESS_READ) as mm:
-                            mm.seek(offset)
-                            chunk_bytes = mm.read(self.CHUNK_SIZE)
-                            try:
-                                chunk = chunk_bytes.decode("utf-8")
-                            except UnicodeDecodeError:
-                                chunk = chunk_bytes.decode("latin-1")
-                            self._chunk_cache[file_path][i] = chunk
-                            chunks.append(chunk)
-                except (ValueError, OSError) as e:
-                    self.logger.error(
-                        f"Error reading file {file_path} with mmap: {str(e)}")
-                    # Fallback to regular file reading
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        f.seek(offset)
-                        chunk = f.read(self.CHUNK_SIZE)
-                        self._chunk_cache[file_path][i] = chunk
-                        chunks.append(chunk)
+                chunk, _ = self.file_reader.read_text(file_path, offset,
+                                                      self.CHUNK_SIZE)
+                if chunk is None:
+                    break  # Binary
+                self._chunk_cache[file_path][i] = chunk
+                chunks.append(chunk)
 
             content = "".join(chunks)
-
-            # Add to search index if it's a new file
-            if content and file_path not in self.search_index.documents:
-                try:
-                    rel_path = os.path.relpath(file_path, self.workspace_root)
-                    self.search_index.add_document(rel_path, content)
-                    self.logger.debug(f"Added {rel_path} to search index")
-                except Exception as e:
-                    self.logger.warning(
-                        f"Failed to add {file_path} to search index: {e}")
-
+            if content:
+                self._add_to_search_index(file_path, content)
             return content
 
         except (IOError, UnicodeDecodeError) as e:
             self.logger.error(f"Error reading file {file_path}: {str(e)}")
             return ""
 
+    def _add_to_search_index(self, file_path: str, content: str) -> None:
+        """Add a file to the search index if it is not there yet"""
+        if file_path in self.search_index.documents:
+            return
+        try:
+            rel_path = os.path.relpath(file_path, self.workspace_root)
+            self.search_index.add_document(rel_path, content)
+            self.logger.debug(f"Added {rel_path} to search index")
+        except Exception as e:
+            self.logger.warning(
+                f"Failed to add {file_path} to search index: {e}")
+
     def get_workspace_files(self,
                             workspace_dir: str,
                             query: str = None) -> Dict[str, str]:
@@ -509,7 +625,7 @@ class WorkspaceManager:
                 for file_path, rel_path in all_files:
                     try:
                         if (os.path.dirname(rel_path) == ""
-                                or os.path.getsize(file_path)
+                                or self.stats.stat(file_path).st_size
                                 < self.LARGE_FILE_THRESHOLD):
                             content = self._get_file_content(file_path)
                             if content:
@@ -549,7 +665,7 @@ class WorkspaceManager:
                         # Truncate content for context
                         files_content[
                             rel_path] = self._truncate_content_for_context(
-                                content)
+                                content, query=query)
                         self.logger.debug(f"Loaded content for: {rel_path}")
 
             elapsed_time = time.time() - start_time
@@ -566,40 +682,33 @@ class WorkspaceManager:
     def _parallel_scan(self, workspace_dir: str) -> List[Tuple[str, str]]:
         """Helper method for parallel directory scanning"""
 
-        def process_directory(dir_path: str) -> List[Tuple[str, str]]:
+        def process_directory(rel_dir: str) -> List[Tuple[str, str]]:
             files = []
             try:
-                with os.scandir(dir_path) as it:
-                    for entry in it:
-                        if (entry.is_file() and not entry.name.startswith(".")
-                                and not entry.name.endswith(
-                                    tuple(self.SKIP_EXTENSIONS))):
-                            rel_path = os.path.relpath(entry.path,
-                                                       workspace_dir)
-                            if not self._should_ignore(rel_path):
-                                files.append((entry.path, rel_path))
-                        elif (entry.is_dir() and not entry.name.startswith(".")
-                              and entry.name not in self.SKIP_FOLDERS):
-                            files.extend(process_directory(entry.path))
+                for _, _, file_entries in self.walk_workspace(
+                        workspace_dir, rel_dir):
+                    for entry in file_entries:
+                        self._remember_stat(entry)
+                        files.append((entry.path,
+                                      os.path.relpath(entry.path,
+                                                      workspace_dir)))
             except OSError as e:
                 self.logger.error(
-                    f"Error scanning directory {dir_path}: {str(e)}")
+                    f"Error scanning directory {rel_dir}: {str(e)}")
             return files
 
         subdirs = []
         files = []
         try:
-            with os.scandir(workspace_dir) as it:
-                for entry in it:
-                    if (entry.is_dir() and not entry.name.startswith(".")
-                            and entry.name not in self.SKIP_FOLDERS):
-                        subdirs.append(entry.path)
-                    elif (entry.is_file() and not entry.name.startswith(".")
-                          and not entry.name.endswith(
-                              tuple(self.SKIP_EXTENSIONS))):
-                        rel_path = os.path.relpath(entry.path, workspace_dir)
-                        if not self._should_ignore(rel_path):
-                            files.append((entry.path, rel_path))
+            # Only the top level is scanned here; each subtree is walked
+            # in its own worker
+            for _, dir_entries, file_entries in self.walk_workspace(
+                    workspace_dir):
+                subdirs = [entry.name for entry in dir_entries]
+                for entry in file_entries:
+                    self._remember_stat(entry)
+                files = [(entry.path, entry.name) for entry in file_entries]
+                dir_entries.clear()
         except OSError as e:
             self.logger.error(f"Error scanning root directory: {str(e)}")
 
@@ -611,45 +720,46 @@ class WorkspaceManager:
 
         return files
 
+    def _remember_stat(self, entry: os.DirEntry) -> None:
+        """Seed the stat cache from a scan, so later steps need no stat"""
+        try:
+            self.stats.put(entry.path, entry.stat())
+        except OSError:
+            pass
+
     def _score_files(self, files: List[Tuple[str, str]],
                      query: str) -> List[Tuple[str, str, float]]:
         """Score files based on relevance to query"""
+        query_terms = TermSummary.query_terms(query)
+        raw_terms = [term.lower() for term in query.split()]
+        hashed_terms = [TermSummary.hash_term(term) for term in query_terms]
+
+        # Summaries are built once per file version; after the first query
+        # scoring is in-memory apart from a stat to detect changes
+        summaries = dict(
+            zip((file_path for file_path, _ in files),
+                self._executor.map(self._get_term_summary,
+                                   (file_path for file_path, _ in files))))
+
         scored_files = []
         for file_path, rel_path in files:
             score = 0
             try:
                 # Check filename relevance
-                if any(term.lower() in rel_path.lower()
-                       for term in query.lower().split()):
+                lower_rel_path = rel_path.lower()
+                if any(term in lower_rel_path for term in raw_terms):
                     score += 5
                     self.logger.debug(
                         f"File {rel_path} matched query in name (+5)")
 
-                # Quick content scan for relevance
-                try:
-                    with open(file_path, "rb") as f:
-                        with mmap.mmap(f.fileno(), 0,
-                                       access=mmap.ACCESS_READ) as mm:
-                            preview = mm.read(4096).decode("utf-8",
-                                                           errors="ignore")
-                            if any(term.lower() in preview.lower()
-                                   for term in query.lower().split()):
-                                score += 3
-                                self.logger.debug(
-                                    f"File {rel_path} matched query in content (+3)"
-                                )
-                except (ValueError, OSError):
-                    with open(file_path,
-                              "r",
-                              encoding="utf-8",
-                              errors="ignore") as f:
-                        preview = f.read(4096)
-                        if any(term.lower() in preview.lower()
-                               for term in query.lower().split()):
-                            score += 3
-                            self.logger.debug(
-                                f"File {rel_path} matched query in content (+3)"
-                            )
+                # Content relevance from the whole-file term summary
+                summary = summaries.get(file_path)
+                if summary and any(
+                        summary.might_contain(hashed)
+                        for hashed in hashed_terms):
+                    score += 3
+                    self.logger.debug(
+                        f"File {rel_path} matched query in content (+3)")
 
                 # Consider file location and type
                 if os.path.dirname(rel_path) == "":
@@ -666,8 +776,8 @@ class WorkspaceManager:
                 if file_path in self._file_index:
                     index = self._file_index[file_path]
                     for symbol_list in index["symbols"].values():
-                        if any(term.lower() in symbol[1].lower()
-                               for term in query.lower().split()
+                        if any(term in symbol[1].lower()
+                               for term in raw_terms
                                for symbol in symbol_list):
                             score += 2
                             self.logger.debug(
@@ -698,56 +808,84 @@ class WorkspaceManager:
         return None
 
     def _load_gitignore(self):
-        """Load .gitignore patterns if the file exists"""
+        """Load the global .gitignore rules from the workspace root if present"""
         gitignore_path = os.path.join(self.workspace_root, ".gitignore")
         if os.path.exists(gitignore_path):
             try:
-                with open(gitignore_path, "r") as f:
-                    patterns = []
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith("#"):
-                            # Convert glob patterns to regex patterns
-                            pattern = (line.replace(".", r"\.").replace(
-                                "*", ".*").replace("?", "."))
-                            if not line.startswith("/"):
-                                pattern = f".*{pattern}"
-                            if not line.endswith("/"):
-                                pattern = f"{pattern}($|/.*)"
-                            patterns.append(pattern)
-                    self._gitignore_patterns = patterns
+                self._gitignore_rules = IgnoreRuleSet.from_file(gitignore_path)
+                self._ignore_matchers.clear()
             except Exception as e:
                 print(f"Warning: Could not read .gitignore file: {e}")
 
-    def _should_ignore(self, path: str) -> bool:
-        """Check if a path should be ignored based on gitignore patterns"""
-        if not self._gitignore_patterns:
-            return False
-
+    def _get_ignore_matcher(self, workspace_dir: str) -> IgnoreMatcher:
+        """Get (or create) the per-directory gitignore matcher for a workspace"""
+        key = os.path.abspath(workspace_dir)
+        matcher = self._ignore_matchers.get(key)
+        if matcher is None:
+            matcher = IgnoreMatcher(key, self._gitignore_rules)
+            self._ignore_matchers[key] = matcher
+        return matcher
+
+    def _should_ignore(self,
+                       path: str,
+                       workspace_dir: Optional[str] = None,
+                       is_dir: bool = False) -> bool:
+        """Check if a workspace-relative path should be ignored.
+
+        With a workspace_dir, nested .gitignore files of that workspace are
+        honoured as well as the global rules; without one, only the global
+        rules apply.
+        """
         normalized_path = path.replace("\\", "/")
-        return any(
-            re.match(pattern, normalized_path)
-            for pattern in self._gitignore_patterns)
+        if workspace_dir is None:
+            return bool(self._gitignore_rules.match(normalized_path, is_dir))
+        return self._get_ignore_matcher(workspace_dir).is_ignored(
+            normalized_path, is_dir)
+
+    def _skip_dir_name(self, name: str) -> bool:
+        return name.startswith(".") or name in self.SKIP_FOLDERS
+
+    def _skip_file_name(self, name: str) -> bool:
+        return name.startswith(".") or name.endswith(
+            tuple(self.SKIP_EXTENSIONS))
+
+    def walk_workspace(
+        self,
+        workspace_dir: str,
+        rel_dir: str = "",
+    ) -> Iterator[Tuple[str, List[os.DirEntry], List[os.DirEntry]]]:
+        """Walk a workspace applying skip folders/extensions and gitignore rules.
+
+        Yields (rel_dir, dir_entries, file_entries); ignored subtrees are
+        pruned without being scanned. Clearing dir_entries stops descent.
+        """
+        return self._get_ignore_matcher(workspace_dir).walk(
+            rel_dir,
+            skip_dir=self._skip_dir_name,
+            skip_file=self._skip_file_name)
 
     def _is_cache_valid(
             self, path: str, cache_entry: Tuple[Union[str, List[dict]],
                                                 float]) -> bool:
         """Check if cached content is still valid"""
         try:
-            current_mtime = os.path.getmtime(path)
+            current_mtime = self.stats.stat(path).st_mtime
             return current_mtime == cache_entry[1]
         except OSError:
             return False
 
     def get_directory_structure(self,
                                 dir_path: str,
-                                depth: int = 1) -> List[dict]:
+                                depth: int = 1,
+                                workspace_dir: Optional[str] = None) -> List[dict]:
         """Get directory structure with lazy loading support"""
         try:
             # Use the provided path directly if it's absolute, otherwise join
             # with workspace root
             abs_path = (dir_path if os.path.isabs(dir_path) else os.path.join(
                 self.workspace_root, dir_path))
+            if workspace_dir is None:
+                workspace_dir = abs_path
             result = []
 
             for entry in os.scandir(abs_path):
@@ -762,7 +900,9 @@ class WorkspaceManager:
                 rel_path = os.path.relpath(entry.path, abs_path)
 
                 # Skip if path matches gitignore patterns
-                if self._should_ignore(rel_path):
+                if self._should_ignore(
+                        os.path.relpath(entry.path, workspace_dir),
+                        workspace_dir, entry.is_dir()):
                     continue
 
                 if entry.is_file() and not any(
@@ -775,7 +915,8 @@ class WorkspaceManager:
                     })
                 elif entry.is_dir() and depth > 0:
                     children = (self.get_directory_structure(
-                        entry.path, depth - 1) if depth > 1 else [])
+                        entry.path, depth - 1, workspace_dir)
+                                if depth > 1 else [])
                     result.append({
                         "type":
                         "directory",
@@ -795,82 +936,140 @@ class WorkspaceManager:
         except OSError:
             return []
 
+    def get_workspace_tree(self, workspace_dir: str) -> WorkspaceTree:
+        """Get the in-memory tree model for a workspace, creating it on first use"""
+        key = os.path.abspath(workspace_dir)
+        tree = self._trees.get(key)
+        if tree is None:
+            on_change = None
+            if os.path.dirname(key) == os.path.abspath(self.workspace_root):
+                # Keep the workspace's manifest in step with the tree
+                def on_change(file_count, total_size, initial, path=key):
+                    self.manifests.update(path, file_count, total_size,
+                                          None if initial else time.time())
+
+            tree = WorkspaceTree(key,
+                                 self._get_ignore_matcher(key),
+                                 skip_dir=self._skip_dir_name,
+                                 skip_file=self._skip_file_name,
+                                 on_change=on_change)
+            self._trees[key] = tree
+        return tree
+
+    def _compute_workspace_stats(self,
+                                 workspace_dir: str) -> Tuple[int, int, float]:
+        """Scan a workspace for (file_count, total_size, last_activity).
+
+        Runs on a background thread, which is a green thread under
+        eventlet, so it yields every STATS_YIELD_EVERY entries.
+        """
+        file_count = 0
+        total_size = 0
+        latest = 0.0
+        scanned = 0
+        for _, dir_entries, file_entries in self.walk_workspace(workspace_dir):
+            for entry in file_entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                file_count += 1
+                total_size += st.st_size
+                latest = max(latest, st.st_mtime)
+            scanned += len(dir_entries) + len(file_entries)
+            if scanned >= self.STATS_YIELD_EVERY:
+                scanned = 0
+                time.sleep(0)
+        return file_count, total_size, latest
+
+    def get_workspace_manifests(
+            self, workspace_dirs: List[str]
+    ) -> Dict[str, Optional[WorkspaceManifest]]:
+        """Get manifests for workspaces; stale ones are refreshed in the background"""
+        return self.manifests.get_many(
+            [os.path.abspath(path) for path in workspace_dirs])
+
+    def notify_paths_changed(self, workspace_dir: str,
+                             rel_paths: List[str]) -> None:
+        """Tell the tree model and caches that files were written or moved"""
+        tree = self.get_workspace_tree(workspace_dir)
+        for rel_path in rel_paths:
+            if not rel_path:
+                continue
+            tree.mark_dirty(rel_path)
+            self.clear_cache(os.path.join(workspace_dir, rel_path))
+
     def get_workspace_structure(self, workspace_dir: str) -> List[dict]:
         """Get workspace structure with lazy loading for large directories"""
         try:
+            tree = self.get_workspace_tree(workspace_dir)
+            version = tree.refresh()
+
             # Check if we have a valid cached structure
             if workspace_dir in self._structure_cache:
-                structure, mtime = self._structure_cache[workspace_dir]
-                if os.path.getmtime(workspace_dir) == mtime:
+                structure, cached_version = self._structure_cache[
+                    workspace_dir]
+                if cached_version == version:
                     return structure
 
-            # Count total files to determine if we should use lazy loading
-            total_files = 0
-            print(f"\nCounting files in {workspace_dir}:")
-            for root, dirs, files in os.walk(workspace_dir):
-                # Skip .git and other ignored directories
-                original_dirs = set(dirs)
-                dirs[:] = [
-                    d for d in dirs
-                    if not d.startswith(".") and d not in self.SKIP_FOLDERS
-                ]
-                if len(original_dirs) != len(dirs):
-                    print(
-                        f"Skipped directories in {root}: {original_dirs - set(dirs)}"
-                    )
-
-                # Filter files based on gitignore and skip patterns
-                for file in files:
-                    if not file.startswith(".") and not file.endswith(
-                            tuple(self.SKIP_EXTENSIONS)):
-                        rel_path = os.path.relpath(os.path.join(root, file),
-                                                   workspace_dir)
-                        if not self._should_ignore(rel_path):
-                            total_files += 1
-                            print(f"Counting file: {rel_path}")
-                        else:
-                            print(f"Ignoring file (gitignore): {rel_path}")
-                    else:
-                        print(f"Ignoring file (hidden/extension): {file}")
-
-            print(f"\nTotal files counted: {total_files}")
-
-            if total_files > self.LAZY_LOAD_THRESHOLD:
-                # Use lazy loading - only get top-level structure
-                structure = self.get_directory_structure(workspace_dir,
-                                                         depth=1)
-            else:
-                # Get full structure for smaller workspaces
-                structure = self.get_directory_structure(workspace_dir,
-                                                         depth=float("inf"))
+            # Use lazy loading - only get top-level structure - for large
+            # workspaces, the full structure for smaller ones
+            total_files = tree.file_count()
+            depth = (1 if total_files > self.LAZY_LOAD_THRESHOLD else
+                     float("inf"))
+            structure = tree.structure(depth=depth)
 
-            self._structure_cache[workspace_dir] = (
-                structure,
-                os.path.getmtime(workspace_dir),
-            )
+            self._structure_cache[workspace_dir] = (structure, version)
             return structure
 
         except OSError:
             return []
 
+    def get_structure_payload(self,
+                              workspace_dir: str,
+                              since_version: Optional[str] = None) -> dict:
+        """Get the workspace structure in the compact, versioned wire format"""
+        structure = self.get_workspace_structure(workspace_dir)
+        key = os.path.abspath(workspace_dir)
+        history = self._structure_histories.get(key)
+        if history is None:
+            history = self._structure_histories.setdefault(
+                key, StructureHistory())
+        payload = history.payload(structure, since_version)
+        # Large trees are shown through get_tree_window instead
+        payload["virtual"] = (self.get_workspace_tree(key).file_count() >
+                              self.VIRTUAL_TREE_THRESHOLD)
+        return payload
+
+    def get_tree_window(self, workspace_dir: str, expanded: List[str],
+                        offset: int, limit: int) -> dict:
+        """Get the visible rows of the flattened tree for a viewport"""
+        limit = max(0, min(limit, self.MAX_WINDOW_ROWS))
+        rows, total_rows = self.get_workspace_tree(workspace_dir).window(
+            expanded, offset, limit)
+        return {"rows": rows, "offset": offset, "total_rows": total_rows}
+
     def expand_directory(self,
                          dir_path: str,
                          workspace_dir: str,
                          page_size: int = 100,
-                         page: int = 1) -> dict:
+                         page: int = 1,
+                         cursor: Optional[str] = None) -> dict:
         """Expand a directory node for lazy loading with pagination support
 
         Args:
             dir_path: Directory path to expand
             workspace_dir: The workspace directory containing the files
             page_size: Number of items per page
-            page: Page number (1-based)
+            page: Page number (1-based), used when no cursor is given
+            cursor: Opaque next_cursor from the previous page
 
         Returns:
             Dictionary containing:
             - items: List of files and directories in the current page
             - total_items: Total number of items
             - has_more: Whether there are more items
+            - next_cursor: Cursor for the next page, or None
         """
         try:
             # Ensure we have absolute paths
@@ -893,91 +1092,13 @@ class WorkspaceManager:
                 print(f"Not a directory: {abs_path}")  # Debug log
                 raise ValueError(f"Not a directory: {dir_path}")
 
-            # Get all entries first
-            entries = []
-            start_idx = (page - 1) * page_size
-
-            try:
-                with os.scandir(abs_path) as it:
-                    for entry in it:
-                        try:
-                            # Skip hidden files and ignored directories
-                            if entry.name.startswith(".") or (
-                                    entry.is_dir()
-                                    and entry.name in self.SKIP_FOLDERS):
-                                print(f"Skipping {entry.name} (hidden/ignored)"
-                                      )  # Debug log
-                                continue
-
-                            # Get path relative to current directory
-                            entry_rel_path = os.path.relpath(
-                                entry.path, abs_path)
-
-                            # Skip if path matches gitignore patterns
-                            if self._should_ignore(entry_rel_path):
-                                print(f"Skipping {entry_rel_path} (gitignore)"
-                                      )  # Debug log
-                                continue
-
-                            if entry.is_file() and not any(
-                                    entry_rel_path.endswith(ext)
-                                    for ext in self.SKIP_EXTENSIONS):
-                                # Debug log
-                                print(f"Adding file: {entry_rel_path}")
-                                entries.append({
-                                    "type":
-                                    "file",
-                                    "path":
-                                    entry_rel_path.replace("\\", "/"),
-                                    "size":
-                                    entry.stat().st_size,
-                                })
-                            elif entry.is_dir():
-                                # For directories, check if they have children
-                                # without loading them all
-                                has_children = False
-                                try:
-                                    with os.scandir(entry.path) as dir_it:
-                                        for child in dir_it:
-                                            if not child.name.startswith(
-                                                    ".") and not (
-                                                        child.is_dir()
-                                                        and child.name
-                                                        in self.SKIP_FOLDERS):
-                                                has_children = True
-                                                break
-                                except OSError as e:
-                                    print(
-                                        f"Error checking directory contents: {e}"
-                                    )  # Debug log
-                                    pass
-
-                                print(
-                                    f"Adding directory: {entry_rel_path} (has_children={has_children})"
-                                )  # Debug log
-                                entries.append({
-                                    "type":
-                                    "directory",
-                                    "path":
-                                    entry_rel_path.replace("\\", "/"),
-                                    "has_children":
-                                    has_children,
-                                })
-                        except OSError as e:
-                            print(f"Error processing entry {entry.name}: {e}"
-                                  )  # Debug log
-                            continue
-            except OSError as e:
-                print(f"Error scanning directory {abs_path}: {e}")  # Debug log
-                raise
-
-            # Sort entries (directories first, then alphabetically)
-            entries.sort(
-                key=lambda x: (x["type"] != "directory", x["path"].lower()))
-
-            # Get total count and slice for current page
-            total_items = len(entries)
-            page_entries = entries[start_idx:start_idx + page_size]
+            # Pages come from the tree model's cached sorted listing
+            rel_dir = os.path.relpath(abs_path, workspace_dir)
+            page_entries, next_cursor, total_items = self.get_workspace_tree(
+                workspace_dir).page(rel_dir,
+                                    limit=page_size,
+                                    cursor=cursor,
+                                    offset=(page - 1) * page_size)
 
             print(
                 f"Directory expansion results: {len(page_entries)} items (total: {total_items})"
@@ -986,22 +1107,129 @@ class WorkspaceManager:
             return {
                 "items": page_entries,
                 "total_items": total_items,
-                "has_more": (start_idx + page_size) < total_items,
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor,
             }
 
         except Exception as e:
             print(f"Error in expand_directory: {str(e)}")  # Debug log
             raise
 
+    def copy_workspace_state(self, source_dir: str, target_dir: str) -> None:
+        """Seed a cloned workspace's caches and index from its source.
+
+        Cached entries stay valid because clones keep file mtimes and sizes;
+        they are re-validated against them on use, as usual.
+        """
+        source = os.path.abspath(source_dir)
+        target = os.path.abspath(target_dir)
+        source_prefix = source + os.sep
+
+        def moved(path):
+            return target + path[len(source):]
+
+        for path, entry in list(self._content_cache.items()):
+            if path.startswith(source_prefix):
+                self._content_cache[moved(path)] = entry
+                self._update_cache_size(moved(path), entry[0])
+        for cache in (self._term_summaries, self._file_index):
+            for path, entry in list(cache.items()):
+                if path.startswith(source_prefix):
+                    cache[moved(path)] = entry
+
+        root = os.path.abspath(self.workspace_root)
+        self.search_index.copy_prefix(
+            os.path.relpath(source, root) + os.sep,
+            os.path.relpath(target, root) + os.sep)
+
+        manifest = self.manifests.load(os.path.basename(source))
+        if manifest:
+            self.manifests.update(target, manifest.file_count,
+                                  manifest.total_size, manifest.last_activity)
+
+    def export_metadata(self, workspace_dir: str) -> Dict[str, bytes]:
+        """Persisted metadata to carry in a workspace archive, by name"""
+        metadata = {}
+        manifest = self.manifests.load(os.path.basename(
+            os.path.abspath(workspace_dir)))
+        if manifest:
+            metadata["manifest.json"] = json.dumps(
+                asdict(manifest)).encode("utf-8")
+        return metadata
+
+    def import_metadata(self, workspace_dir: str,
+                        metadata: Dict[str, bytes]) -> None:
+        """Restore metadata carried in a workspace archive"""
+        if "manifest.json" in metadata:
+            try:
+                manifest = json.loads(metadata["manifest.json"])
+                self.manifests.update(workspace_dir,
+                                      int(manifest["file_count"]),
+                                      int(manifest["total_size"]),
+                                      float(manifest["last_activity"]))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring invalid manifest in archive: {e}")
+
+    def forget_workspace(self, workspace_dir: str) -> None:
+        """Drop every cache and index entry belonging to a workspace"""
+        key = os.path.abspath(workspace_dir)
+        prefix = key + os.sep
+        self._trees.pop(key, None)
+        self._structure_histories.pop(key, None)
+        self._ignore_matchers.pop(key, None)
+        for cache_key in list(self._structure_cache):
+            if os.path.abspath(cache_key) == key:
+                del self._structure_cache[cache_key]
+
+        with self._cache_lock:
+            for path in [p for p in self._content_cache if p.startswith(prefix)]:
+                content = self._content_cache.pop(path)[0]
+                self._cache_size -= len(content.encode("utf-8"))
+        for cache in (self._chunk_cache, self._term_summaries,
+                      self._file_index, self._symbol_cache,
+                      self._dependency_graph):
+            for path in [p for p in cache if p.startswith(prefix)]:
+                cache.pop(path, None)
+
+        # Search documents are keyed relative to the workspace root
+        rel = os.path.relpath(key, os.path.abspath(self.workspace_root))
+        self.search_index.remove_prefix(rel + os.sep)
+        self.line_indexes.forget(key)
+        self.stats.invalidate_prefix(prefix)
+
+    def read_line_window(self, file_path: str, start_line: int,
+                         count: int) -> Tuple[str, int, Optional[int]]:
+        """Read count lines from 0-based start_line of a file.
+
+        Large files go through a persisted sparse line index, so any line is
+        reached without reading the lines before it.
+
+        Returns:
+            (text, byte offset after the window, total lines if known)
+        """
+        if self.stats.stat(file_path).st_size < self.LARGE_FILE_THRESHOLD:
+            text, next_offset = file_ranges.read_line_window(
+                file_path, start_line, count)
+            return text, next_offset, None
+        data, next_offset, line_count = self.line_indexes.read_lines(
+            file_path, start_line, count)
+        return data.decode("utf-8", errors="replace"), next_offset, line_count
+
     def clear_cache(self, file_path: Optional[str] = None):
         """Clear cache entries"""
         if file_path:
             self._content_cache.pop(file_path, None)
             self._chunk_cache.pop(file_path, None)
+            self._term_summaries.pop(file_path, None)
+            self.file_reader.forget(file_path)
+            self.stats.invalidate(file_path)
         else:
             self._content_cache.clear()
             self._structure_cache.clear()
             self._chunk_cache.clear()
+            self._term_summaries.clear()
+            self._trees.clear()
+            self.stats.clear()
 
     def get_workspace_context(self, workspace_dir: str) -> str:
         """Get a description of the workspace context"""
@@ -1021,22 +1249,21 @@ class WorkspaceManager:
             total_size = 0
 
             # Only process files under size threshold
-            for root, _, files in os.walk(workspace_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
+            for _, _, file_entries in self.walk_workspace(workspace_dir):
+                for entry in file_entries:
+                    file_path = entry.path
                     try:
-                        if os.path.getsize(
-                                file_path) < self.LARGE_FILE_THRESHOLD:
+                        st = self.stats.put(file_path, entry.stat())
+                        if st.st_size < self.LARGE_FILE_THRESHOLD:
                             rel_path = os.path.relpath(file_path,
                                                        workspace_dir)
-                            if not self._should_ignore(rel_path):
-                                content = self._get_file_content(file_path)
-                                if content:
-                                    files_content[rel_path] = content
-                                    total_size += len(content.encode("utf-8"))
-                                    self.logger.debug(
-                                        f"Added {rel_path} to context (size: {len(content)} chars)"
-                                    )
+                            content = self._get_file_content(file_path)
+                            if content:
+                                files_content[rel_path] = content
+                                total_size += len(content.encode("utf-8"))
+                                self.logger.debug(
+                                    f"Added {rel_path} to context (size: {len(content)} chars)"
+                                )
                     except OSError as e:
                         self.logger.warning(
                             f"Error processing file {file_path}: {e}")
@@ -1131,15 +1358,10 @@ class WorkspaceManager:
                     current_content = ""
                     if os.path.exists(file_path):
                         try:
-                            with open(file_path, "r", encoding="utf-8") as f:
-                                current_content = f.read()
-                        except UnicodeDecodeError:
-                            try:
-                                with open(file_path, "r",
-                                          encoding="latin-1") as f:
-                                    current_content = f.read()
-                            except Exception:
-                                pass
+                            current_content = self.file_reader.read_text(
+                                file_path)[0] or ""
+                        except OSError:
+                            pass
 
                     # Generate unified diff
                     from difflib import unified_diff
@@ -1321,78 +1543,43 @@ class WorkspaceManager:
         self.logger.info(f"Searching codebase for: {query}")
         return self.search_index.search(query, top_k)
 
-    def _estimate_tokens(self, text: str) -> int:
+    def _estimate_tokens(self,
+                         text: str,
+                         token_counter: Optional[TokenCounter] = None) -> int:
         """Estimate the number of tokens in a text.
-        This is a rough estimate - actual token count may vary by model."""
-        # Average English word length is 4.7 characters
-        # Average token is about 4 characters
-        # So we estimate 1 token per 4 characters
-        return len(text) // 4
-
-    def _truncate_content_for_context(self,
-                                      content: str,
-                                      max_tokens: int = 60000) -> str:
+
+        Uses the given model's counter, or the default tokenizer family.
+        Counts of large texts are cached by content hash."""
+        return (token_counter or get_token_counter()).count(text)
+
+    def _truncate_content_for_context(
+            self,
+            content: str,
+            max_tokens: int = 60000,
+            token_counter: Optional[TokenCounter] = None,
+            query: Optional[str] = None) -> str:
         """Truncate file content while preserving important parts and staying within token limit.
 
+        Imports, declarations, docstrings and lines matching the query are
+        kept; function and class bodies are collapsed into elision markers,
+        deepest first.
+
         Args:
             content: The file content to truncate
             max_tokens: Maximum number of tokens to allow
+            token_counter: Counter for the target model (default family if None)
+            query: Optional query whose matching regions should be kept
 
         Returns:
-            Truncated content with summary
+            Truncated content with elision markers
         """
-        # First check if we're already under the limit
-        if self._estimate_tokens(content) <= max_tokens:
-            return content
-
-        lines = content.splitlines()
-
-        # Start with smaller chunks and increase if needed
-        keep_start = 50
-        keep_end = 50
-        remaining_lines = 100
-
-        while True:
-            # Get the first section
-            truncated = lines[:keep_start]
-
-            # Get evenly spaced lines from middle section
-            middle_start = keep_start
-            middle_end = len(lines) - keep_end
-            middle_lines = lines[middle_start:middle_end]
-
-            if middle_lines:
-                # Calculate step size to get remaining_lines number of lines
-                step = len(middle_lines) // remaining_lines
-                if step > 1:
-                    truncated.append(f"\n... truncated {step} lines ...\n")
-                    truncated.extend(middle_lines[::step][:remaining_lines])
-                    truncated.append(f"\n... truncated {step} lines ...\n")
-                else:
-                    truncated.extend(middle_lines[:remaining_lines])
-
-            # Add the last section
-            truncated.extend(lines[-keep_end:])
-
-            result = "\n".join(truncated)
-            if self._estimate_tokens(result) <= max_tokens:
-                return result
-
-            # If still too large, reduce the number of lines we keep
-            if keep_start > 10:
-                keep_start -= 10
-                keep_end -= 10
-                remaining_lines = max(20, remaining_lines - 20)
-            else:
-                # If we can't reduce further, return a minimal version
-                return "\n".join(
-                    lines[:10] +
-                    [f"\n... truncated {len(lines) - 20} lines ...\n"] +
-                    lines[-10:])
+        counter = token_counter or get_token_counter()
+        return OutlineTruncator(counter.count).truncate(content, max_tokens,
+                                                         query)
 
     def is_large_file(self, file_path: str) -> bool:
         """Check if a file is considered large based on LARGE_FILE_THRESHOLD"""
         try:
-            return os.path.getsize(file_path) > self.LARGE_FILE_THRESHOLD
+            return self.stats.stat(file_path).st_size > self.LARGE_FILE_THRESHOLD
         except OSError:
             return False
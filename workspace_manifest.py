@@ -0,0 +1,169 @@
+"""Per-workspace manifests with summary stats for the workspace history."""
+
+# pylama:ignore=E501
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class WorkspaceManifest:
+    """Summary of one workspace, persisted so listing it needs no walk."""
+
+    workspace_id: str
+    file_count: int = 0
+    total_size: int = 0
+    last_activity: float = 0.0  # Newest change seen, in epoch seconds
+    is_imported: bool = False
+    root_mtime_ns: int = 0  # Workspace root mtime when last computed
+    updated_at: float = 0.0
+
+
+class ManifestStore:
+    """Manifests of all workspaces, kept in one metadata directory.
+
+    Manifests are updated from the in-memory tree model whenever it sees a
+    change. Listing reads them in parallel; a manifest whose workspace root
+    changed since it was written, or that has not been verified within
+    MAX_AGE, is still returned but recomputed in the background.
+    """
+
+    MAX_AGE = 3600  # Seconds before an unchanged manifest is re-verified
+    MANIFEST_SUFFIX = ".json"
+
+    def __init__(self,
+                 manifest_dir: str,
+                 compute: Callable[[str], Tuple[int, int, float]],
+                 max_workers: int = 2):
+        """
+        Args:
+            manifest_dir: Directory holding one manifest file per workspace
+            compute: Returns (file_count, total_size, last_activity) for a
+                workspace path by scanning it
+            max_workers: Background recomputations running at once
+        """
+        self.manifest_dir = manifest_dir
+        self.compute = compute
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=8)
+        self._workers = ThreadPoolExecutor(max_workers=max_workers)
+        os.makedirs(manifest_dir, exist_ok=True)
+
+    def _path(self, workspace_id: str) -> str:
+        return os.path.join(self.manifest_dir,
+                            workspace_id + self.MANIFEST_SUFFIX)
+
+    def load(self, workspace_id: str) -> Optional[WorkspaceManifest]:
+        try:
+            with open(self._path(workspace_id), "r", encoding="utf-8") as f:
+                return WorkspaceManifest(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, manifest: WorkspaceManifest) -> None:
+        """Write a manifest atomically"""
+        path = self._path(manifest.workspace_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(asdict(manifest), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write manifest for {manifest.workspace_id}: {e}")
+
+    def remove(self, workspace_id: str) -> None:
+        """Delete a manifest; a recomputation in flight will not rewrite it"""
+        with self._lock:
+            self._pending = {
+                path for path in self._pending
+                if os.path.basename(path) != workspace_id
+            }
+        try:
+            os.remove(self._path(workspace_id))
+        except OSError:
+            pass
+
+    def update(self,
+               workspace_path: str,
+               file_count: int,
+               total_size: int,
+               last_activity: Optional[float] = None) -> WorkspaceManifest:
+        """Record fresh stats for a workspace, e.g. from its tree model.
+
+        Nothing is written once the workspace directory is gone.
+        """
+        workspace_id = os.path.basename(workspace_path)
+        try:
+            root_mtime_ns = os.stat(workspace_path).st_mtime_ns
+            workspace_exists = True
+        except OSError:
+            root_mtime_ns = 0
+            workspace_exists = False
+        if last_activity is None:
+            previous = self.load(workspace_id)
+            last_activity = previous.last_activity if previous else 0.0
+        manifest = WorkspaceManifest(
+            workspace_id=workspace_id,
+            file_count=file_count,
+            total_size=total_size,
+            last_activity=last_activity,
+            is_imported=os.path.exists(
+                os.path.join(workspace_path, ".imported")),
+            root_mtime_ns=root_mtime_ns,
+            updated_at=time.time(),
+        )
+        if workspace_exists:
+            self.save(manifest)
+        return manifest
+
+    def is_stale(self, manifest: WorkspaceManifest,
+                 workspace_path: str) -> bool:
+        if time.time() - manifest.updated_at > self.MAX_AGE:
+            return True
+        try:
+            return os.stat(workspace_path).st_mtime_ns != manifest.root_mtime_ns
+        except OSError:
+            return True
+
+    def _recompute(self, workspace_path: str) -> None:
+        try:
+            file_count, total_size, last_activity = self.compute(
+                workspace_path)
+            with self._lock:
+                # Dropped by remove() while computing
+                cancelled = workspace_path not in self._pending
+            if not cancelled:
+                self.update(workspace_path, file_count, total_size,
+                            last_activity)
+        except Exception as e:
+            print(f"Failed to compute manifest for {workspace_path}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(workspace_path)
+
+    def refresh_async(self, workspace_path: str) -> None:
+        """Recompute a workspace's manifest in the background, once at a time"""
+        with self._lock:
+            if workspace_path in self._pending:
+                return
+            self._pending.add(workspace_path)
+        self._workers.submit(self._recompute, workspace_path)
+
+    def _read(self, workspace_path: str) -> Optional[WorkspaceManifest]:
+        manifest = self.load(os.path.basename(workspace_path))
+        if manifest is None or self.is_stale(manifest, workspace_path):
+            self.refresh_async(workspace_path)
+        return manifest
+
+    def get_many(
+            self, workspace_paths: List[str]
+    ) -> Dict[str, Optional[WorkspaceManifest]]:
+        """Read manifests in parallel; missing ones are None until computed"""
+        return dict(
+            zip(workspace_paths, self._readers.map(self._read,
+                                                   workspace_paths)))
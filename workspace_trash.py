@@ -0,0 +1,148 @@
+"""Non-blocking deletion: move trees into a trash area and reap them slowly."""
+
+# pylama:ignore=E501
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+# Called with (name, removed_entries, expected_entries, done)
+ProgressCallback = Callable[[str, int, Optional[int], bool], None]
+
+
+class TrashReaper:
+    """Delete directory trees in the background at a bounded rate.
+
+    trash() renames a tree into the trash directory, which is atomic and
+    instant on the same filesystem, so callers can respond right away. A
+    single reaper thread then removes the trashed trees entry by entry,
+    pausing between batches to stay under MAX_REMOVALS_PER_SECOND, so large
+    deletions (node_modules, build output) do not starve other I/O or the
+    event loop. Trees left in the trash by a previous run are reaped on
+    start.
+    """
+
+    BATCH_SIZE = 200  # Entries removed between pauses
+    MAX_REMOVALS_PER_SECOND = 5000
+
+    def __init__(self,
+                 trash_dir: str,
+                 on_progress: Optional[ProgressCallback] = None):
+        self.trash_dir = trash_dir
+        self.on_progress = on_progress
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        os.makedirs(trash_dir, exist_ok=True)
+
+    def _ensure_thread(self) -> bool:
+        """Start the reaper thread if needed; returns True if it was started"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run,
+                                            name="trash-reaper",
+                                            daemon=True)
+            self._thread.start()
+            return True
+
+    def start(self) -> None:
+        """Start the reaper thread and queue leftovers from earlier runs"""
+        if not self._ensure_thread():
+            return
+        try:
+            for name in os.listdir(self.trash_dir):
+                self._queue.put((name, None))
+        except OSError:
+            pass
+
+    def trash(self, path: str, expected_entries: Optional[int] = None) -> str:
+        """Move a tree into the trash and queue it for removal.
+
+        Args:
+            path: Directory to delete; must be on the trash's filesystem
+            expected_entries: Optional entry count, used for progress
+
+        Returns:
+            The tree's name inside the trash directory.
+        """
+        name = f"{os.path.basename(path.rstrip(os.sep))}.{time.time_ns()}"
+        os.rename(path, os.path.join(self.trash_dir, name))
+        self._ensure_thread()
+        self._queue.put((name, expected_entries))
+        return name
+
+    def _report(self, name: str, removed: int, expected: Optional[int],
+                done: bool) -> None:
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(name, removed, expected, done)
+        except Exception as e:
+            print(f"Trash progress callback failed for {name}: {e}")
+
+    def _run(self) -> None:
+        while True:
+            name, expected = self._queue.get()
+            try:
+                self._reap(name, expected)
+            except Exception as e:
+                print(f"Failed to reap {name}: {e}")
+
+    def _reap(self, name: str, expected: Optional[int]) -> None:
+        root = os.path.join(self.trash_dir, name)
+        min_batch_seconds = self.BATCH_SIZE / self.MAX_REMOVALS_PER_SECOND
+        removed = 0
+        batch_started = time.monotonic()
+
+        def removed_one():
+            nonlocal removed, batch_started
+            removed += 1
+            if removed % self.BATCH_SIZE == 0:
+                # Throttle, and give other threads (or greenlets) a turn
+                elapsed = time.monotonic() - batch_started
+                time.sleep(max(0.0, min_batch_seconds - elapsed))
+                batch_started = time.monotonic()
+                self._report(name, removed, expected, False)
+
+        def unlink(path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            removed_one()
+
+        if not os.path.isdir(root) or os.path.islink(root):
+            unlink(root)
+            self._report(name, removed, expected, True)
+            return
+
+        # Post-order walk: a directory is removed once its entries are gone
+        stack = [(root, False)]
+        while stack:
+            path, emptied = stack.pop()
+            if emptied:
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+                removed_one()
+                continue
+            stack.append((path, True))
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    stack.append((entry.path, False))
+                else:
+                    unlink(entry.path)
+
+        self._report(name, removed, expected, True)
@@ -0,0 +1,552 @@
+"""In-memory, incrementally refreshed model of a workspace's file tree."""
+
+# pylama:ignore=E501,C901
+import base64
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ignore_rules import IgnoreMatcher
+
+
+# Sort key of a listing entry: directories first, then by name
+SortKey = Tuple[int, str, str]
+
+
+def encode_cursor(key: SortKey) -> str:
+    """Encode the sort key of the last returned entry as an opaque cursor"""
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Decode a cursor from encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        is_file, lower, name = json.loads(raw.decode("utf-8"))
+        return (int(is_file), str(lower), str(name))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class DirNode:
+    """One directory: its visible children plus aggregate counts."""
+
+    __slots__ = ("rel_path", "mtime_ns", "ignore_mtime_ns", "checked",
+                 "dirs", "files", "file_count", "total_size", "_sorted_keys")
+
+    def __init__(self, rel_path: str):
+        self.rel_path = rel_path
+        self.mtime_ns = 0
+        self.ignore_mtime_ns = 0  # Of the directory's own .gitignore, 0 if none
+        self.checked = 0.0  # time.monotonic() of the last mtime check
+        self.dirs: Dict[str, "DirNode"] = {}
+        self.files: Dict[str, int] = {}  # name -> size in bytes
+        self.file_count = 0  # Recursive
+        self.total_size = 0  # Recursive
+        self._sorted_keys: Optional[List[SortKey]] = None
+
+    @property
+    def has_children(self) -> bool:
+        return bool(self.dirs or self.files)
+
+    @property
+    def sorted_keys(self) -> List[SortKey]:
+        """Sorted listing keys, cached until the directory is rescanned"""
+        if self._sorted_keys is None:
+            keys = [(0, name.lower(), name) for name in self.dirs]
+            keys.extend((1, name.lower(), name) for name in self.files)
+            keys.sort()
+            self._sorted_keys = keys
+        return self._sorted_keys
+
+    def child_path(self, name: str) -> str:
+        return f"{self.rel_path}/{name}" if self.rel_path else name
+
+
+class WorkspaceTree:
+    """File tree of one workspace, kept current per directory.
+
+    The tree is built with a single pruned walk. Afterwards each directory
+    is rescanned only when its own mtime changes (adding, removing or
+    renaming an entry bumps it) or its .gitignore changes, which rescans
+    the whole subtree. A read re-checks only the directories it returns,
+    each at most once per REFRESH_INTERVAL. Directories reported through
+    mark_dirty are rescanned on the next read, and a sweep re-checks up
+    to SWEEP_BATCH other directories per read, so aggregate counts catch
+    up with outside changes without any read costing O(directories).
+    """
+
+    REFRESH_INTERVAL = 2.0  # Seconds a directory's mtime check is trusted
+    SWEEP_BATCH = 64  # Directories the sweep re-checks per read
+
+    def __init__(self,
+                 root: str,
+                 matcher: IgnoreMatcher,
+                 skip_dir: Optional[Callable[[str], bool]] = None,
+                 skip_file: Optional[Callable[[str], bool]] = None,
+                 on_change: Optional[Callable[[int, int, bool], None]] = None):
+        """
+        Args:
+            root: Workspace directory
+            matcher: Gitignore matcher for the workspace
+            skip_dir: Optional predicate on directory names to leave out
+            skip_file: Optional predicate on file names to leave out
+            on_change: Called with (file_count, total_size, initial) after
+                the tree is built and whenever a refresh changes it
+        """
+        self.root = os.path.abspath(root)
+        self.matcher = matcher
+        self.skip_dir = skip_dir
+        self.skip_file = skip_file
+        self.on_change = on_change
+        self.version = 0
+        self._root_node: Optional[DirNode] = None
+        self._dirty: Set[str] = set()
+        self._sweep: List[DirNode] = []  # Directories left in the current sweep
+        self._sweep_started = 0.0
+        self._changed = False
+        self._lock = threading.RLock()
+
+    # Building and refreshing
+
+    def _scan_dir(self, node: DirNode) -> List[DirNode]:
+        """Rescan one directory's entries; returns newly found subdirectories"""
+        abs_path = os.path.join(self.root, node.rel_path)
+        node.checked = time.monotonic()
+        try:
+            node.mtime_ns = os.stat(abs_path).st_mtime_ns
+        except OSError:
+            return []
+        node.ignore_mtime_ns = self._ignore_mtime(abs_path)
+
+        chain = self.matcher.chain_for(node.rel_path)
+        old_dirs = node.dirs
+        dirs: Dict[str, DirNode] = {}
+        files: Dict[str, int] = {}
+        new_dirs: List[DirNode] = []
+        try:
+            with os.scandir(abs_path) as it:
+                for entry in it:
+                    rel = node.child_path(entry.name)
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if self.skip_dir and self.skip_dir(entry.name):
+                            continue
+                        if self.matcher.match_chain(chain, rel, True):
+                            continue
+                        child = old_dirs.get(entry.name)
+                        if child is None:
+                            child = DirNode(rel)
+                            new_dirs.append(child)
+                        dirs[entry.name] = child
+                    else:
+                        if self.skip_file and self.skip_file(entry.name):
+                            continue
+                        if self.matcher.match_chain(chain, rel, False):
+                            continue
+                        try:
+                            files[entry.name] = entry.stat().st_size
+                        except OSError:
+                            files[entry.name] = 0
+        except OSError:
+            return []
+
+        node.dirs = dirs
+        node.files = files
+        node._sorted_keys = None
+        return new_dirs
+
+    def _build(self, node: DirNode, rescan: bool = False) -> None:
+        """Scan a directory and everything below it.
+
+        Only new subdirectories are descended into unless rescan is set.
+        """
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            new_dirs = self._scan_dir(current)
+            stack.extend(current.dirs.values() if rescan else new_dirs)
+
+    @staticmethod
+    def _ignore_mtime(abs_dir: str) -> int:
+        try:
+            return os.stat(os.path.join(abs_dir, ".gitignore")).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _rescan(self, node: DirNode, deep: bool = False) -> None:
+        """Rescan a changed directory, building any new subtrees.
+
+        With deep, every directory below is rescanned as well, since a
+        changed .gitignore can hide or reveal entries anywhere beneath it.
+        Aggregate counts are updated for the node and its ancestors only.
+        """
+        old_count, old_size = node.file_count, node.total_size
+        if deep:
+            self._build(node, rescan=True)
+            self._aggregate(node)
+        else:
+            for child in self._scan_dir(node):
+                self._build(child)
+                self._aggregate(child)
+            self._sum(node)
+        self._add_to_ancestors(node.rel_path, node.file_count - old_count,
+                               node.total_size - old_size)
+        self._changed = True
+
+    @staticmethod
+    def _sum(node: DirNode) -> None:
+        """Recompute one node's recursive counts from its children"""
+        node.file_count = len(node.files) + sum(
+            child.file_count for child in node.dirs.values())
+        node.total_size = sum(node.files.values()) + sum(
+            child.total_size for child in node.dirs.values())
+
+    def _aggregate(self, node: DirNode) -> None:
+        """Recompute recursive counts of a whole subtree bottom-up"""
+        order = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(current.dirs.values())
+        for current in reversed(order):
+            self._sum(current)
+
+    def _add_to_ancestors(self, rel_path: str, count_delta: int,
+                          size_delta: int) -> None:
+        if not rel_path or not (count_delta or size_delta):
+            return
+        ancestor = self._root_node
+        for part in rel_path.split("/"):
+            if ancestor is None:
+                break
+            ancestor.file_count += count_delta
+            ancestor.total_size += size_delta
+            ancestor = ancestor.dirs.get(part)
+
+    def _find(self, rel_dir: str) -> Optional[DirNode]:
+        node = self._root_node
+        rel_dir = rel_dir.replace("\\", "/").strip("/")
+        if rel_dir in ("", "."):
+            return node
+        for part in rel_dir.split("/"):
+            if node is None:
+                return None
+            node = node.dirs.get(part)
+        return node
+
+    def _check(self, node: DirNode, rescan: bool = False,
+               max_age: Optional[float] = None) -> None:
+        """Rescan a directory if it or its .gitignore changed.
+
+        The check is skipped if the directory was checked within max_age
+        seconds (default REFRESH_INTERVAL), unless rescan forces a rescan.
+        """
+        now = time.monotonic()
+        if max_age is None:
+            max_age = self.REFRESH_INTERVAL
+        if not rescan and now - node.checked < max_age:
+            return
+        node.checked = now
+        abs_path = os.path.join(self.root, node.rel_path)
+        try:
+            mtime_ns = os.stat(abs_path).st_mtime_ns
+        except OSError:
+            return  # Gone; the parent's rescan drops it
+        deep = self._ignore_mtime(abs_path) != node.ignore_mtime_ns
+        if rescan or deep or mtime_ns != node.mtime_ns:
+            self._rescan(node, deep)
+
+    def _refresh(self, force: bool = False) -> None:
+        """Build the tree on first use, then apply reported changes.
+
+        Also advances the sweep, or with force re-checks every directory.
+        Callers then check the directories they read and call _publish.
+        """
+        now = time.monotonic()
+        if self._root_node is None:
+            self._root_node = DirNode("")
+            self._build(self._root_node)
+            self._aggregate(self._root_node)
+            self._dirty.clear()
+            self._sweep_started = now
+            self.version += 1
+            self._notify_change(initial=True)
+            return
+
+        for rel_dir in sorted(self._dirty):
+            node = self._find(rel_dir)
+            if node is not None:
+                self._check(node, rescan=True)
+        self._dirty.clear()
+
+        if force:
+            stack = [self._root_node]
+            while stack:
+                node = stack.pop()
+                self._check(node, max_age=0)
+                stack.extend(node.dirs.values())
+            self._sweep = []
+            self._sweep_started = now
+            return
+
+        if not self._sweep and now - self._sweep_started >= self.REFRESH_INTERVAL:
+            self._sweep = [self._root_node]
+            self._sweep_started = now
+        budget = self.SWEEP_BATCH
+        while self._sweep and budget:
+            node = self._sweep.pop()
+            if self._find(node.rel_path) is not node:
+                continue  # Removed since the sweep reached its parent
+            budget -= 1
+            self._check(node)
+            self._sweep.extend(node.dirs.values())
+
+    def _publish(self) -> None:
+        """Bump the version and notify if anything changed since last time"""
+        if self._changed:
+            self._changed = False
+            self.version += 1
+            self._notify_change(initial=False)
+
+    def _notify_change(self, initial: bool) -> None:
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(self._root_node.file_count,
+                           self._root_node.total_size, initial)
+        except Exception as e:
+            print(f"Tree change callback failed for {self.root}: {e}")
+
+    def refresh(self, force: bool = False) -> int:
+        """Bring the tree up to date; returns the tree version"""
+        with self._lock:
+            self._refresh(force)
+            self._check(self._root_node)
+            self._publish()
+            return self.version
+
+    def mark_dirty(self, rel_path: str) -> None:
+        """Report a changed path so its directory is rescanned on next read.
+
+        Every ancestor is marked too, since new directories may have been
+        created along the way.
+        """
+        rel_path = rel_path.replace("\\", "/").strip("/")
+        with self._lock:
+            parent = os.path.dirname(rel_path)
+            while True:
+                self._dirty.add(parent)
+                if not parent:
+                    break
+                parent = os.path.dirname(parent)
+
+    # Queries
+
+    def node(self, rel_dir: str = "") -> Optional[DirNode]:
+        """Get the up-to-date node for a directory, or None if not visible"""
+        with self._lock:
+            self._refresh()
+            node = self._root_node
+            self._check(node)
+            rel_dir = rel_dir.replace("\\", "/").strip("/")
+            if rel_dir not in ("", "."):
+                # Ancestors too, in case the path was renamed or removed
+                for part in rel_dir.split("/"):
+                    node = node.dirs.get(part)
+                    if node is None:
+                        break
+                    self._check(node)
+            self._publish()
+            return node
+
+    def file_count(self, rel_dir: str = "") -> int:
+        node = self.node(rel_dir)
+        return node.file_count if node else 0
+
+    def listing(self, rel_dir: str = "") -> List[dict]:
+        """Entries of one directory, directories first, then by name"""
+        node = self.node(rel_dir)
+        if node is None:
+            return []
+        with self._lock:
+            return self._listing(node)
+
+    @staticmethod
+    def _entry(node: DirNode, key: SortKey) -> dict:
+        is_file, _, name = key
+        if is_file:
+            return {"type": "file", "path": name, "size": node.files[name]}
+        return {
+            "type": "directory",
+            "path": name,
+            "has_children": node.dirs[name].has_children,
+        }
+
+    @classmethod
+    def _listing(cls, node: DirNode) -> List[dict]:
+        return [cls._entry(node, key) for key in node.sorted_keys]
+
+    def page(self,
+             rel_dir: str = "",
+             limit: int = 100,
+             cursor: Optional[str] = None,
+             offset: int = 0) -> Tuple[List[dict], Optional[str], int]:
+        """One page of a directory listing.
+
+        Resumes after the entry encoded in cursor when given (a binary
+        search in the cached sorted listing), otherwise starts at offset.
+        Entries are built only for the returned page. Because cursors hold
+        a sort key rather than a position, paging stays consistent when
+        entries are added or removed in between requests.
+
+        Returns:
+            (items, next_cursor, total_items); next_cursor is None on the
+            last page.
+        """
+        node = self.node(rel_dir)
+        if node is None:
+            return [], None, 0
+        with self._lock:
+            keys = node.sorted_keys
+            start = (bisect.bisect_right(keys, decode_cursor(cursor))
+                     if cursor else max(0, offset))
+            page_keys = keys[start:start + max(1, limit)]
+            items = [self._entry(node, key) for key in page_keys]
+            has_more = start + len(page_keys) < len(keys)
+            next_cursor = (encode_cursor(page_keys[-1])
+                           if has_more and page_keys else None)
+            return items, next_cursor, len(keys)
+
+    def window(self, expanded: Iterable[str], offset: int,
+               limit: int) -> Tuple[List[dict], int]:
+        """Rows of the flattened tree that fall inside a viewport.
+
+        The tree is flattened as the explorer shows it: each directory's
+        listing, with the listing of every expanded directory inlined after
+        its row. Row counts are summed over expanded directories only, and
+        runs of rows above the window are skipped by count, so the cost is
+        bounded by the expanded set plus the window size, not the tree.
+
+        Returns:
+            (rows, total_rows); each row has path, name, depth, type and
+            size or has_children/expanded.
+        """
+        with self._lock:
+            self._refresh()
+            # Expanded directories grouped by parent; only those reachable
+            # through expanded ancestors are visible
+            # Normalized and deduplicated, so each directory counts once
+            children_of: Dict[str, Set[str]] = {}
+            for path in expanded:
+                path = "/".join(part for part in path.replace("\\", "/").split("/")
+                                if part not in ("", "."))
+                if path:
+                    head, _, name = path.rpartition("/")
+                    children_of.setdefault(head, set()).add(name)
+
+            counts: Dict[str, int] = {}
+            self._count_rows(self._root_node, children_of, counts)
+            self._publish()
+            rows: List[dict] = []
+            if limit > 0:
+                self._emit_rows(self._root_node, 0, max(0, offset), limit,
+                                rows, children_of, counts)
+            return rows, counts[""]
+
+    @staticmethod
+    def _expanded_children(node: DirNode, children_of: Dict[str, Set[str]]
+                           ) -> List[Tuple[int, DirNode]]:
+        """Expanded subdirectories of node with their listing positions"""
+        keys = node.sorted_keys
+        found = []
+        for name in children_of.get(node.rel_path, ()):
+            child = node.dirs.get(name)
+            if child is not None:
+                found.append((bisect.bisect_left(keys, (0, name.lower(), name)),
+                              child))
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def _count_rows(self, node: DirNode, children_of: Dict[str, Set[str]],
+                    counts: Dict[str, int]) -> int:
+        self._check(node)
+        total = len(node.sorted_keys)
+        for _, child in self._expanded_children(node, children_of):
+            total += self._count_rows(child, children_of, counts)
+        counts[node.rel_path] = total
+        return total
+
+    def _emit_rows(self, node: DirNode, depth: int, skip: int, limit: int,
+                   rows: List[dict], children_of: Dict[str, Set[str]],
+                   counts: Dict[str, int]) -> int:
+        """Append up to limit rows after skipping skip; returns the skip left"""
+        keys = node.sorted_keys
+        pos = 0
+        for child_pos, child in self._expanded_children(node, children_of) + [
+                (len(keys), None)
+        ]:
+            # Plain rows before the next expanded directory (or the end),
+            # plus that directory's own row
+            end = child_pos + 1 if child is not None else child_pos
+            if skip >= end - pos:
+                skip -= end - pos
+            else:
+                for key in keys[pos + skip:end][:limit - len(rows)]:
+                    rows.append(self._row(node, key, depth, children_of))
+                skip = 0
+                if len(rows) >= limit:
+                    return 0
+            if child is None:
+                break
+            pos = end
+
+            # The expanded directory's subtree
+            if skip >= counts[child.rel_path]:
+                skip -= counts[child.rel_path]
+            else:
+                skip = self._emit_rows(child, depth + 1, skip, limit, rows,
+                                       children_of, counts)
+                if len(rows) >= limit:
+                    return 0
+        return skip
+
+    def _row(self, node: DirNode, key: SortKey, depth: int,
+             children_of: Dict[str, Set[str]]) -> dict:
+        row = self._entry(node, key)
+        row["name"] = row["path"]
+        row["path"] = node.child_path(row["name"])
+        row["depth"] = depth
+        if row["type"] == "directory":
+            row["expanded"] = row["name"] in children_of.get(node.rel_path, ())
+        return row
+
+    def structure(self, rel_dir: str = "", depth: float = 1) -> List[dict]:
+        """Nested structure in the format of get_directory_structure"""
+        node = self.node(rel_dir)
+        if node is None:
+            return []
+        with self._lock:
+            structure = self._structure(node, depth)
+            self._publish()
+            return structure
+
+    def _structure(self, node: DirNode, depth: float) -> List[dict]:
+        self._check(node)
+        items = self._listing(node)
+        if depth <= 0:
+            return [item for item in items if item["type"] == "file"]
+        for item in items:
+            if item["type"] == "directory":
+                child = node.dirs[item["path"]]
+                item["children"] = (self._structure(child, depth - 1)
+                                    if depth > 1 else [])
+        return items